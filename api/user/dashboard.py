@@ -4,7 +4,7 @@ import sys
 import jwt
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from utils.database import json_response, error_response, get_db_connection, get_user_by_email
+from utils.database import json_response, error_response, db_session, get_user_by_email
 
 def get_user_from_token(event):
     """Extract user from JWT token"""
@@ -27,14 +27,12 @@ def handler(event, context):
         if event.get('httpMethod') == 'OPTIONS':
             return json_response({})
         
-        user = get_user_from_token(event)
-        if not user:
-            return error_response('Unauthorized', 401)
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        try:
+        # Token lookup and dashboard queries share one connection and cursor
+        with db_session() as cursor:
+            user = get_user_from_token(event)
+            if not user:
+                return error_response('Unauthorized', 401)
+            
             # Get referral stats
             cursor.execute("""
                 SELECT 
@@ -74,10 +72,6 @@ def handler(event, context):
                 },
                 'recent_referrals': [dict(r) for r in recent_referrals]
             })
-            
-        finally:
-            cursor.close()
-            conn.close()
         
     except Exception as e:
         return error_response(f'Error getting dashboard: {str(e)}', 500)
\ No newline at end of file
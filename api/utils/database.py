@@ -1,16 +1,100 @@
 import os
+import threading
+import time
+from contextlib import contextmanager
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import json
 from datetime import datetime, timedelta
 
-def get_db_connection():
-    """Get database connection using Supabase connection string"""
+# One connection per warm function instance, reused across invocations.
+# Instances serve one request at a time; the lock only matters for a
+# threaded local dev server.
+_lock = threading.RLock()
+_conn = None
+_last_used = 0.0
+_scope = threading.local()  # cursor and nesting depth of the current db_session()
+
+# Idle connections may have been dropped by the pooler/proxy while the
+# instance was frozen; check them with SELECT 1 before reuse
+PING_AFTER_SECONDS = float(os.environ.get('DB_PING_AFTER_SECONDS', '30'))
+
+def _connect():
     database_url = os.environ.get('DATABASE_URL')
     if not database_url:
         raise Exception("DATABASE_URL environment variable not set")
-    
-    return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    return psycopg2.connect(database_url, cursor_factory=RealDictCursor, connect_timeout=10,
+                            keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3)
+
+def _healthy(conn):
+    if conn is None or conn.closed:
+        return False
+    if time.monotonic() - _last_used < PING_AFTER_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def reset_connection():
+    """Close the shared connection; the next use reconnects."""
+    global _conn
+    with _lock:
+        if _conn is not None:
+            try:
+                _conn.close()
+            except Exception:
+                pass
+        _conn = None
+
+def get_db_connection():
+    """Get the shared database connection (Supabase connection string),
+    reconnecting if it went stale. Do not close it; use db_session()."""
+    global _conn
+    with _lock:
+        # Inside a db_session() the connection is mid-transaction: no ping
+        if getattr(_scope, 'depth', 0) == 0 and not _healthy(_conn):
+            reset_connection()
+            _conn = _connect()
+        return _conn
+
+@contextmanager
+def db_session():
+    """Cursor for one unit of work on the shared connection.
+    Nested uses (helpers called from a handler) share the outer cursor and
+    transaction; the outermost scope commits on success, rolls back on error."""
+    global _last_used
+    if getattr(_scope, 'depth', 0):
+        _scope.depth += 1
+        try:
+            yield _scope.cursor
+        finally:
+            _scope.depth -= 1
+        return
+
+    with _lock:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        _scope.cursor, _scope.depth = cursor, 1
+        try:
+            yield cursor
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                reset_connection()
+            raise
+        finally:
+            _scope.cursor, _scope.depth = None, 0
+            try:
+                cursor.close()
+            except psycopg2.Error:
+                reset_connection()
+            _last_used = time.monotonic()
 
 def json_response(data, status_code=200):
     """Helper to create JSON response for Vercel functions"""
@@ -32,26 +116,17 @@ def error_response(message, status_code=400):
 
 def get_user_by_email(email):
     """Get user by email address"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
+    with db_session() as cursor:
         cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
         user = cursor.fetchone()
         return dict(user) if user else None
-    finally:
-        cursor.close()
-        conn.close()
 
 def create_user(email, is_admin=False):
     """Create new user with unique referral code"""
     import random
     import string
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
+    with db_session() as cursor:
         # Generate unique referral code
         while True:
             referral_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
@@ -65,19 +140,11 @@ def create_user(email, is_admin=False):
             RETURNING *
         """, (email, referral_code, is_admin))
         
-        user = cursor.fetchone()
-        conn.commit()
-        return dict(user)
-    finally:
-        cursor.close()
-        conn.close()
+        return dict(cursor.fetchone())
 
 def store_otp_token(email, token):
     """Store OTP token with expiration"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
+    with db_session() as cursor:
         # Delete old tokens for this email
         cursor.execute("DELETE FROM otp_tokens WHERE email = %s", (email,))
         
@@ -87,18 +154,11 @@ def store_otp_token(email, token):
             INSERT INTO otp_tokens (email, token, expires_at)
             VALUES (%s, %s, %s)
         """, (email, token, expires_at))
-        
-        conn.commit()
-    finally:
-        cursor.close()
-        conn.close()
 
 def verify_otp_token(email, token):
     """Verify OTP token and return user if valid"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
+    # Token delete and user creation commit together
+    with db_session() as cursor:
         cursor.execute("""
             SELECT * FROM otp_tokens 
             WHERE email = %s AND token = %s AND expires_at > NOW()
@@ -110,7 +170,6 @@ def verify_otp_token(email, token):
         
         # Delete used token
         cursor.execute("DELETE FROM otp_tokens WHERE email = %s", (email,))
-        conn.commit()
         
         # Get or create user
         user = get_user_by_email(email)
@@ -118,6 +177,47 @@ def verify_otp_token(email, token):
             user = create_user(email)
         
         return user
-    finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
+
+def _sample_invocation(email, per_helper_connections=False):
+    """User lookup + one dashboard query, as api/user/dashboard.py does."""
+    if per_helper_connections:
+        reset_connection()
+        user = get_user_by_email(email)
+        reset_connection()
+        with db_session() as cursor:
+            cursor.execute("SELECT COUNT(*) AS n FROM referrals WHERE referrer_id = %s", (user['id'] if user else 0,))
+            cursor.fetchone()
+        return
+    with db_session() as cursor:
+        user = get_user_by_email(email)
+        cursor.execute("SELECT COUNT(*) AS n FROM referrals WHERE referrer_id = %s", (user['id'] if user else 0,))
+        cursor.fetchone()
+
+def benchmark(email, rounds=20):
+    """Invocation latency (ms): connect-per-helper vs cold (new connection) vs warm (reused)."""
+    def timed(setup, **kwargs):
+        timings = []
+        for _ in range(rounds):
+            setup()
+            started = time.perf_counter()
+            _sample_invocation(email, **kwargs)
+            timings.append((time.perf_counter() - started) * 1000.0)
+        timings.sort()
+        return {'p50': round(timings[len(timings) // 2], 1), 'avg': round(sum(timings) / rounds, 1),
+                'max': round(timings[-1], 1)}
+
+    results = {
+        'per-helper connections (before)': timed(lambda: None, per_helper_connections=True),
+        'cold (new connection)': timed(reset_connection),
+    }
+    _sample_invocation(email)
+    results['warm (reused connection)'] = timed(lambda: None)
+    return results
+
+if __name__ == '__main__':
+    # DATABASE_URL=... python api/utils/database.py [email]
+    import sys
+    target = sys.argv[1] if len(sys.argv) > 1 else 'benchmark@example.com'
+    print(f"⏱️  Invocation latency for {target} (20 rounds each)")
+    for name, r in benchmark(target).items():
+        print(f"  {name:<34} p50 {r['p50']:>7} ms   avg {r['avg']:>7} ms   max {r['max']:>7} ms")
@@ -9,4 +9,8 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
 from backend.app import app
 
 if __name__ == "__main__":
+    # Importing the app does no DDL; apply pending migrations before serving
+    if os.getenv('MIGRATE_ON_START', '1') != '0':
+        from migrate import run as run_migrations
+        run_migrations(app.config['SQLALCHEMY_DATABASE_URI'])
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 10000)))
\ No newline at end of file
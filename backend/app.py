@@ -1,17 +1,15 @@
-from flask import Flask, request, jsonify, session, make_response, redirect, Response, stream_with_context
+from flask import Flask, request, jsonify, session, make_response, redirect, Response, stream_with_context, send_file, url_for
 from flask_cors import CORS
 import re
 import json
-from queue import Queue
+import time
+from queue import Empty
 from dotenv import load_dotenv
 import os
 from datetime import datetime, timedelta
 import logging
 import sys
 import uuid
-import base64
-from io import BytesIO
-from werkzeug.security import generate_password_hash, check_password_hash
 try:
     from email_validator import validate_email, EmailNotValidError
 except ImportError:
@@ -25,33 +23,56 @@ except ImportError:
         pass
 import csv
 from io import StringIO
-from sqlalchemy import inspect, text
 from flask_socketio import SocketIO, emit, join_room
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from limiter_storage import default_storage_uri  # registers the sqlite:// limiter storage
 
 # Import our models and services
 from models import db, User, Referral, OTPToken, ReferralClick, QREvent, OnboardingToken
 from email_service_resend import email_service
+from compression import init_response_middleware, register_cache_policy, exclude_endpoint
+from principal import get_current_principal, remember_principal
+from email_dispatcher import create_dispatcher, EmailQueueFull
+from maintenance import create_scheduler
+from otp_store import create_otp_store
+from password_hashing import create_hasher, HashingBusy
+from request_logging import configure_logging, init_request_logging, request_db_stats
+from query_detector import init_query_detector
+from request_profiler import create_profiler
+from slow_query_log import create_slow_query_log
+from sse_pubsub import create_sse_bus
+from qr_render import create_qr_renderer
+from metrics import create_registry, init_metrics, instrument_email, metrics_access_allowed, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from origin_policy import OriginPolicy
+from db_engine import configure_database, install_engine_hooks, instrument_pool
+from read_replica import create_replica_router, instrument_replica
 
 # Load environment variables
 load_dotenv()
 
-# Configure comprehensive logging for Railway
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s',
-    stream=sys.stdout,
-    force=True
-)
+# Outbound email goes through a bounded background queue so Resend latency
+# never holds a request worker
+email_dispatcher = create_dispatcher(email_service)
+# Password hashing runs on a bounded process pool (fast 503 when saturated)
+password_hasher = create_hasher()
+# QR images are rendered on a small thread pool with an LRU cache
+qr_renderer = create_qr_renderer()
+
+# Logging for Railway: records are written to stdout by a background listener
+# thread; each request adds one sampled JSON summary (see request_logging.py)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Create Flask app
 app = Flask(__name__)
 PRODUCTION = os.getenv('FLASK_ENV') == 'production'
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dental-referral-secret-key')
-# Use DATABASE_URL from environment or fallback to SQLite
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///database.db')
+# Use DATABASE_URL from environment or fallback to SQLite; pool settings per
+# DB_PROFILE (direct Postgres, PgBouncer or SQLite WAL, see db_engine.py)
+db_profile = configure_database(app, os.getenv('DATABASE_URL', 'sqlite:///database.db'))
+# Optional DATABASE_REPLICA_URL for read-only admin endpoints (see read_replica.py)
+replica_router = create_replica_router(app)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Mobile-compatible session configuration
@@ -83,7 +104,58 @@ else:
 
 # Initialize extensions
 db.init_app(app)
-limiter = Limiter(get_remote_address, app=app, default_limits=None)
+with app.app_context():
+    install_engine_hooks(db.engine, db_profile)
+    if replica_router is not None:
+        install_engine_hooks(db.engines['replica'], replica_router.profile)
+# Per-request JSON summary (registered first so it times the whole request)
+init_request_logging(app)
+# Prometheus metrics, aggregated across workers and served on /metrics
+metrics_registry = create_registry()
+if metrics_registry is not None:
+    init_metrics(app, metrics_registry, db_stats=request_db_stats)
+    instrument_email(metrics_registry, email_dispatcher)
+    instrument_pool(metrics_registry)
+    if replica_router is not None:
+        instrument_replica(metrics_registry, replica_router)
+# Dev/test: flag statements repeated in a loop within one request (NPLUSONE_MODE)
+init_query_detector(app)
+# Statements over SLOW_QUERY_MS, with EXPLAIN plans (GET /admin/slow-queries)
+slow_query_log = create_slow_query_log()
+# Opt-in cProfile of single requests (PROFILE_ENABLED; admin header or sampling)
+request_profiler = create_profiler(app)
+if request_profiler is not None:
+    request_profiler.init_app(app, is_admin=lambda: bool(getattr(get_current_principal(), 'is_admin', False)))
+if replica_router is not None:
+    replica_router.read_only('admin_list_users', 'admin_search_users', 'admin_qr_generations',
+                             'get_all_referrals', 'get_admin_stats', 'export_referrals', 'export_patients')
+    replica_router.init_app(app, db, is_admin=lambda: bool(getattr(get_current_principal(), 'is_admin', False)))
+# Counters shared by all workers on this host (sqlite:// on /dev/shm); redis:// for multi-host
+limiter = Limiter(
+    get_remote_address,
+    app=app,
+    default_limits=None,
+    storage_uri=os.getenv('RATELIMIT_STORAGE_URI', default_storage_uri()),
+)
+otp_store = create_otp_store(app)
+
+# Response compression + per-endpoint Cache-Control (registered first so it runs last)
+init_response_middleware(app)
+exclude_endpoint('qr_stream')
+for _endpoint in ('admin_list_users', 'admin_search_users', 'admin_qr_generations',
+                  'get_all_referrals', 'get_admin_stats', 'get_dashboard',
+                  'get_user_referrals', 'get_current_user_info', 'admin_slow_queries'):
+    register_cache_policy(_endpoint, 'private, no-cache')
+# Exports contain PHI; pages below record clicks / consume tokens so must always hit us
+for _endpoint in ('export_referrals', 'export_patients', 'track_referral_click', 'referral_welcome',
+                  'admin_download_profile'):
+    register_cache_policy(_endpoint, 'private, no-store')
+register_cache_policy('qr_events', 'no-cache')
+# The image encodes a live magic-link login: browser-only, and no longer than
+# the onboarding token's 120 s lifetime
+register_cache_policy('qr_image', 'private, max-age=120')
+register_cache_policy('health_check', 'no-cache')
+register_cache_policy('metrics_endpoint', 'no-store')
 
 
 # Log session interface being used
@@ -132,21 +204,24 @@ extra_allowed = [o.strip() for o in os.getenv('ALLOWED_ORIGINS', '').split(',')
 ALLOWED_ORIGINS = default_allowed_origins + extra_allowed
 logger.info(f"ALLOWED_ORIGINS: {ALLOWED_ORIGINS}")
 
-def is_allowed_origin(origin: str) -> bool:
-    if not origin:
-        return False
-    # Direct match first
-    if origin in ALLOWED_ORIGINS:
-        return True
-    # Allow some common Vercel preview patterns
-    vercel_patterns = [
+# Exact origins plus common Vercel preview patterns, compiled once
+origin_policy = OriginPolicy(
+    ALLOWED_ORIGINS,
+    patterns=[
         r'^https://referral-duluth-frontend2.*\.vercel\.app$',
         r'^https://.*-benashifrins-projects\.vercel\.app$',
-    ]
-    for pattern in vercel_patterns:
-        if re.match(pattern, origin):
-            return True
-    return False
+    ],
+)
+
+def is_allowed_origin(origin: str) -> bool:
+    return origin_policy.allows(origin)
+
+def _request_origin_allowed() -> bool:
+    """Origin decision for the current request, computed once and reused by all hooks."""
+    allowed = getattr(request, 'origin_allowed', None)
+    if allowed is None:
+        allowed = request.origin_allowed = origin_policy.allows(request.headers.get('Origin'))
+    return allowed
 
 def _compute_allowed_origins():
     if PRODUCTION:
@@ -170,15 +245,19 @@ CORS(
     methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS']
 )
 
-# Initialize Socket.IO (threading fallback works under sync Gunicorn; for websockets use eventlet/gevent)
-socketio = SocketIO(cors_allowed_origins=EFFECTIVE_ALLOWED_ORIGINS or '*', async_mode='threading')
+# Initialize Socket.IO. async_mode follows the gunicorn WORKER_MODE (threading
+# under sync workers; gevent/eventlet for cooperative workers). With
+# SOCKETIO_MESSAGE_QUEUE (e.g. redis://) emits reach clients on every worker.
+SOCKETIO_ASYNC_MODE = {'gevent': 'gevent', 'eventlet': 'eventlet'}.get(os.getenv('WORKER_MODE', 'sync').strip().lower(), 'threading')
+socketio = SocketIO(cors_allowed_origins=EFFECTIVE_ALLOWED_ORIGINS or '*', async_mode=SOCKETIO_ASYNC_MODE,
+                    message_queue=os.getenv('SOCKETIO_MESSAGE_QUEUE') or None)
 socketio.init_app(app, cors_allowed_origins=EFFECTIVE_ALLOWED_ORIGINS or '*')
 
 # Request tracking and mobile detection middleware
 def _cors_preflight_response(origin: str):
     """Craft a permissive CORS preflight response when origin is allowed."""
     resp = make_response('', 204)
-    if origin and is_allowed_origin(origin):
+    if origin and _request_origin_allowed():
         resp.headers['Access-Control-Allow-Origin'] = origin
         resp.headers['Access-Control-Allow-Credentials'] = 'true'
         resp.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-Requested-With'
@@ -195,7 +274,7 @@ def _origin_allowed_for_csrf():
     if not origin:
         ref = request.headers.get('Referer', '')
         return (not PRODUCTION) or (request.host in ref)
-    return is_allowed_origin(origin)
+    return _request_origin_allowed()
 
 def _is_state_changing():
     return request.method in ('POST', 'PUT', 'DELETE', 'PATCH')
@@ -214,7 +293,7 @@ def before_request():
     # Log all requests with mobile detection and origin
     origin = request.headers.get('Origin')
     ac_req_method = request.headers.get('Access-Control-Request-Method')
-    logger.info(f"[{request.id}] {request.method} {request.path} - Mobile: {request.is_mobile} - IP: {request.remote_addr} - Origin: {origin} - ACRM: {ac_req_method}")
+    logger.debug(f"[{request.id}] {request.method} {request.path} - Mobile: {request.is_mobile} - IP: {request.remote_addr} - Origin: {origin} - ACRM: {ac_req_method}")
 
     # Handle CORS preflight explicitly (in addition to Flask-CORS), to ensure header presence
     if request.method == 'OPTIONS':
@@ -226,10 +305,10 @@ def before_request():
             return jsonify({'error': 'Origin not allowed'}), 403
     
     # Log detailed info for authentication requests
-    if '/auth/' in request.path:
-        logger.info(f"[{request.id}] AUTH REQUEST - User-Agent: {user_agent}")
-        logger.info(f"[{request.id}] AUTH REQUEST - Session keys: {list(session.keys())}")
-        logger.info(f"[{request.id}] AUTH REQUEST - Cookies: {list(request.cookies.keys())}")
+    if '/auth/' in request.path and logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"[{request.id}] AUTH REQUEST - User-Agent: {user_agent}")
+        logger.debug(f"[{request.id}] AUTH REQUEST - Session keys: {list(session.keys())}")
+        logger.debug(f"[{request.id}] AUTH REQUEST - Cookies: {list(request.cookies.keys())}")
 
 @app.after_request 
 def after_request(response):
@@ -238,22 +317,21 @@ def after_request(response):
     is_mobile = getattr(request, 'is_mobile', False)
     # Robust CORS headers for credentialed requests
     origin = request.headers.get('Origin')
-    if origin and is_allowed_origin(origin):
+    if origin and _request_origin_allowed():
         response.headers['Access-Control-Allow-Origin'] = origin
         response.headers['Access-Control-Allow-Credentials'] = 'true'
         response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-Requested-With'
         response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
         # Ensure caches/CDNs vary by Origin
         response.headers.add('Vary', 'Origin')
-        logger.info(f"[{request_id}] CORS OK - {origin} {request.method} {request.path}")
+        logger.debug(f"[{request_id}] CORS OK - {origin} {request.method} {request.path}")
     elif origin:
         logger.warning(f"[{request_id}] CORS BLOCKED - {origin} {request.method} {request.path}")
 
-    logger.info(f"[{request_id}] RESPONSE - Status: {response.status_code}")
-    
+    # Status and latency are in the per-request summary record.
     # Log session changes for auth requests with detailed cookie info
-    if '/auth/' in request.path:
-        logger.info(f"[{request_id}] AUTH RESPONSE - Session after: {list(session.keys())}")
+    if '/auth/' in request.path and logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"[{request_id}] AUTH RESPONSE - Session after: {list(session.keys())}")
         
         # Log detailed cookie headers for mobile debugging
         if 'Set-Cookie' in response.headers:
@@ -267,105 +345,29 @@ def after_request(response):
                     masked = '; '.join(parts)
                 except Exception:
                     masked = 'session=<redacted>'
-            logger.info(f"[{request_id}] AUTH RESPONSE - Setting cookies for mobile: {is_mobile}")
-            logger.info(f"[{request_id}] AUTH RESPONSE - Cookie attributes: {masked}")
+            logger.debug(f"[{request_id}] AUTH RESPONSE - Setting cookies for mobile: {is_mobile}")
+            logger.debug(f"[{request_id}] AUTH RESPONSE - Cookie attributes: {masked}")
         else:
-            logger.warning(f"[{request_id}] AUTH RESPONSE - No Set-Cookie header found!")
+            logger.debug(f"[{request_id}] AUTH RESPONSE - No Set-Cookie header found!")
     
     return response
 
-# Create database tables
-with app.app_context():
-    db.create_all()
-    # Ensure new columns exist in production DBs without manual migrations
-    try:
-        insp = inspect(db.engine)
-        # Add User.signed_up_by_staff if missing
-        if 'user' in insp.get_table_names():
-            user_cols = {c['name'] for c in insp.get_columns('user')}
-            # Add user.name column if missing
-            if 'name' not in user_cols:
-                try:
-                    db.session.execute(text('ALTER TABLE "user" ADD COLUMN name VARCHAR(100)'))
-                    db.session.commit()
-                    logger.info('Added column user.name')
-                except Exception as e:
-                    logger.warning(f'Could not add user.name: {e}')
-            if 'signed_up_by_staff' not in user_cols:
-                try:
-                    db.session.execute(text('ALTER TABLE "user" ADD COLUMN signed_up_by_staff VARCHAR(50)'))
-                    db.session.commit()
-                    logger.info('Added column user.signed_up_by_staff')
-                except Exception as e:
-                    logger.warning(f'Could not add user.signed_up_by_staff: {e}')
+# Schema changes and admin seeding run once per deploy in migrate.py (the
+# gunicorn on_starting hook or a release step), never on import
 
-            # Add user.phone column if missing
-            if 'phone' not in user_cols:
-                try:
-                    db.session.execute(text('ALTER TABLE "user" ADD COLUMN phone VARCHAR(30)'))
-                    db.session.commit()
-                    logger.info('Added column user.phone')
-                except Exception as e:
-                    logger.warning(f'Could not add user.phone: {e}')
+# Periodic token cleanup runs in the background, never on the request path
+maintenance_scheduler = create_scheduler(app)
+maintenance_scheduler.start()
 
-            # Add user.password_hash column if missing
-            if 'password_hash' not in user_cols:
-                try:
-                    db.session.execute(text('ALTER TABLE "user" ADD COLUMN password_hash VARCHAR(255)'))
-                    db.session.commit()
-                    logger.info('Added column user.password_hash')
-                except Exception as e:
-                    logger.warning(f'Could not add user.password_hash: {e}')
-
-            # Add user.password_set_at column if missing
-            if 'password_set_at' not in user_cols:
-                try:
-                    db.session.execute(text('ALTER TABLE "user" ADD COLUMN password_set_at TIMESTAMP'))
-                    db.session.commit()
-                    logger.info('Added column user.password_set_at')
-                except Exception as e:
-                    logger.warning(f'Could not add user.password_set_at: {e}')
-
-        # Add Referral.signed_up_by_staff and Referral.origin if missing
-        if 'referral' in insp.get_table_names():
-            ref_cols = {c['name'] for c in insp.get_columns('referral')}
-            if 'signed_up_by_staff' not in ref_cols:
-                try:
-                    db.session.execute(text('ALTER TABLE referral ADD COLUMN signed_up_by_staff VARCHAR(50)'))
-                    db.session.commit()
-                    logger.info('Added column referral.signed_up_by_staff')
-                except Exception as e:
-                    logger.warning(f'Could not add referral.signed_up_by_staff: {e}')
-            if 'origin' not in ref_cols:
-                try:
-                    # DEFAULT 'link' for Postgres; SQLite ignores DEFAULT if unsupported
-                    db.session.execute(text("ALTER TABLE referral ADD COLUMN origin VARCHAR(20) DEFAULT 'link'"))
-                    db.session.commit()
-                    logger.info('Added column referral.origin')
-                except Exception as e:
-                    logger.warning(f'Could not add referral.origin: {e}')
-    except Exception as e:
-        logger.warning(f'DB auto-migration check failed: {e}')
-    
-    # Auto-migrate generated_by_admin_id column if needed
-    try:
-        from auto_migrate import ensure_generated_by_admin_id_column
-        ensure_generated_by_admin_id_column(db)
-    except Exception as e:
-        logger.warning(f'Auto-migration for generated_by_admin_id failed: {e}')
-
-# SSE subscribers for immediate QR notifications
-sse_clients = []  # list[Queue]
+# SSE subscribers for immediate QR notifications. Events are published on a
+# cross-worker bus so every worker's /qr/stream subscribers receive them.
+sse_bus = create_sse_bus(app.config['SQLALCHEMY_DATABASE_URI'], db_profile=db_profile.name)
 
 def sse_broadcast(message: dict):
     try:
-        for q in list(sse_clients):
-            try:
-                q.put_nowait(message)
-            except Exception:
-                pass
-    except Exception:
-        pass
+        sse_bus.publish(message)
+    except Exception as e:
+        logger.warning(f"[SSE] publish failed: {e}")
 
 # QR scan tracking + redirect endpoints
 @app.route('/qr/login')
@@ -374,7 +376,7 @@ def qr_login_redirect():
         ev = QREvent(kind='login')
         db.session.add(ev)
         db.session.commit()
-        sse_broadcast({'kind': 'login', 'created_at': ev.created_at.isoformat()})
+        sse_broadcast(ev.to_dict())
     except Exception as e:
         logger.warning(f"QR event save failed (login): {e}")
         db.session.rollback()
@@ -387,63 +389,152 @@ def qr_review_redirect():
         ev = QREvent(kind='review')
         db.session.add(ev)
         db.session.commit()
-        sse_broadcast({'kind': 'review', 'created_at': ev.created_at.isoformat()})
+        sse_broadcast(ev.to_dict())
     except Exception as e:
         logger.warning(f"QR event save failed (review): {e}")
         db.session.rollback()
     # Redirect to Google review URL
     return redirect('https://g.page/r/CdZAjJJlW1Y2EBE/review', code=302)
 
+# A long-poll holds its worker for the whole wait; sync workers (2 by default)
+# would be used up by two fallback displays, so they answer immediately
+QR_EVENTS_MAX_WAIT = float(os.getenv('QR_EVENTS_MAX_WAIT', '0' if SOCKETIO_ASYNC_MODE == 'threading' else '25'))
+QR_EVENTS_RESYNC_SECONDS = float(os.getenv('QR_EVENTS_RESYNC_SECONDS', '30'))
+_qr_events_synced_at = 0.0
+
+def _latest_qr_event_id():
+    """Newest QREvent id known to this worker. Kept current by the SSE bus;
+    re-read from the database at most every QR_EVENTS_RESYNC_SECONDS in case
+    a publish was lost."""
+    global _qr_events_synced_at
+    latest = sse_bus.current_event_id()
+    if latest is None or time.monotonic() - _qr_events_synced_at > QR_EVENTS_RESYNC_SECONDS:
+        sse_bus.note_event_id(db.session.query(db.func.max(QREvent.id)).scalar() or 0)
+        _qr_events_synced_at = time.monotonic()
+        latest = sse_bus.current_event_id()
+    return latest
+
+def _if_none_match_event_id():
+    ids = [int(tag[3:]) for tag in request.if_none_match.as_set(include_weak=True)
+           if tag.startswith('qr-') and tag[3:].isdigit()]
+    return max(ids) if ids else None
+
 @app.route('/qr/events')
 def qr_events():
-    """Return QR events created after the given timestamp."""
+    """Return QR events created after the given timestamp (since=) or event id (since_id=).
+    wait=<seconds> long-polls until a newer event arrives. The weak ETag names
+    the newest event id, so If-None-Match / since_id answer "nothing new"
+    from memory without querying."""
     try:
         since = request.args.get('since', '').strip()
+        since_id = request.args.get('since_id', type=int)
+        wait = min(max(request.args.get('wait', 0.0, type=float), 0.0), QR_EVENTS_MAX_WAIT)
+        etag_id = _if_none_match_event_id()
+
+        latest = _latest_qr_event_id()
+        cursor = since_id if since_id is not None else etag_id
+        if wait and cursor is not None and latest <= cursor:
+            # Do not hold a pooled connection while blocked
+            db.session.close()
+            latest = sse_bus.wait_for_event(cursor, wait)
+        if etag_id is not None and latest <= etag_id:
+            return Response(status=304, headers={'ETag': f'W/"qr-{latest}"'})
+
         now = datetime.utcnow()
-        query = QREvent.query
-        if since:
-            try:
-                # Allow plain ISO without timezone
-                dt = datetime.fromisoformat(since.replace('Z', ''))
-                query = query.filter(QREvent.created_at > dt)
-            except Exception:
-                pass
-        events = query.order_by(QREvent.created_at.desc()).limit(25).all()
-        return jsonify({
+        if since_id is not None and latest <= since_id:
+            events = []
+        else:
+            query = QREvent.query
+            if since_id is not None:
+                query = query.filter(QREvent.id > since_id)
+            elif since:
+                try:
+                    # Allow plain ISO without timezone
+                    dt = datetime.fromisoformat(since.replace('Z', ''))
+                    query = query.filter(QREvent.created_at > dt)
+                except Exception:
+                    pass
+            events = query.order_by(QREvent.created_at.desc()).limit(25).all()
+            if events:
+                latest = max(latest, max(e.id for e in events))
+                sse_bus.note_event_id(latest)
+        response = jsonify({
             'now': now.isoformat(),
+            'latest_id': latest,
+            'wait': wait,  # seconds this request was allowed to block
+            'max_wait': QR_EVENTS_MAX_WAIT,  # what to ask for next time (0 = plain poll)
             'count': len(events),
             'events': [e.to_dict() for e in events]
         })
+        response.set_etag(f'qr-{latest}', weak=True)
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+SSE_HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+SSE_REPLAY_LIMIT = int(os.getenv('SSE_REPLAY_LIMIT', '100'))
+
+def _sse_event(ev: dict) -> str:
+    # QREvent ids are the SSE event ids, so a reconnecting EventSource
+    # resumes from Last-Event-ID
+    return f"id: {ev['id']}\ndata: {json.dumps(ev)}\n\n"
+
 @app.route('/qr/stream')
 def qr_stream():
-    """Server-Sent Events stream for immediate QR notifications."""
-    q = Queue()
-    sse_clients.append(q)
+    """Server-Sent Events stream for immediate QR notifications.
+    Replays events after Last-Event-ID, sends heartbeat comments so dead
+    connections are noticed, and buffers at most SSE_QUEUE_SIZE events."""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
 
     @stream_with_context
     def event_stream():
+        # Subscribe before reading the backlog so nothing falls in between
+        q = sse_bus.subscribe()
         try:
-            # Initial comment to open stream
-            yield ': ok\n\n'
+            # Initial comment to open stream; retry hint for reconnects
+            yield 'retry: 3000\n: ok\n\n'
+            # Ids of replayed events that may also arrive on the bus. Ids from
+            # different workers can commit out of order, so a live event with a
+            # lower id than the last replayed one is still new.
+            replayed = set()
+            if last_event_id is not None:
+                try:
+                    missed = (QREvent.query.filter(QREvent.id > last_event_id)
+                              .order_by(QREvent.id.asc()).limit(SSE_REPLAY_LIMIT).all())
+                    backlog = [e.to_dict() for e in missed]
+                finally:
+                    # Do not hold a pooled connection for the life of the stream
+                    db.session.close()
+                for ev in backlog:
+                    replayed.add(ev['id'])
+                    yield _sse_event(ev)
             while True:
-                msg = q.get()
-                payload = json.dumps(msg)
-                yield f'data: {payload}\n\n'
+                try:
+                    msg = q.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except Empty:
+                    # A failed write here ends the generator and frees the subscriber
+                    yield ': hb\n\n'
+                    continue
+                if 'id' in msg:
+                    if msg['id'] in replayed:
+                        replayed.discard(msg['id'])
+                        continue  # already replayed
+                    yield _sse_event(msg)
+                else:
+                    yield f'data: {json.dumps(msg)}\n\n'
         except GeneratorExit:
             pass
         finally:
-            try:
-                sse_clients.remove(q)
-            except ValueError:
-                pass
+            sse_bus.unsubscribe(q)
 
     resp = Response(event_stream(), mimetype='text/event-stream')
     # Allow CORS for EventSource
     origin = request.headers.get('Origin')
-    if origin and is_allowed_origin(origin):
+    if origin and _request_origin_allowed():
         resp.headers['Access-Control-Allow-Origin'] = origin
         resp.headers.add('Vary', 'Origin')
     resp.headers['Cache-Control'] = 'no-cache'
@@ -465,6 +556,16 @@ def on_connect():
     except Exception as e:
         logger.warning(f"[SocketIO] connect handler error: {e}")
 
+def _socketio_room_sizes():
+    rooms = socketio.server.manager.rooms.get('/', {}) if socketio.server else {}
+    return [((('room', 'qr_display'),), len(rooms.get('qr_display', ())))]
+
+if metrics_registry is not None:
+    metrics_registry.gauge('sse_subscribers', 'Open /qr/stream connections.', lambda: [((), sse_bus.subscriber_count())])
+    metrics_registry.histogram('sse_delivery_seconds', 'QR event publish to local subscriber delivery latency.')
+    sse_bus.add_observer(lambda latency: metrics_registry.observe('sse_delivery_seconds', latency))
+    metrics_registry.gauge('socketio_room_size', 'Clients joined to each Socket.IO room.', _socketio_room_sizes)
+
 @socketio.on('join_qr_display')
 def on_join_qr_display():
     try:
@@ -484,30 +585,7 @@ def on_join_qr_display():
     logger.info(f"SECRET_KEY length: {len(app.config.get('SECRET_KEY', ''))}")
     logger.info(f"Session config: {dict((k, v) for k, v in app.config.items() if 'SESSION' in k)}")
     logger.info("=" * 50)
-    
-    # Ensure configured admin users exist and are marked as admin
-    configured_admins = []
-    admins_env = os.getenv('ADMIN_EMAILS')
-    if admins_env:
-        configured_admins = [e.strip().lower() for e in admins_env.split(',') if e.strip()]
-    else:
-        configured_admins = [os.getenv('ADMIN_EMAIL', 'drtshifrin@gmail.com').strip().lower()]
-
-    logger.info(f"Configured admin emails: {configured_admins}")
 
-    for admin_email in configured_admins:
-        if not admin_email:
-            continue
-        admin_user = User.query.filter_by(email=admin_email).first()
-        if not admin_user:
-            admin_user = User(email=admin_email, is_admin=True)
-            db.session.add(admin_user)
-            db.session.commit()
-            print(f"Created admin user: {admin_email}")
-        elif not admin_user.is_admin:
-            admin_user.is_admin = True
-            db.session.commit()
-            print(f"Updated existing user to admin: {admin_email}")
 
 # Health check endpoint
 @app.route('/health')
@@ -927,27 +1005,31 @@ def debug_simple_cookie_test():
 
 # Helper function to validate session
 def get_current_user():
-    """Get current user from session"""
-    user_id = session.get('user_id')
-    if user_id:
-        return User.query.get(user_id)
-    return None
+    """Get current user (full ORM object) from session"""
+    principal = get_current_principal()
+    return principal.user if principal else None
+
+def _hashing_busy_response():
+    """503 with Retry-After when the password hashing pool is saturated."""
+    resp = jsonify({'error': 'Server busy, please try again in a moment'})
+    resp.status_code = 503
+    resp.headers['Retry-After'] = '1'
+    return resp
 
-def require_auth():
-    """Decorator to require authentication"""
+def require_auth(load_user=True):
+    """Decorator to require authentication.
+    Authorization uses the session principal (no DB round trip); the handler
+    receives the ORM User when load_user=True, else the Principal.
+    """
     def decorator(f):
         def wrapper(*args, **kwargs):
-            user = get_current_user()
+            principal = get_current_principal()
+            user = principal.user if (principal and load_user) else principal
             if not user:
-                # Mobile debugging: log failed auth attempts
-                user_agent = request.headers.get('User-Agent', 'Unknown')
-                is_mobile = any(mobile_indicator in user_agent.lower() for mobile_indicator in 
-                               ['mobile', 'android', 'iphone', 'ipad', 'blackberry', 'windows phone'])
-                
-                print(f"❌ Auth failed - Endpoint: {request.endpoint}, Mobile: {is_mobile}")
-                print(f"Session ID present: {'session' in request.cookies}")
-                print(f"User ID in session: {session.get('user_id', 'None')}")
-                print(f"Cookies received: {list(request.cookies.keys())}")
+                # Mobile debugging: log failed auth attempts (the 401 itself is in the request summary)
+                logger.debug(f"❌ Auth failed - Endpoint: {request.endpoint}, "
+                             f"Mobile: {getattr(request, 'is_mobile', False)}, "
+                             f"Cookies received: {list(request.cookies.keys())}")
                 
                 return jsonify({'error': 'Authentication required'}), 401
             # Gate access if user must set a password (OTP verified session)
@@ -964,16 +1046,29 @@ def require_auth():
         return wrapper
     return decorator
 
-def require_admin():
-    """Decorator to require admin privileges"""
+def _admin_denied(principal):
+    """403 response unless principal may use admin endpoints, else None."""
+    if not principal or not principal.is_admin:
+        return jsonify({'error': 'Admin privileges required'}), 403
+    # Block admin access until password is set
+    if session.get('must_set_password') is True:
+        return jsonify({'error': 'Must set password', 'must_set_password': True}), 403
+    return None
+
+def require_admin(load_user=False):
+    """Decorator to require admin privileges.
+    Admin handlers receive the Principal (id, email, is_admin, referral_code)
+    by default; use principal.user or load_user=True for the ORM object.
+    """
     def decorator(f):
         def wrapper(*args, **kwargs):
-            user = get_current_user()
-            if not user or not user.is_admin:
+            principal = get_current_principal()
+            denied = _admin_denied(principal)
+            if denied:
+                return denied
+            user = principal.user if load_user else principal
+            if user is None:
                 return jsonify({'error': 'Admin privileges required'}), 403
-            # Block admin access until password is set
-            if session.get('must_set_password') is True:
-                return jsonify({'error': 'Must set password', 'must_set_password': True}), 403
             return f(user, *args, **kwargs)
         wrapper.__name__ = f.__name__
         return wrapper
@@ -1005,72 +1100,52 @@ def send_otp():
             logger.warning(f"[{request_id}] OTP FAILED - Invalid email format: {email}")
             return jsonify({'error': 'Invalid email format'}), 400
         
-        # Clean up expired OTP tokens
-        expired_tokens = OTPToken.query.filter(OTPToken.expires_at < datetime.utcnow()).all()
-        for token in expired_tokens:
-            db.session.delete(token)
+        # Issue a new OTP code (expired/used codes are pruned by the maintenance scheduler)
+        otp_code = otp_store.issue(email)
         
-        # Create new OTP token
-        otp_token = OTPToken(email=email)
-        db.session.add(otp_token)
-        db.session.commit()
-        
-        # Send email (in production, you'd want to do this asynchronously)
+        # Queue the email and answer right away. With EMAIL_ASYNC=0 the send has
+        # already happened and its result counts; otherwise provider failures
+        # are logged and counted by the dispatcher (/admin/email-stats, /metrics)
+        existing_user = User.query.filter_by(email=email).first()
         try:
-            logger.info(f"[{request_id}] OTP EMAIL SENDING - To: {email}, Service: {email_service.from_email}")
-            # Get existing user for referral link
-            existing_user = User.query.filter_by(email=email).first()
-            success = email_service.send_otp_email(email, otp_token.token, existing_user)
+            handle = email_dispatcher.send_otp_email(email, otp_code, existing_user)
+            logger.info(f"[{request_id}] OTP EMAIL QUEUED - To: {email}, Service: {email_dispatcher.from_email}")
+            success = handle.result() is not False if handle.done() else True
             logger.info(f"[{request_id}] OTP EMAIL RESULT - Success: {success}")
-
-            # Return success if email was sent
-            if success:
-                has_staff = bool(existing_user and getattr(existing_user, 'signed_up_by_staff', None))
-                return jsonify({
-                    'message': 'OTP sent to your email',
-                    'email': email,
-                    'expires_in': 600,
-                    'has_staff': has_staff
-                })
-
-            # Fallback for local/dev or demo accounts: allow proceeding even if email failed
-            demo_users = {
-                'demo@duluthdentalcenter.com': '123456',
-                'drtshifrin@gmail.com': '123456',
-                'user@demo.com': '123456'
-            }
-            allow_fake = (os.getenv('FLASK_ENV') != 'production') and (os.getenv('DEV_ALLOW_FAKE_OTP') in ('1', 'true', 'True', 'yes', 'on'))
-            if email.lower() in demo_users or allow_fake:
-                logger.warning(f"[{request_id}] OTP EMAIL FALLBACK - Proceeding without email (demo/dev). allow_fake={allow_fake}")
-                existing_user = User.query.filter_by(email=email).first()
-                has_staff = bool(existing_user and getattr(existing_user, 'signed_up_by_staff', None))
-                return jsonify({
-                    'message': 'OTP issued (dev mode) — use your code',
-                    'email': email,
-                    'expires_in': 600,
-                    'has_staff': has_staff
-                })
-
-            return jsonify({'error': 'Failed to send OTP. Please try again.'}), 500
+            error = None if success else 'Failed to send OTP. Please try again.'
+            status = 500
+        except EmailQueueFull as e:
+            logger.warning(f"[{request_id}] OTP EMAIL REJECTED - {e}")
+            error, status = 'Failed to send OTP. Please try again.', 503
         except Exception as e:
             logger.error(f"[{request_id}] OTP EMAIL EXCEPTION - {str(e)}")
-            # Same fallback for dev/demo
-            demo_users = {
-                'demo@duluthdentalcenter.com': '123456',
-                'drtshifrin@gmail.com': '123456',
-                'user@demo.com': '123456'
-            }
-            allow_fake = (os.getenv('FLASK_ENV') != 'production') and (os.getenv('DEV_ALLOW_FAKE_OTP') in ('1', 'true', 'True', 'yes', 'on'))
-            if email.lower() in demo_users or allow_fake:
-                existing_user = User.query.filter_by(email=email).first()
-                has_staff = bool(existing_user and getattr(existing_user, 'signed_up_by_staff', None))
-                return jsonify({
-                    'message': 'OTP issued (dev mode) — use your code',
-                    'email': email,
-                    'expires_in': 600,
-                    'has_staff': has_staff
-                })
-            return jsonify({'error': f'Email service error: {str(e)}'}), 500
+            error, status = f'Email service error: {str(e)}', 500
+
+        has_staff = bool(existing_user and getattr(existing_user, 'signed_up_by_staff', None))
+        if error is None:
+            return jsonify({
+                'message': 'OTP sent to your email',
+                'email': email,
+                'expires_in': 600,
+                'has_staff': has_staff
+            })
+
+        # Fallback for local/dev or demo accounts: allow proceeding even if email failed
+        demo_users = {
+            'demo@duluthdentalcenter.com': '123456',
+            'drtshifrin@gmail.com': '123456',
+            'user@demo.com': '123456'
+        }
+        allow_fake = (os.getenv('FLASK_ENV') != 'production') and (os.getenv('DEV_ALLOW_FAKE_OTP') in ('1', 'true', 'True', 'yes', 'on'))
+        if email.lower() in demo_users or allow_fake:
+            logger.warning(f"[{request_id}] OTP EMAIL FALLBACK - Proceeding without email (demo/dev). allow_fake={allow_fake}")
+            return jsonify({
+                'message': 'OTP issued (dev mode) — use your code',
+                'email': email,
+                'expires_in': 600,
+                'has_staff': has_staff
+            })
+        return jsonify({'error': error}), status
             
     except Exception as e:
         db.session.rollback()
@@ -1091,7 +1166,8 @@ def verify_otp():
             raw_body = request.get_data(cache=True, as_text=True)[:1000]
         except Exception:
             raw_body = '<unavailable>'
-        logger.info(f"[{request_id}] OTP VERIFY HEADERS: {dict(request.headers)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"[{request_id}] OTP VERIFY HEADERS: {dict(request.headers)}")
         # Avoid logging raw bodies with secrets in production
         # logger.info(f"[{request_id}] OTP VERIFY RAW BODY (truncated): {raw_body}")
 
@@ -1101,7 +1177,7 @@ def verify_otp():
                 data = json.loads(raw_body) if raw_body else {}
             except Exception:
                 data = {}
-        logger.info(f"[{request_id}] OTP VERIFY - Parsed JSON keys: {list(data.keys())}")
+        logger.debug(f"[{request_id}] OTP VERIFY - Parsed JSON keys: {list(data.keys())}")
         email = data.get('email', '').strip().lower()
         token = data.get('token', '').strip()
         # Normalize potential name fields
@@ -1126,18 +1202,15 @@ def verify_otp():
             or ''
         )
         staff = canonicalize_staff(staff)
-        logger.info(f"[{request_id}] OTP VERIFY - Staff raw values: {staff_raw_values}")
-        logger.info(f"[{request_id}] OTP VERIFY - Staff normalized: '{staff}' (allowed: {STAFF_MEMBERS})")
+        logger.debug(f"[{request_id}] OTP VERIFY - Staff raw values: {staff_raw_values}")
+        logger.debug(f"[{request_id}] OTP VERIFY - Staff normalized: '{staff}' (allowed: {STAFF_MEMBERS})")
         
         logger.info(f"[{request_id}] OTP VERIFY START - Email: {email}, Mobile: {is_mobile}")
-        logger.info(f"[{request_id}] OTP VERIFY START - Current session keys: {list(session.keys())}")
-        logger.info(f"[{request_id}] OTP VERIFY START - Request method: {request.method}")
-        logger.info(f"[{request_id}] OTP VERIFY START - Content type: {request.content_type}")
-        
-        if is_mobile:
-            logger.info(f"[{request_id}] MOBILE OTP VERIFY - Processing mobile OTP request")
-            logger.info(f"[{request_id}] MOBILE OTP VERIFY - Request data: {data}")
-            logger.info(f"[{request_id}] MOBILE OTP VERIFY - Request headers: {dict(request.headers)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"[{request_id}] OTP VERIFY START - Current session keys: {list(session.keys())}")
+            logger.debug(f"[{request_id}] OTP VERIFY START - Content type: {request.content_type}")
+            if is_mobile:
+                logger.debug(f"[{request_id}] MOBILE OTP VERIFY - Request headers: {dict(request.headers)}")
         
         if not email or not token:
             logger.warning(f"[{request_id}] OTP VERIFY FAILED - Missing email or token")
@@ -1155,23 +1228,19 @@ def verify_otp():
         }
         
         is_demo_login = email in demo_users and token == demo_users[email]
-        logger.info(f"[{request_id}] OTP VERIFY - Demo login check: {is_demo_login}")
+        logger.debug(f"[{request_id}] OTP VERIFY - Demo login check: {is_demo_login}")
         
+        # Everything below is one unit of work: token consumption, get-or-create
+        # user and attribute updates are committed together exactly once.
         if not is_demo_login:
-            # Regular OTP verification
-            otp_token = OTPToken.query.filter_by(
-                email=email,
-                token=token,
-                used=False
-            ).first()
-            
-            if not otp_token or not otp_token.is_valid():
+            # Regular OTP verification: one atomic consume of a live code. The
+            # conditional UPDATE holds the row until commit, so a concurrent
+            # verification of the same code matches zero rows.
+            if not otp_store.consume(email, token):
                 logger.warning(f"[{request_id}] OTP VERIFY FAILED - Invalid or expired OTP for {email}")
                 return jsonify({'error': 'Invalid or expired OTP'}), 400
-            
-            logger.info(f"[{request_id}] OTP VERIFY SUCCESS - Valid OTP token found for {email}")
-            # Mark token as used
-            otp_token.use_token()
+
+            logger.info(f"[{request_id}] OTP VERIFY SUCCESS - Valid OTP token consumed for {email}")
         
         # Find or create user
         user = User.query.filter_by(email=email).first()
@@ -1179,7 +1248,7 @@ def verify_otp():
             logger.info(f"[{request_id}] USER CREATE - Creating new user for {email}")
             user = User(email=email)
             db.session.add(user)
-            db.session.commit()
+            db.session.flush()
         else:
             logger.info(f"[{request_id}] USER FOUND - Existing user {email} (ID: {user.id})")
 
@@ -1194,7 +1263,6 @@ def verify_otp():
 
             if email.lower() in configured_admins and not user.is_admin:
                 user.is_admin = True
-                db.session.commit()
                 logger.info(f"[{request_id}] USER ROLE - Promoted to admin: {email}")
         except Exception as _e:
             logger.warning(f"[{request_id}] USER ROLE - Admin promotion check failed: {_e}")
@@ -1204,16 +1272,15 @@ def verify_otp():
                 # Basic sanitation: collapse spaces and limit length
                 safe_name = re.sub(r'\s+', ' ', name)[:100]
                 user.name = safe_name
-                db.session.commit()
                 logger.info(f"[{request_id}] USER UPDATE - Saved name for {email}: {safe_name}")
         except Exception as _e:
             logger.warning(f"[{request_id}] USER UPDATE - Failed to save name: {_e}")
         
         # CRITICAL MOBILE DEBUG - Track if mobile reaches session setup
         if is_mobile:
-            logger.info(f"[{request_id}] MOBILE CRITICAL - About to set session for mobile browser")
-            logger.info(f"[{request_id}] MOBILE CRITICAL - Session before setup: {list(session.keys())}")
-            logger.info(f"[{request_id}] MOBILE CRITICAL - User object ready: {user.id} - {user.email}")
+            logger.debug(f"[{request_id}] MOBILE CRITICAL - About to set session for mobile browser")
+            logger.debug(f"[{request_id}] MOBILE CRITICAL - Session before setup: {list(session.keys())}")
+            logger.debug(f"[{request_id}] MOBILE CRITICAL - User object ready: {user.id} - {user.email}")
         
         # Resolve staff member: use provided, or fallback to user's saved value if present
         resolved_staff = staff
@@ -1225,22 +1292,27 @@ def verify_otp():
             try:
                 if not getattr(user, 'signed_up_by_staff', None):
                     user.signed_up_by_staff = resolved_staff
-                    db.session.commit()
             except Exception as _e:
                 logger.warning(f"[{request_id}] OTP VERIFY - Failed to persist user staff: {str(_e)}")
-            logger.info(f"[{request_id}] OTP VERIFY - Staff in session: {resolved_staff}")
+            logger.debug(f"[{request_id}] OTP VERIFY - Staff in session: {resolved_staff}")
 
         # If user already has a password, do not allow OTP to grant full access; require password login
         if getattr(user, 'password_hash', None):
             logger.info(f"[{request_id}] OTP VERIFY - User has password; rejecting OTP login for {email}")
+            # Still consume the code and keep attribute updates
+            db.session.commit()
             return jsonify({'error': 'Password required. Please sign in with your email and password.'}), 400
 
+        # Single commit for the whole login; the session is issued only once it is durable
+        db.session.commit()
+
         # Set session with mobile browser compatibility (gated: must set password)
-        logger.info(f"[{request_id}] SESSION SET - Before: {list(session.keys())}")
-        logger.info(f"[{request_id}] SESSION SET - Session interface type: {type(app.session_interface).__name__}")
+        logger.debug(f"[{request_id}] SESSION SET - Before: {list(session.keys())}")
+        logger.debug(f"[{request_id}] SESSION SET - Session interface type: {type(app.session_interface).__name__}")
         
         session['user_id'] = user.id
         session['user_email'] = user.email
+        remember_principal(user)
         session['otp_verified'] = True
         session['must_set_password'] = True
         session.permanent = True
@@ -1248,26 +1320,23 @@ def verify_otp():
         # Force session to be marked as modified
         session.modified = True
         
-        logger.info(f"[{request_id}] SESSION SET - After: {list(session.keys())}, Mobile: {is_mobile}")
-        logger.info(f"[{request_id}] SESSION SET - Session modified: {getattr(session, 'modified', 'unknown')}")
-        logger.info(f"[{request_id}] SESSION SET - Session permanent: {session.permanent}")
-        
-        # Force session save for mobile browsers
-        db.session.commit()  # Ensure user is saved before session
+        logger.debug(f"[{request_id}] SESSION SET - After: {list(session.keys())}, Mobile: {is_mobile}")
+        logger.debug(f"[{request_id}] SESSION SET - Session modified: {getattr(session, 'modified', 'unknown')}")
+        logger.debug(f"[{request_id}] SESSION SET - Session permanent: {session.permanent}")
         
         # Log mobile debugging info and apply mobile-specific session handling
         user_agent = request.headers.get('User-Agent', '')
         is_mobile_browser = any(mobile in user_agent.lower() for mobile in ['iphone', 'android', 'mobile'])
         if is_mobile_browser:
-            logger.info(f"[{request_id}] MOBILE LOGIN SUCCESS - {email}, session ID: {session.get('user_id')}")
-            logger.info(f"[{request_id}] MOBILE LOGIN SUCCESS - Session data: {dict(session)}")
-            logger.info(f"[{request_id}] MOBILE LOGIN SUCCESS - User agent: {user_agent}")
+            logger.debug(f"[{request_id}] MOBILE LOGIN SUCCESS - {email}, session ID: {session.get('user_id')}")
+            logger.debug(f"[{request_id}] MOBILE LOGIN SUCCESS - Session data: {dict(session)}")
+            logger.debug(f"[{request_id}] MOBILE LOGIN SUCCESS - User agent: {user_agent}")
             
             # Additional mobile session handling
             try:
                 # Force session modification flag for mobile browsers
                 session.modified = True
-                logger.info(f"[{request_id}] MOBILE LOGIN SUCCESS - Forced session modified flag")
+                logger.debug(f"[{request_id}] MOBILE LOGIN SUCCESS - Forced session modified flag")
             except Exception as save_error:
                 logger.error(f"[{request_id}] MOBILE LOGIN ERROR - Session handling failed: {str(save_error)}")
         
@@ -1283,13 +1352,13 @@ def verify_otp():
         
         # Manually force session save and cookie setting
         if is_mobile:
-            logger.info(f"[{request_id}] MOBILE CRITICAL - About to manually save session")
+            logger.debug(f"[{request_id}] MOBILE CRITICAL - About to manually save session")
             
         try:
             app.session_interface.save_session(app, session, response)
-            logger.info(f"[{request_id}] MANUAL SESSION SAVE - Forced session save to response")
+            logger.debug(f"[{request_id}] MANUAL SESSION SAVE - Forced session save to response")
             if is_mobile:
-                logger.info(f"[{request_id}] MOBILE CRITICAL - Session save completed successfully")
+                logger.debug(f"[{request_id}] MOBILE CRITICAL - Session save completed successfully")
         except Exception as save_error:
             logger.error(f"[{request_id}] MANUAL SESSION SAVE - Failed: {str(save_error)}")
             if is_mobile:
@@ -1348,14 +1417,12 @@ def password_reset_request():
             # Do not leak existence
             return jsonify({'message': 'If this email exists, a code has been sent.'})
 
-        # Issue OTP token for reset
-        otp_token = OTPToken(email=email)
-        db.session.add(otp_token)
-        db.session.commit()
+        # Issue OTP code for reset
+        otp_code = otp_store.issue(email)
 
         try:
-            email_service.send_otp_email(email, otp_token.token)
-            logger.info(f"[{request_id}] PASSWORD RESET OTP sent to {email}")
+            email_dispatcher.send_otp_email(email, otp_code)
+            logger.info(f"[{request_id}] PASSWORD RESET OTP queued for {email}")
         except Exception as e:
             logger.warning(f"[{request_id}] PASSWORD RESET email failed: {e}")
         # Always generic response
@@ -1387,25 +1454,34 @@ def password_reset_confirm():
             # Generic to avoid enumeration
             return jsonify({'error': 'Invalid or expired code'}), 400
 
-        otp_token = OTPToken.query.filter_by(email=email, token=token, used=False).first()
-        if not otp_token or not otp_token.is_valid():
+        # With the sql OTP store the consume commits together with the new
+        # password. The sqlite/redis stores consume immediately, so the code is
+        # put back if hashing or the password commit fails.
+        if not otp_store.consume(email, token):
             return jsonify({'error': 'Invalid or expired code'}), 400
-
-        # Consume token and set new password
-        otp_token.use_token()
-        user.password_hash = generate_password_hash(password)
-        user.password_set_at = datetime.utcnow()
-        db.session.commit()
+        try:
+            user.password_hash = password_hasher.generate(password)
+            user.password_set_at = datetime.utcnow()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            otp_store.restore(email, token)
+            raise
 
         # Log the user in after reset
         session.clear()
         session['user_id'] = user.id
         session['user_email'] = user.email
+        remember_principal(user)
         session['must_set_password'] = False
         session.pop('otp_verified', None)
         session.permanent = True
 
         return jsonify({'message': 'Password reset successful', 'user': user.to_dict()})
+    except HashingBusy as e:
+        db.session.rollback()
+        logger.warning(f"/auth/password-reset/confirm hashing busy: {e}")
+        return _hashing_busy_response()
     except Exception as e:
         db.session.rollback()
         logger.error(f"/auth/password-reset/confirm error: {e}")
@@ -1424,13 +1500,14 @@ def password_login():
         user = User.query.filter_by(email=email).first()
         if not user or not getattr(user, 'password_hash', None):
             return jsonify({'error': 'Password not set for this account. Use OTP to set a password.'}), 400
-        if not check_password_hash(user.password_hash, password):
+        if not password_hasher.check(user.password_hash, password):
             return jsonify({'error': 'Invalid credentials'}), 401
 
         # Establish session
         session.clear()
         session['user_id'] = user.id
         session['user_email'] = user.email
+        remember_principal(user)
         session['must_set_password'] = False
         session.pop('otp_verified', None)
         session.permanent = True
@@ -1440,6 +1517,9 @@ def password_login():
             'user': user.to_dict(),
             'stats': user.get_referral_stats()
         })
+    except HashingBusy as e:
+        logger.warning(f"/auth/login hashing busy: {e}")
+        return _hashing_busy_response()
     except Exception as e:
         logger.error(f"/auth/login error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -1462,7 +1542,7 @@ def set_password(user):
         if len(password) < 8:
             return jsonify({'error': 'Password must be at least 8 characters'}), 400
 
-        user.password_hash = generate_password_hash(password)
+        user.password_hash = password_hasher.generate(password)
         user.password_set_at = datetime.utcnow()
         db.session.commit()
 
@@ -1474,6 +1554,10 @@ def set_password(user):
             'message': 'Password set successfully',
             'user': user.to_dict()
         })
+    except HashingBusy as e:
+        db.session.rollback()
+        logger.warning(f"/auth/set-password hashing busy: {e}")
+        return _hashing_busy_response()
     except Exception as e:
         db.session.rollback()
         logger.error(f"/auth/set-password error: {e}")
@@ -1496,15 +1580,8 @@ def get_dashboard(user):
     """Get user dashboard data"""
     try:
         # Mobile debugging: log request details
-        user_agent = request.headers.get('User-Agent', 'Unknown')
-        is_mobile = any(mobile_indicator in user_agent.lower() for mobile_indicator in 
-                       ['mobile', 'android', 'iphone', 'ipad', 'blackberry', 'windows phone'])
-        
-        print(f"Dashboard request - User: {user.email}, Mobile: {is_mobile}")
-        print(f"User-Agent: {user_agent}")
-        print(f"Origin: {request.headers.get('Origin', 'None')}")
-        print(f"Referer: {request.headers.get('Referer', 'None')}")
-        print(f"Cookies: {len(request.cookies)} cookies present")
+        logger.debug(f"Dashboard request - User: {user.email}, Mobile: {getattr(request, 'is_mobile', False)}, "
+                     f"Origin: {request.headers.get('Origin', 'None')}, Cookies: {len(request.cookies)}")
         
         stats = user.get_referral_stats()
         recent_referrals = user.referrals_made.order_by(Referral.created_at.desc()).limit(5).all()
@@ -1532,7 +1609,6 @@ def get_dashboard(user):
             'recent_referrals': [ref.to_dict() for ref in recent_referrals]
         }
         
-        print(f"Dashboard success for {user.email} - returning {len(str(dashboard_data))} chars")
         return jsonify(dashboard_data)
         
     except Exception as e:
@@ -1864,11 +1940,14 @@ def signup_referral():
         if phone:
             referral_info += f" - Phone: {phone}"
         
-        email_service.send_referral_notification(
-            referrer.email, 
-            referral_info, 
-            'signed_up'
-        )
+        try:
+            email_dispatcher.send_referral_notification(
+                referrer.email, 
+                referral_info, 
+                'signed_up'
+            )
+        except EmailQueueFull as e:
+            logger.warning(f"[{request_id}] SIGNUP - Referrer notification not queued: {e}")
         
         return jsonify({
             'message': 'Referral recorded successfully',
@@ -1962,6 +2041,15 @@ def admin_search_users(user):
         logger.warning(f"/admin/search failed: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+def onboarding_landing_url(jti):
+    """Public magic-link URL encoded in an onboarding QR"""
+    domain = os.getenv('CUSTOM_DOMAIN', 'https://bestdentistduluth.com')
+    if not domain.startswith('http'):
+        domain = f"https://{domain}"
+    if not domain.endswith('/'):
+        domain += '/'
+    return f"{domain}r/welcome?t={jti}"
+
 @app.route('/admin/generate_qr', methods=['POST'])
 @require_admin()
 def admin_generate_qr(user):
@@ -2126,33 +2214,33 @@ def admin_generate_qr(user):
         logger.info(f"[QR] token created jti={token.jti} user_id={target.id} expires_at={token.expires_at.isoformat()}")
 
         # Build public URL for token
-        domain = os.getenv('CUSTOM_DOMAIN', 'https://bestdentistduluth.com')
-        if not domain.startswith('http'):
-            domain = f"https://{domain}"
-        if not domain.endswith('/'):
-            domain += '/'
-        url = f"{domain}r/welcome?t={token.jti}"
+        url = onboarding_landing_url(token.jti)
         logger.info(f"[QR] URL for token jti={token.jti}: {url}")
 
-        # Generate QR code (PNG) and convert to data URL
+        # Displays fetch the image from /qr/img/<jti>.<fmt>; warm the render
+        # cache on the pool while the magic link email is queued
+        qr_future = qr_renderer.submit(qr_renderer.render, url)
+        qr_url = url_for('qr_image', jti=token.jti, fmt=qr_renderer.fmt)
+
+        # Queue magic link email
         try:
-            import qrcode
-            img = qrcode.make(url)
-            bio = BytesIO()
-            img.save(bio, format='PNG')
-            png_bytes = bio.getvalue()
-            data_uri = 'data:image/png;base64,' + base64.b64encode(png_bytes).decode('ascii')
-            logger.info(f"[QR] data URL generated bytes={len(png_bytes)}")
+            email_dispatcher.send_magic_link(chosen_email, url, target)
+            logger.info(f"[QR] Magic link email queued to={chosen_email}")
+        except Exception as e:
+            logger.warning(f"[QR] Failed to send magic link email: {e}")
+
+        try:
+            qr_future.result(timeout=10)
         except Exception as e:
             logger.error(f"[QR] Failed to generate QR: {e}")
             return jsonify({'error': 'QR generation failed'}), 500
 
         expires_at = token.expires_at.isoformat()
 
-        # Emit to iPad room
+        # Emit to iPad room (image by reference: a short path, not a data URI)
         try:
             socketio.emit('new_qr', {
-                'qr_url': data_uri,
+                'qr_url': qr_url,
                 'expires_at': expires_at,
                 'landing_url': url,
                 'first_name': first_name,
@@ -2162,19 +2250,96 @@ def admin_generate_qr(user):
         except Exception as e:
             logger.warning(f"[QR] SocketIO emit new_qr failed: {e}")
 
-        # Send magic link email
-        try:
-            ok = email_service.send_magic_link(chosen_email, url, target)
-            logger.info(f"[QR] Magic link email send result={ok} to={chosen_email}")
-        except Exception as e:
-            logger.warning(f"[QR] Failed to send magic link email: {e}")
-
-        return jsonify({'message': 'QR generated', 'qr_url': data_uri, 'expires_at': expires_at, 'landing_url': url, 'user': target.to_dict()})
+        return jsonify({'message': 'QR generated', 'qr_url': qr_url, 'expires_at': expires_at, 'landing_url': url, 'user': target.to_dict()})
     except Exception as e:
         db.session.rollback()
         logger.error(f"/admin/generate_qr error: {e}", exc_info=True)
         return jsonify({'error': f'QR generation failed: {str(e)}'}), 500
 
+@app.route('/qr/img/<jti>.<any(png, svg):fmt>', methods=['GET'])
+def qr_image(jti, fmt):
+    """QR image for a live onboarding token (browser-cached while the token lives)"""
+    token = db.session.get(OnboardingToken, jti)
+    if token is None or not token.is_valid():
+        return jsonify({'error': 'QR not found or expired'}), 404, {'Cache-Control': 'no-store'}
+    # Revalidation only succeeds while the token is still live
+    etag = f"{jti}-{qr_renderer.variant(fmt)}"
+    if etag in request.if_none_match:
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+    try:
+        body, content_type = qr_renderer.render(onboarding_landing_url(jti), fmt)
+    except Exception as e:
+        logger.error(f"[QR] Failed to render image jti={jti}: {e}")
+        return jsonify({'error': 'QR generation failed'}), 500, {'Cache-Control': 'no-store'}
+    response = Response(body, content_type=content_type)
+    response.set_etag(etag)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics for all workers on this host (token, trusted network or admin)"""
+    if metrics_registry is None:
+        return jsonify({'error': 'Metrics disabled'}), 404
+    if not metrics_access_allowed():
+        denied = _admin_denied(get_current_principal())
+        if denied:
+            return denied
+    return Response(metrics_registry.collect(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/admin/email-stats', methods=['GET'])
+@require_admin()
+def admin_email_stats(user):
+    """Email dispatcher queue depth and per-message latency metrics"""
+    return jsonify(email_dispatcher.stats())
+
+@app.route('/admin/sse-stats', methods=['GET'])
+@require_admin()
+def admin_sse_stats(user):
+    """QR event bus backend, local subscribers and delivery latency for this worker"""
+    return jsonify(sse_bus.stats())
+
+@app.route('/admin/replica-stats', methods=['GET'])
+@require_admin()
+def admin_replica_stats(user):
+    """Replica lag and how read-only admin requests were routed in this worker"""
+    if replica_router is None:
+        return jsonify({'error': 'No read replica configured (set DATABASE_REPLICA_URL)'}), 404
+    return jsonify(replica_router.stats())
+
+@app.route('/admin/maintenance/runs', methods=['GET'])
+@require_admin()
+def admin_maintenance_runs(user):
+    """Rows pruned per maintenance run (most recent last)"""
+    return jsonify({
+        'interval_seconds': maintenance_scheduler.interval,
+        'runs': list(maintenance_scheduler.runs)
+    })
+
+@app.route('/admin/slow-queries', methods=['GET'])
+@require_admin()
+def admin_slow_queries(user):
+    """Recent slow statements in this worker with route, request id and plan"""
+    if slow_query_log is None:
+        return jsonify({'error': 'Slow query log disabled (set SLOW_QUERY_LOG=1)'}), 404
+    return jsonify(slow_query_log.snapshot(limit=request.args.get('limit', type=int)))
+
+@app.route('/admin/profiles', methods=['GET'])
+@require_admin()
+def admin_list_profiles(user):
+    """Request profiles captured by the opt-in profiler (newest first)"""
+    if request_profiler is None:
+        return jsonify({'error': 'Profiling disabled (set PROFILE_ENABLED=1)'}), 404
+    return jsonify({'directory': request_profiler.directory, 'profiles': request_profiler.list_profiles()})
+
+@app.route('/admin/profiles/<filename>', methods=['GET'])
+@require_admin()
+def admin_download_profile(user, filename):
+    """Download a .pstats or .collapsed profile file"""
+    path = request_profiler.resolve(filename) if request_profiler is not None else None
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(path, as_attachment=True, download_name=filename, mimetype='application/octet-stream')
+
 @app.route('/admin/clear_qr', methods=['POST'])
 @require_admin()
 def admin_clear_qr(user):
@@ -2614,11 +2779,14 @@ def complete_referral(user, referral_id):
             db.session.commit()
             
             # Send notification to referrer
-            email_service.send_referral_notification(
-                referral.referrer.email,
-                referral.referred_email,
-                'completed'
-            )
+            try:
+                email_dispatcher.send_referral_notification(
+                    referral.referrer.email,
+                    referral.referred_email,
+                    'completed'
+                )
+            except EmailQueueFull as e:
+                logger.warning(f"Referral {referral_id} completion notification not queued: {e}")
             
             return jsonify({
                 'message': 'Referral marked as completed',
@@ -2975,6 +3143,9 @@ def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
 if __name__ == '__main__':
+    if os.getenv('MIGRATE_ON_START', '1') != '0':
+        from migrate import run as run_migrations
+        run_migrations(app.config['SQLALCHEMY_DATABASE_URI'])
     port = int(os.environ.get('PORT', 5001))
     debug = os.environ.get('FLASK_ENV') != 'production'
     # Use Socket.IO development server so the /socket.io endpoint works locally
@@ -0,0 +1,122 @@
+"""
+Response compression and Cache-Control middleware.
+
+Compresses JSON/HTML/CSV responses above a size threshold (brotli when the
+optional ``brotli`` package is installed and the client accepts it, gzip
+otherwise) and applies per-endpoint Cache-Control policies from a registry.
+Streaming responses (SSE, direct passthrough) are never touched.
+"""
+
+import gzip
+import logging
+import os
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    # Optional dependency; fall back to gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'text/html',
+    'text/csv',
+    'text/plain',
+    'text/css',
+    'application/javascript',
+    'image/svg+xml',
+}
+
+# Endpoint name -> Cache-Control header value. Populated by register_cache_policy().
+CACHE_POLICIES = {}
+
+# Endpoints that must never be compressed or re-cached (e.g. event streams)
+EXCLUDED_ENDPOINTS = set()
+
+
+def register_cache_policy(endpoint: str, value: str):
+    """Register the Cache-Control value sent for a Flask endpoint name."""
+    CACHE_POLICIES[endpoint] = value
+
+
+def exclude_endpoint(endpoint: str):
+    """Exclude an endpoint from compression and cache policies."""
+    EXCLUDED_ENDPOINTS.add(endpoint)
+
+
+def _choose_encoding():
+    accept = request.accept_encodings
+    if brotli is not None and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == 'br':
+        # Brotli quality is 0-11; map gzip-style levels onto it conservatively
+        return brotli.compress(data, quality=min(11, max(0, level - 2)))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def init_response_middleware(app, min_size=None, level=None):
+    """Install the compression / cache-control after_request hook on ``app``.
+
+    Register this before other after_request hooks so it runs last and sees
+    the final headers (Flask runs after_request handlers in reverse order).
+    """
+    if min_size is None:
+        min_size = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+    if level is None:
+        level = int(os.getenv('COMPRESS_LEVEL', '6'))
+    enabled = os.getenv('COMPRESS_RESPONSES', '1').lower() in ('1', 'true', 'yes', 'on')
+
+    @app.after_request
+    def compress_and_cache(response):
+        endpoint = request.endpoint or ''
+        if endpoint in EXCLUDED_ENDPOINTS:
+            return response
+        if response.is_streamed or response.direct_passthrough or response.mimetype == 'text/event-stream':
+            return response
+
+        policy = CACHE_POLICIES.get(endpoint)
+        if policy and 'Cache-Control' not in response.headers:
+            response.headers['Cache-Control'] = policy
+
+        if not enabled or request.method == 'HEAD':
+            return response
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return response
+        if 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = _choose_encoding()
+        if not encoding:
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        try:
+            compressed = _compress(data, encoding, level)
+        except Exception as e:
+            logger.warning(f"[Compression] {encoding} failed for {request.path}: {e}")
+            return response
+        if len(compressed) >= len(data):
+            return response
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        # Weak validators only: the representation bytes changed
+        if response.headers.get('ETag') and not response.headers['ETag'].startswith('W/'):
+            response.headers['ETag'] = 'W/' + response.headers['ETag']
+        return response
+
+    logger.info(f"Response compression enabled={enabled} min_size={min_size} level={level} brotli={brotli is not None}")
+    return compress_and_cache
@@ -0,0 +1,210 @@
+"""
+SQLAlchemy engine profiles.
+
+DATABASE_URL alone used to give SQLAlchemy's defaults: no pre-ping, no
+recycle and no statement timeout, so connections silently dropped by the
+hosted Postgres proxy surfaced as errors on the next request. DB_PROFILE
+picks a named set of engine options, each overridable from the environment:
+
+  postgres   direct PostgreSQL: QueuePool with pre-ping, recycle, TCP
+             keepalives and a server-side statement_timeout
+  pgbouncer  PgBouncer in transaction mode: shorter recycle, no startup
+             options (PgBouncer rejects them), statement_timeout applied
+             per transaction with SET LOCAL
+  sqlite     SQLite file in WAL mode (synchronous=NORMAL, busy timeout)
+  auto       (default) sqlite for sqlite:// URLs, pgbouncer when the URL
+             uses port 6432 or carries ?pgbouncer=true, otherwise postgres
+
+  DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT (s), DB_POOL_RECYCLE (s),
+  DB_POOL_PRE_PING (1/0), DB_STATEMENT_TIMEOUT_MS (0 disables)
+
+Every pool is a TimedQueuePool, which records how long each checkout waited
+(including opening a new connection) so pool exhaustion shows up in
+/metrics before requests start failing with QueuePool timeouts.
+"""
+
+import logging
+import os
+import sqlite3
+import time
+import weakref
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+PROFILES = {
+    'postgres': {
+        'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 30, 'pool_recycle': 1800,
+        'pool_pre_ping': True, 'statement_timeout_ms': 30000,
+    },
+    'pgbouncer': {
+        'pool_size': 5, 'max_overflow': 5, 'pool_timeout': 30, 'pool_recycle': 300,
+        'pool_pre_ping': True, 'statement_timeout_ms': 30000,
+    },
+    'sqlite': {
+        'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 30, 'pool_recycle': -1,
+        'pool_pre_ping': False, 'statement_timeout_ms': 0,
+    },
+}
+
+# Pool checkout waits are usually sub-millisecond; the tail is what matters
+CHECKOUT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+_pools = weakref.WeakSet()
+_observers = []  # fn(wait_seconds, timed_out)
+
+
+def add_pool_observer(fn):
+    _observers.append(fn)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports checkout wait time to the registered observers."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _pools.add(self)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            for fn in _observers:
+                try:
+                    fn(waited, timed_out)
+                except Exception:
+                    pass
+
+
+def pool_stats():
+    """Current size / checked-out / overflow for every live pool in this worker."""
+    return [{'size': p.size(), 'checked_out': p.checkedout(), 'checked_in': p.checkedin(),
+             'overflow': max(0, p.overflow())} for p in list(_pools)]
+
+
+class EngineProfile:
+    def __init__(self, name, url, options, statement_timeout_ms):
+        self.name = name
+        self.url = url
+        self.options = options
+        self.statement_timeout_ms = statement_timeout_ms
+
+    def describe(self):
+        shown = {k: v for k, v in self.options.items() if k not in ('connect_args', 'poolclass')}
+        return f"profile={self.name} {' '.join(f'{k}={v}' for k, v in sorted(shown.items()))} " \
+               f"statement_timeout_ms={self.statement_timeout_ms}"
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    return value.strip().lower() in ('1', 'true', 'yes', 'on') if value not in (None, '') else default
+
+
+def resolve_profile(database_url):
+    """Normalised URL plus engine options for DB_PROFILE and the DB_* overrides."""
+    # SQLAlchemy 1.4 no longer accepts the postgres:// scheme many hosts hand out
+    if database_url.startswith('postgres://'):
+        database_url = 'postgresql://' + database_url[len('postgres://'):]
+    url = make_url(database_url)
+    name = os.getenv('DB_PROFILE', 'auto').strip().lower()
+    pgbouncer_flag = url.query.get('pgbouncer')
+    if pgbouncer_flag is not None:
+        url = url.difference_update_query(['pgbouncer'])  # not a libpq parameter
+    if name == 'auto':
+        if url.get_backend_name() == 'sqlite':
+            name = 'sqlite'
+        elif url.port == 6432 or str(pgbouncer_flag).lower() in ('1', 'true'):
+            name = 'pgbouncer'
+        else:
+            name = 'postgres'
+    if name not in PROFILES:
+        raise ValueError(f"unknown DB_PROFILE {name!r} (expected one of {', '.join(PROFILES)} or auto)")
+
+    defaults = PROFILES[name]
+    statement_timeout_ms = _env_int('DB_STATEMENT_TIMEOUT_MS', defaults['statement_timeout_ms'])
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': _env_int('DB_POOL_SIZE', defaults['pool_size']),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', defaults['max_overflow']),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', defaults['pool_timeout']),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', defaults['pool_recycle']),
+        'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', defaults['pool_pre_ping']),
+    }
+    if name == 'sqlite':
+        if url.database in (None, '', ':memory:'):
+            # One shared in-memory database; keep SQLAlchemy's own pool choice
+            return EngineProfile(name, url, {}, 0)
+        options['connect_args'] = {'check_same_thread': False, 'timeout': 15}
+    elif name == 'postgres':
+        connect_args = {'connect_timeout': 10, 'keepalives': 1, 'keepalives_idle': 30,
+                        'keepalives_interval': 10, 'keepalives_count': 3}
+        if statement_timeout_ms:
+            connect_args['options'] = f'-c statement_timeout={statement_timeout_ms}'
+        options['connect_args'] = connect_args
+    else:
+        options['connect_args'] = {'connect_timeout': 10}
+    return EngineProfile(name, url, options, statement_timeout_ms)
+
+
+def configure_database(app, database_url):
+    """Set SQLALCHEMY_DATABASE_URI / SQLALCHEMY_ENGINE_OPTIONS; call before db.init_app."""
+    profile = resolve_profile(database_url)
+    app.config['SQLALCHEMY_DATABASE_URI'] = profile.url.render_as_string(hide_password=False)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = profile.options
+    logger.info(f"[DB] {profile.describe()}")
+    return profile
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+    finally:
+        cursor.close()
+
+
+def install_engine_hooks(engine, profile):
+    """Per-connection settings that cannot be expressed as engine options."""
+    if profile.name == 'sqlite' and profile.options:
+        event.listen(engine, 'connect', _sqlite_pragmas)
+    elif profile.name == 'pgbouncer' and profile.statement_timeout_ms:
+        statement = f'SET LOCAL statement_timeout = {int(profile.statement_timeout_ms)}'
+
+        @event.listens_for(engine, 'begin')
+        def _statement_timeout(conn):
+            # Session-level SET would leak to other clients' server connections
+            conn.exec_driver_sql(statement)
+
+
+def instrument_pool(registry):
+    """Checkout wait histogram, timeout counter and pool occupancy gauges."""
+    registry.histogram('db_pool_checkout_wait_seconds', 'Time to obtain a pooled DB connection (includes connecting).')
+    registry.counter('db_pool_checkout_timeouts_total', 'Checkouts that gave up after DB_POOL_TIMEOUT.')
+    registry.gauge('db_pool_connections', 'Pooled DB connections by state.', lambda: [
+        ((('state', state),), sum(s[state] for s in pool_stats()))
+        for state in ('checked_out', 'checked_in', 'overflow')
+    ])
+
+    def _observe(waited, timed_out):
+        registry.observe('db_pool_checkout_wait_seconds', waited, buckets=CHECKOUT_BUCKETS)
+        if timed_out:
+            registry.inc('db_pool_checkout_timeouts_total')
+
+    add_pool_observer(_observe)
@@ -0,0 +1,204 @@
+"""
+Asynchronous email dispatch.
+
+Resend calls are HTTP round trips; doing them inline holds a sync gunicorn
+worker for the whole call. EmailDispatcher puts messages on a bounded queue
+served by a small pool of daemon threads and hands callers a Future they can
+optionally wait on. Per-message queue wait and send latency are recorded.
+
+Set EMAIL_ASYNC=0 to send inline (the returned handle is already resolved).
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+
+class EmailQueueFull(Exception):
+    """Raised when the send queue is at capacity (caller should fail fast)."""
+
+
+def _detach_user(user):
+    """Copy the fields email templates read so no ORM object crosses threads."""
+    if user is None:
+        return None
+    return SimpleNamespace(
+        id=getattr(user, 'id', None),
+        email=getattr(user, 'email', None),
+        name=getattr(user, 'name', None),
+        referral_code=getattr(user, 'referral_code', None),
+    )
+
+
+class EmailDispatcher:
+    def __init__(self, service, workers=2, max_queue=100, enabled=True, history=200):
+        self.service = service
+        self.workers = max(1, int(workers))
+        self.max_queue = max(1, int(max_queue))
+        self.enabled = enabled
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._stats = {}  # kind -> counters
+        self._recent = deque(maxlen=history)
+        self._observers = []  # fn(kind, wait_ms, send_ms, ok, rejected), e.g. metrics
+
+    # ---------- public API (mirrors email_service) ----------
+    def send_otp_email(self, recipient_email, otp_code, user=None):
+        return self.submit('otp', self.service.send_otp_email, recipient_email, otp_code, _detach_user(user))
+
+    def send_magic_link(self, recipient_email, url, user=None):
+        return self.submit('magic_link', self.service.send_magic_link, recipient_email, url, _detach_user(user))
+
+    def send_referral_notification(self, referrer_email, referred_email, referral_status):
+        return self.submit('referral_notification', self.service.send_referral_notification,
+                           referrer_email, referred_email, referral_status)
+
+    @property
+    def from_email(self):
+        return self.service.from_email
+
+    def submit(self, kind, fn, *args):
+        """Queue fn(*args) and return a Future resolving to its return value."""
+        handle = Future()
+        job = (kind, fn, args, handle, time.perf_counter())
+        if not self.enabled:
+            self._run(job)
+            return handle
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._record(kind, 0.0, 0.0, ok=False, rejected=True)
+            raise EmailQueueFull(f'email queue full ({self.max_queue})')
+        return handle
+
+    def add_observer(self, fn):
+        """Call fn(kind, wait_ms, send_ms, ok, rejected) for every recorded message."""
+        self._observers.append(fn)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        """Snapshot of per-kind counters and recent per-message latencies (ms)."""
+        with self._lock:
+            kinds = {}
+            for kind, s in self._stats.items():
+                done = s['sent'] + s['failed']
+                kinds[kind] = dict(s, avg_send_ms=round(s['send_ms_total'] / done, 2) if done else 0.0)
+            return {
+                'async': self.enabled,
+                'workers': self.workers,
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self.max_queue,
+                'kinds': kinds,
+                'recent': list(self._recent),
+            }
+
+    def shutdown(self, timeout=10.0):
+        """Drain queued messages (best effort, bounded by timeout) and stop workers."""
+        if not self._threads or self._pid != os.getpid():
+            return
+        self._stopping = True
+        deadline = time.monotonic() + timeout
+        for _ in self._threads:
+            try:
+                self._queue.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+
+    # ---------- internals ----------
+    def _ensure_started(self):
+        # Threads do not survive fork; (re)start lazily in each gunicorn worker
+        if self._pid == os.getpid() and self._threads:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._threads:
+                return
+            self._pid = os.getpid()
+            self._stopping = False
+            self._threads = []
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f'email-dispatch-{i}', daemon=True)
+                t.start()
+                self._threads.append(t)
+            logger.info(f"[Email] dispatcher started workers={self.workers} queue={self.max_queue} pid={self._pid}")
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job):
+        kind, fn, args, handle, queued_at = job
+        if not handle.set_running_or_notify_cancel():
+            return
+        started = time.perf_counter()
+        wait_ms = (started - queued_at) * 1000.0
+        try:
+            result = fn(*args)
+        except Exception as e:
+            send_ms = (time.perf_counter() - started) * 1000.0
+            self._record(kind, wait_ms, send_ms, ok=False)
+            logger.warning(f"[Email] {kind} raised after {send_ms:.0f}ms: {e}")
+            handle.set_exception(e)
+            return
+        send_ms = (time.perf_counter() - started) * 1000.0
+        ok = result is not False
+        self._record(kind, wait_ms, send_ms, ok=ok)
+        # Callers do not wait for the result, so this log (and the counters) is where failures show up
+        logger.log(logging.INFO if ok else logging.WARNING,
+                   f"[Email] {kind} ok={ok} wait_ms={wait_ms:.1f} send_ms={send_ms:.1f}")
+        handle.set_result(result)
+
+    def _record(self, kind, wait_ms, send_ms, ok, rejected=False):
+        for fn in self._observers:
+            try:
+                fn(kind, wait_ms, send_ms, ok, rejected)
+            except Exception as e:
+                logger.debug(f"[Email] observer failed: {e}")
+        with self._lock:
+            s = self._stats.setdefault(kind, {
+                'sent': 0, 'failed': 0, 'rejected': 0,
+                'send_ms_total': 0.0, 'send_ms_max': 0.0, 'wait_ms_max': 0.0,
+            })
+            if rejected:
+                s['rejected'] += 1
+                return
+            s['sent' if ok else 'failed'] += 1
+            s['send_ms_total'] += send_ms
+            s['send_ms_max'] = max(s['send_ms_max'], send_ms)
+            s['wait_ms_max'] = max(s['wait_ms_max'], wait_ms)
+            self._recent.append({
+                'kind': kind, 'ok': ok, 'at': time.time(),
+                'wait_ms': round(wait_ms, 2), 'send_ms': round(send_ms, 2),
+            })
+
+
+def create_dispatcher(service):
+    dispatcher = EmailDispatcher(
+        service,
+        workers=os.getenv('EMAIL_WORKERS', '2'),
+        max_queue=os.getenv('EMAIL_QUEUE_SIZE', '100'),
+        enabled=os.getenv('EMAIL_ASYNC', '1').lower() in ('1', 'true', 'yes', 'on'),
+    )
+    atexit.register(dispatcher.shutdown)
+    return dispatcher
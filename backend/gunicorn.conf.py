@@ -1,8 +1,59 @@
 # Gunicorn configuration for production
+import os
+
+# WORKER_MODE=gevent (or eventlet) serves /qr/stream and Socket.IO from
+# cooperative workers, so idle display connections cost a greenlet instead of
+# a whole worker. Install backend/requirements-async.txt for these modes.
+worker_mode = os.getenv('WORKER_MODE', 'sync').strip().lower()
+
 bind = "0.0.0.0:10000"
-workers = 2
 timeout = 120
 keepalive = 2
 max_requests = 1000
 max_requests_jitter = 50
-worker_class = "sync"
\ No newline at end of file
+
+if worker_mode in ('gevent', 'eventlet'):
+    worker_class = worker_mode
+    if worker_mode == 'gevent':
+        try:
+            import geventwebsocket  # noqa: F401  (enables the websocket transport)
+            worker_class = "geventwebsocket.gunicorn.workers.GeventWebSocketWorker"
+        except ImportError:
+            pass  # Socket.IO falls back to long-polling
+    # One cooperative worker holds thousands of connections; more workers need
+    # SOCKETIO_MESSAGE_QUEUE and sticky sessions for Socket.IO long-polling
+    workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+    worker_connections = int(os.getenv('WORKER_CONNECTIONS', '1000'))
+    # Recycling would drop every open display connection at once
+    max_requests = int(os.getenv('MAX_REQUESTS', '0'))
+else:
+    workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+    worker_class = "sync"
+
+
+def on_starting(server):
+    # Apply schema migrations once in the master, before any worker imports
+    # the app (MIGRATE_ON_START=0 when a release step runs migrate.py instead)
+    if os.getenv('MIGRATE_ON_START', '1') == '0':
+        return
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from migrate import run
+    applied = run()
+    server.log.info(f"Schema migrations applied: {applied or 'none pending'}")
+
+
+def post_worker_init(worker):
+    # psycopg2 blocks the event loop unless it yields while waiting on the socket
+    if worker_mode == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            worker.log.warning("psycogreen not installed: PostgreSQL calls will block the gevent loop")
+    elif worker_mode == 'eventlet':
+        try:
+            from psycogreen.eventlet import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            worker.log.warning("psycogreen not installed: PostgreSQL calls will block the eventlet hub")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Rate-limit counter storage shared by all gunicorn workers.
+
+Flask-Limiter's default memory:// storage is per process, so "5 per minute"
+really means 5 x workers and counters reset on every max_requests recycle.
+Importing this module registers a ``sqlite://`` storage scheme with the
+``limits`` library: fixed-window counters live in a WAL-mode SQLite file
+(on /dev/shm by default, i.e. shared memory) and each hit is one atomic
+UPSERT ... RETURNING. For several hosts use the built-in ``redis://`` scheme.
+
+  RATELIMIT_STORAGE_URI  sqlite:////dev/shm/referral_ratelimit.sqlite3 (default)
+                         | redis://host:6379/0 | memory://
+
+Run `python limiter_storage.py` to benchmark per-request limiter overhead for
+each available backend.
+"""
+
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from limits.storage import Storage
+
+
+def default_storage_uri():
+    base = '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else tempfile.gettempdir()
+    return 'sqlite:///' + os.path.join(base, 'referral_ratelimit.sqlite3')
+
+
+class SQLiteStorage(Storage):
+    """Fixed-window rate-limit counters in a local SQLite file."""
+
+    STORAGE_SCHEME = ['sqlite']
+
+    # Purge expired counters on roughly one in PURGE_EVERY increments
+    PURGE_EVERY = 500
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        # SQLAlchemy-style: sqlite:///relative.db or sqlite:////absolute.db
+        self.path = uri[len('sqlite:///'):] if uri and uri.startswith('sqlite:///') else default_storage_uri()[10:]
+        self._local = threading.local()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self._conn().execute(
+            'CREATE TABLE IF NOT EXISTS ratelimit (k TEXT PRIMARY KEY, n INTEGER NOT NULL, expires_at REAL NOT NULL)'
+        )
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')  # counters are disposable
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            'INSERT INTO ratelimit (k, n, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(k) DO UPDATE SET '
+            '  n = CASE WHEN expires_at <= ? THEN excluded.n ELSE n + excluded.n END, '
+            '  expires_at = CASE WHEN expires_at <= ? OR ? THEN excluded.expires_at ELSE expires_at END '
+            'RETURNING n',
+            (key, amount, now + expiry, now, now, 1 if elastic_expiry else 0),
+        ).fetchone()
+        if random.randrange(self.PURGE_EVERY) == 0:
+            conn.execute('DELETE FROM ratelimit WHERE expires_at <= ?', (now,))
+        return row[0]
+
+    def get(self, key):
+        row = self._conn().execute(
+            'SELECT n FROM ratelimit WHERE k = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = self._conn().execute(
+            'SELECT expires_at FROM ratelimit WHERE k = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self):
+        try:
+            self._conn().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self._conn().execute('DELETE FROM ratelimit').rowcount
+
+    def clear(self, key):
+        self._conn().execute('DELETE FROM ratelimit WHERE k = ?', (key,))
+
+
+def benchmark(uri, requests=2000):
+    """Average per-request overhead (µs) of a '100000 per minute' limit on `uri`."""
+    from flask import Flask
+    from flask_limiter import Limiter
+    from flask_limiter.util import get_remote_address
+
+    bench_app = Flask(f'bench-{uri.split(":")[0]}')
+    limiter = Limiter(get_remote_address, app=bench_app, storage_uri=uri, default_limits=None)
+
+    @bench_app.route('/plain')
+    def plain():
+        return 'ok'
+
+    @bench_app.route('/limited')
+    @limiter.limit('100000 per minute')
+    def limited():
+        return 'ok'
+
+    client = bench_app.test_client()
+    timings = {}
+    for path in ('/plain', '/limited'):
+        for _ in range(100):  # warm up
+            client.get(path)
+        start = time.perf_counter()
+        for _ in range(requests):
+            client.get(path)
+        timings[path] = (time.perf_counter() - start) / requests * 1e6
+    limiter.reset()
+    return round(timings['/limited'] - timings['/plain'], 1), round(timings['/plain'], 1)
+
+
+if __name__ == '__main__':
+    # Separate file so the benchmark never touches live counters
+    uris = ['memory://', default_storage_uri().replace('referral_ratelimit', 'referral_ratelimit_bench')]
+    if os.getenv('REDIS_URL'):
+        uris.append(os.getenv('REDIS_URL'))
+    print("⏱️  Flask-Limiter per-request overhead")
+    for uri in uris:
+        try:
+            overhead, base = benchmark(uri)
+            print(f"  {uri:<55} +{overhead:>7} µs/request (baseline {base} µs)")
+        except Exception as e:
+            print(f"  {uri:<55} unavailable: {e}")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Load test: hold many concurrent /qr/stream connections and check that API
+latency stays flat and QR events still reach every stream.
+
+  1. Measures /health latency with no streams open (baseline).
+  2. Opens --streams concurrent SSE connections and waits for their first byte.
+  3. Measures /health latency again while all streams stay open.
+  4. Hits /qr/login once and times how long until every stream sees the event.
+
+Run against a running server, e.g.
+  WORKER_MODE=gevent gunicorn --config gunicorn.conf.py app:app
+  python load_test_streams.py --url http://127.0.0.1:10000 --streams 500
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from urllib.parse import urlsplit
+
+
+async def _request(host, port, path, read_body=True):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    if read_body:
+        await reader.read()
+    writer.close()
+    return int(status_line.split()[1])
+
+
+async def measure_latency(host, port, samples, concurrency=4):
+    """p50/p95/max (ms) of GET /health, with a few requests in flight at once."""
+    timings, failures = [], 0
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal failures
+        async with sem:
+            start = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(_request(host, port, '/health'), timeout=10)
+                if status != 200:
+                    failures += 1
+            except Exception:
+                failures += 1
+                return
+            timings.append((time.perf_counter() - start) * 1000.0)
+
+    await asyncio.gather(*(one() for _ in range(samples)))
+    if not timings:
+        return {'ok': 0, 'failed': failures}
+    timings.sort()
+    return {
+        'ok': len(timings),
+        'failed': failures,
+        'p50_ms': round(statistics.median(timings), 1),
+        'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 1),
+        'max_ms': round(timings[-1], 1),
+    }
+
+
+class Stream:
+    def __init__(self):
+        self.reader = self.writer = None
+        self.opened = False
+        self.event_at = None
+
+    async def open(self, host, port):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.write(f'GET /qr/stream HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n'.encode())
+        await self.writer.drain()
+        await self.reader.readuntil(b'\r\n\r\n')  # response headers
+        await self.reader.readuntil(b'\n\n')      # opening comment
+        self.opened = True
+
+    async def wait_for_event(self):
+        while True:
+            chunk = await self.reader.readuntil(b'\n\n')
+            if b'data:' in chunk:
+                self.event_at = time.perf_counter()
+                return
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def main(url, streams, samples, open_timeout):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+
+    baseline = await measure_latency(host, port, samples)
+    print(f"baseline /health: {baseline}")
+
+    conns = [Stream() for _ in range(streams)]
+    start = time.perf_counter()
+    results = await asyncio.gather(*(asyncio.wait_for(c.open(host, port), open_timeout) for c in conns),
+                                   return_exceptions=True)
+    opened = [c for c in conns if c.opened]
+    print(f"streams open: {len(opened)}/{streams} in {time.perf_counter() - start:.1f}s"
+          + (f" (first error: {next(r for r in results if isinstance(r, Exception))!r})"
+             if len(opened) < streams else ''))
+
+    loaded = await measure_latency(host, port, samples)
+    print(f"/health with {len(opened)} streams open: {loaded}")
+
+    waiters = [asyncio.ensure_future(c.wait_for_event()) for c in opened]
+    published = time.perf_counter()
+    await _request(host, port, '/qr/login')
+    done, pending = await asyncio.wait(waiters, timeout=10)
+    delays = sorted((c.event_at - published) * 1000.0 for c in opened if c.event_at)
+    for w in pending:
+        w.cancel()
+    if delays:
+        print(f"qr event fan-out: {len(delays)}/{len(opened)} streams, "
+              f"p50 {statistics.median(delays):.1f} ms, max {delays[-1]:.1f} ms")
+    else:
+        print(f"qr event fan-out: 0/{len(opened)} streams received the event")
+
+    for c in conns:
+        c.close()
+
+    flat = loaded.get('ok') and baseline.get('ok') and loaded['p95_ms'] <= max(5 * baseline['p95_ms'], baseline['p95_ms'] + 50)
+    ok = len(opened) == streams and not loaded['failed'] and flat and len(delays) == len(opened)
+    print("✅ API latency stayed flat with all streams open" if ok else "❌ streams or API latency degraded")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:10000')
+    parser.add_argument('--streams', type=int, default=500)
+    parser.add_argument('--samples', type=int, default=200)
+    parser.add_argument('--open-timeout', type=float, default=30.0)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.url, args.streams, args.samples, args.open_timeout)))
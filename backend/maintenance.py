@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Scheduled maintenance: set-based pruning of stale auth tokens.
+
+Runs bounded DELETE ... WHERE id IN (SELECT ... LIMIT n) batches, each in its
+own short transaction, so cleanup never happens inside a user's request and
+never holds long locks. Deletes are idempotent, so overlapping runs from
+several gunicorn workers are harmless.
+
+  - OTP tokens: expired, or already used.
+  - Onboarding tokens: never opened and expired for longer than
+    ONBOARDING_TOKEN_RETENTION_DAYS (opened tokens stay valid and are the
+    admin's QR generation history, so they are kept).
+
+Run once from cron / a pre-start hook with: python maintenance.py
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select, or_
+
+from models import db, OTPToken, OnboardingToken
+
+logger = logging.getLogger(__name__)
+
+
+def _delete_in_batches(model, pk, condition, batch_size, max_batches):
+    """Delete rows matching condition in batches; return total rows removed."""
+    total = 0
+    for _ in range(max_batches):
+        ids = select(pk).where(condition).limit(batch_size)
+        stmt = delete(model).where(pk.in_(ids)).execution_options(synchronize_session=False)
+        with db.engine.begin() as conn:
+            deleted = conn.execute(stmt).rowcount or 0
+        total += deleted
+        if deleted < batch_size:
+            break
+    return total
+
+
+def prune_tokens(batch_size=500, max_batches=20, onboarding_retention_days=30):
+    """Prune stale OTP and onboarding tokens. Must run inside an app context."""
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    otp_pruned = _delete_in_batches(
+        OTPToken, OTPToken.id,
+        or_(OTPToken.expires_at < now, OTPToken.used.is_(True)),
+        batch_size, max_batches,
+    )
+    onboarding_cutoff = now - timedelta(days=onboarding_retention_days)
+    onboarding_pruned = _delete_in_batches(
+        OnboardingToken, OnboardingToken.jti,
+        (OnboardingToken.used_at.is_(None)) & (OnboardingToken.expires_at < onboarding_cutoff),
+        batch_size, max_batches,
+    )
+    return {
+        'ran_at': now.isoformat(),
+        'otp_tokens': otp_pruned,
+        'onboarding_tokens': onboarding_pruned,
+        'duration_ms': round((time.perf_counter() - started) * 1000.0, 1),
+    }
+
+
+class MaintenanceScheduler:
+    """Background thread that calls prune_tokens() every `interval` seconds."""
+
+    def __init__(self, app, interval=900, batch_size=500, max_batches=20,
+                 onboarding_retention_days=30, history=50):
+        self.app = app
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.onboarding_retention_days = onboarding_retention_days
+        self.runs = deque(maxlen=history)
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def run_once(self):
+        with self.app.app_context():
+            try:
+                result = prune_tokens(self.batch_size, self.max_batches, self.onboarding_retention_days)
+            except Exception as e:
+                result = {'ran_at': datetime.utcnow().isoformat(), 'error': str(e)}
+                logger.warning(f"[Maintenance] token prune failed: {e}")
+            else:
+                logger.info(
+                    f"[Maintenance] pruned otp_tokens={result['otp_tokens']} "
+                    f"onboarding_tokens={result['onboarding_tokens']} in {result['duration_ms']}ms"
+                )
+        self.runs.append(result)
+        return result
+
+    def start(self):
+        if self.interval <= 0:
+            logger.info("[Maintenance] scheduler disabled (MAINTENANCE_INTERVAL<=0)")
+            return
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        # Jittered first run so workers booted together do not align
+        if self._stop.wait(random.uniform(5, min(60, self.interval))):
+            return
+        while True:
+            self.run_once()
+            if self._stop.wait(self.interval):
+                return
+
+
+def create_scheduler(app):
+    return MaintenanceScheduler(
+        app,
+        interval=int(os.getenv('MAINTENANCE_INTERVAL', '900')),
+        batch_size=int(os.getenv('MAINTENANCE_BATCH_SIZE', '500')),
+        max_batches=int(os.getenv('MAINTENANCE_MAX_BATCHES', '20')),
+        onboarding_retention_days=int(os.getenv('ONBOARDING_TOKEN_RETENTION_DAYS', '30')),
+    )
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    from app import app
+    print(create_scheduler(app).run_once())
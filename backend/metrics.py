@@ -0,0 +1,333 @@
+"""
+Prometheus-style metrics aggregated across gunicorn workers.
+
+Each worker keeps cumulative counters and histograms in memory (a dict update
+under a lock per observation) and periodically writes its current totals to a
+shared WAL-mode SQLite file, one row per series keyed by process. /metrics
+flushes the serving worker and sums every process's rows, so the numbers are
+host-wide whichever worker answers the scrape.
+
+Rows from workers that have exited (max_requests recycling, restarts) are
+folded into a single "retired" bucket so counters stay monotonic; gauges are
+only summed over live workers.
+
+  METRICS_ENABLED          1 (default) | 0
+  METRICS_PATH             sqlite file (default /dev/shm/referral_metrics.sqlite3)
+  METRICS_FLUSH_INTERVAL   seconds between background flushes (default 10)
+  METRICS_TOKEN            optional bearer token accepted by /metrics
+  METRICS_ALLOWED_NETWORKS comma-separated CIDRs allowed without auth
+                           (default 127.0.0.1/32,::1/128 outside production,
+                           none with FLASK_ENV=production: behind a reverse
+                           proxy on the same host every client looks like
+                           127.0.0.1, so production needs the token or an
+                           admin session unless networks are listed here)
+"""
+
+import atexit
+import hmac
+import ipaddress
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RETIRED_PROC = 'retired'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def default_metrics_path():
+    base = '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else tempfile.gettempdir()
+    return os.path.join(base, 'referral_metrics.sqlite3')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labelstr(labels):
+    return ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+
+
+def _fmt(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _sort_key(row):
+    # Group each labelled series together with its buckets in numeric le order
+    family, name, labels, _ = row
+    if name.endswith('_bucket') and 'le="' in labels:
+        base, _, le = labels.rpartition('le="')
+        return (family, base.rstrip(','), 0, name, float(le.rstrip('"').replace('+Inf', 'inf')))
+    return (family, labels, 1, name, 0.0)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsRegistry:
+    def __init__(self, path, flush_interval=10.0):
+        self.path = path
+        self.flush_interval = float(flush_interval)
+        self._families = {}   # family -> (type, help)
+        self._series = {}     # (family, name, labelstr) -> value
+        self._gauges = {}     # family -> callback() -> iterable of (labels, value)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._thread = None
+        self._pid = None
+        self._proc = None
+        with self._txn() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS samples ('
+                ' proc TEXT NOT NULL, family TEXT NOT NULL, name TEXT NOT NULL, labels TEXT NOT NULL,'
+                ' kind TEXT NOT NULL, value REAL NOT NULL, PRIMARY KEY (proc, name, labels))'
+            )
+            conn.execute('CREATE TABLE IF NOT EXISTS procs (proc TEXT PRIMARY KEY, pid INTEGER NOT NULL, seen REAL NOT NULL)')
+        self._proc_id()
+
+    # ---------- definition ----------
+    def counter(self, family, help_text):
+        self._families[family] = ('counter', help_text)
+
+    def histogram(self, family, help_text):
+        self._families[family] = ('histogram', help_text)
+
+    def gauge(self, family, help_text, callback):
+        """Register a gauge whose samples are read from callback() at flush time."""
+        self._families[family] = ('gauge', help_text)
+        self._gauges[family] = callback
+
+    # ---------- recording ----------
+    def inc(self, family, labels=(), value=1.0):
+        key = (family, family, _labelstr(labels))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + value
+
+    def observe(self, family, value, labels=(), buckets=DEFAULT_BUCKETS):
+        base = _labelstr(labels)
+        prefix = base + ',' if base else ''
+        with self._lock:
+            series = self._series
+            for le in buckets:
+                key = (family, family + '_bucket', f'{prefix}le="{_fmt(le)}"')
+                series[key] = series.get(key, 0.0) + (1 if value <= le else 0)
+            for key, amount in (((family, family + '_bucket', prefix + 'le="+Inf"'), 1),
+                                ((family, family + '_sum', base), value),
+                                ((family, family + '_count', base), 1)):
+                series[key] = series.get(key, 0.0) + amount
+
+    # ---------- cross-process storage ----------
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')  # metrics are disposable
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _txn(self):
+        # IMMEDIATE: take the write lock up front so concurrent scrapes serialize cleanly
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _proc_id(self):
+        # pid plus start time, so a recycled pid never overwrites a dead worker's totals
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._series = {}
+                    self._pid = os.getpid()
+                    self._proc = f'{self._pid}:{time.time():.6f}'
+        return self._proc
+
+    def flush(self):
+        proc = self._proc_id()
+        with self._lock:
+            rows = [(proc, family, name, labels, 'counter', value)
+                    for (family, name, labels), value in self._series.items()]
+        for family, callback in self._gauges.items():
+            try:
+                rows.extend((proc, family, family, _labelstr(labels), 'gauge', value)
+                            for labels, value in callback())
+            except Exception as e:
+                logger.debug(f"[Metrics] gauge {family} failed: {e}")
+        with self._txn() as conn:
+            conn.execute("DELETE FROM samples WHERE proc = ? AND kind = 'gauge'", (proc,))
+            conn.executemany('INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?)', rows)
+            conn.execute('INSERT OR REPLACE INTO procs VALUES (?, ?, ?)', (proc, self._pid, time.time()))
+
+    def _retire_dead(self, conn):
+        dead = [proc for proc, pid in conn.execute('SELECT proc, pid FROM procs') if not _pid_alive(pid)]
+        for proc in dead:
+            conn.execute(
+                "INSERT INTO samples SELECT ?, family, name, labels, kind, value FROM samples "
+                "WHERE proc = ? AND kind = 'counter' "
+                "ON CONFLICT(proc, name, labels) DO UPDATE SET value = value + excluded.value",
+                (RETIRED_PROC, proc),
+            )
+            conn.execute('DELETE FROM samples WHERE proc = ?', (proc,))
+            conn.execute('DELETE FROM procs WHERE proc = ?', (proc,))
+
+    def collect(self):
+        """Flush this worker, then render host-wide totals in Prometheus text format."""
+        self.flush()
+        with self._txn() as conn:
+            self._retire_dead(conn)
+            # Gauges only from workers that flushed recently (guards against pid reuse)
+            rows = conn.execute(
+                'SELECT s.family, s.name, s.labels, SUM(s.value) FROM samples s '
+                'LEFT JOIN procs p ON p.proc = s.proc '
+                "WHERE s.kind = 'counter' OR p.seen >= ? "
+                'GROUP BY s.family, s.name, s.labels',
+                (time.time() - 3 * max(self.flush_interval, 1.0),),
+            ).fetchall()
+        lines = []
+        current = None
+        for family, name, labels, value in sorted(rows, key=_sort_key):
+            if family != current:
+                current = family
+                kind, help_text = self._families.get(family, ('untyped', ''))
+                lines.append(f'# HELP {family} {help_text}')
+                lines.append(f'# TYPE {family} {kind}')
+            lines.append(f'{name}{{{labels}}} {_fmt(value)}' if labels else f'{name} {_fmt(value)}')
+        return '\n'.join(lines) + '\n'
+
+    # ---------- background flush ----------
+    def start(self):
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._proc_id()
+        self._thread = threading.Thread(target=self._loop, name='metrics-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self._flush_quietly)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self._flush_quietly()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning(f"[Metrics] flush failed: {e}")
+
+
+def _allowed_networks():
+    default = '' if os.getenv('FLASK_ENV') == 'production' else '127.0.0.1/32,::1/128'
+    raw = os.getenv('METRICS_ALLOWED_NETWORKS', default)
+    nets = []
+    for part in raw.split(','):
+        part = part.strip()
+        if part:
+            try:
+                nets.append(ipaddress.ip_network(part, strict=False))
+            except ValueError:
+                logger.warning(f"[Metrics] ignoring invalid network {part!r}")
+    return nets
+
+
+_networks = None  # parsed on first use, after .env has been loaded
+
+
+def metrics_access_allowed():
+    """Bearer METRICS_TOKEN or a client address inside METRICS_ALLOWED_NETWORKS."""
+    global _networks
+    token = os.getenv('METRICS_TOKEN')
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    if _networks is None:
+        _networks = _allowed_networks()
+    try:
+        addr = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    return any(addr in net for net in _networks)
+
+
+def init_metrics(app, registry, db_stats=None):
+    """Record per-route request counts, status codes, latency and DB usage."""
+    registry.counter('http_requests_total', 'HTTP requests by route, method and status.')
+    registry.histogram('http_request_duration_seconds', 'HTTP request latency by route and method.')
+    registry.counter('http_request_db_queries_total', 'SQL statements executed while serving requests, by route.')
+    registry.counter('http_request_db_seconds_total', 'Time spent in SQL statements while serving requests, by route.')
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _metrics_record(response):
+        started = g.get('_metrics_started')
+        if started is None:
+            return response
+        rule = request.url_rule
+        route = rule.rule if rule is not None else 'unmatched'
+        registry.inc('http_requests_total', (('route', route), ('method', request.method),
+                                             ('status', response.status_code)))
+        registry.observe('http_request_duration_seconds', time.perf_counter() - started,
+                         (('route', route), ('method', request.method)))
+        if db_stats is not None:
+            queries, db_ms = db_stats()
+            if queries:
+                registry.inc('http_request_db_queries_total', (('route', route),), queries)
+                registry.inc('http_request_db_seconds_total', (('route', route),), db_ms / 1000.0)
+        return response
+
+    registry.start()
+    return registry
+
+
+def instrument_email(registry, dispatcher):
+    """Record Resend send latency and queue wait from the email dispatcher."""
+    registry.histogram('email_send_duration_seconds', 'Email provider call latency by kind.')
+    registry.histogram('email_queue_wait_seconds', 'Time queued before a send started, by kind.')
+    registry.counter('email_messages_total', 'Emails by kind and outcome (sent, failed, rejected).')
+
+    def _observe(kind, wait_ms, send_ms, ok, rejected):
+        if rejected:
+            registry.inc('email_messages_total', (('kind', kind), ('outcome', 'rejected')))
+            return
+        registry.inc('email_messages_total', (('kind', kind), ('outcome', 'sent' if ok else 'failed')))
+        registry.observe('email_send_duration_seconds', send_ms / 1000.0, (('kind', kind),))
+        registry.observe('email_queue_wait_seconds', wait_ms / 1000.0, (('kind', kind),))
+
+    dispatcher.add_observer(_observe)
+
+
+def create_registry():
+    if os.getenv('METRICS_ENABLED', '1').lower() not in ('1', 'true', 'yes', 'on'):
+        return None
+    path = os.getenv('METRICS_PATH') or default_metrics_path()
+    try:
+        return MetricsRegistry(path, flush_interval=float(os.getenv('METRICS_FLUSH_INTERVAL', '10')))
+    except Exception as e:
+        logger.warning(f"[Metrics] disabled: cannot open {path} ({e})")
+        return None
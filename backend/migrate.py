@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations.
+
+app.py used to run db.create_all(), inspect the user / referral tables and
+issue ALTER TABLEs on every worker import, so each boot paid for catalog
+queries and concurrently starting workers raced each other on DDL. Schema
+changes now live here and run once per deploy, before the workers start:
+
+  python migrate.py            apply pending migrations, then seed admin users
+  python migrate.py --status   print the current and pending versions
+
+gunicorn.conf.py runs the same thing from the master's on_starting hook
+(MIGRATE_ON_START=0 disables it when a release step already ran migrate.py).
+
+Applied versions are recorded in the schema_version table. Concurrent runners
+serialise on a lock (pg_advisory_xact_lock on PostgreSQL, so it also works
+through PgBouncer; a lock file next to the database for SQLite) and re-read
+the version once they hold it, so only the first runner applies anything.
+
+Version 1 creates any missing tables from the models, so a fresh database
+already has every column; later column migrations use _add_column, which
+skips columns that exist. Append new migrations to MIGRATIONS; never renumber.
+"""
+
+import argparse
+import contextlib
+import fcntl
+import logging
+import os
+import random
+import string
+import sys
+import zlib
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, create_engine, inspect, select, text
+from sqlalchemy.pool import NullPool
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from db_engine import resolve_profile
+from models import db, User
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATABASE_URL = 'sqlite:///database.db'
+
+# Any fixed 64-bit key; every runner for this schema must use the same one
+ADVISORY_LOCK_KEY = zlib.crc32(b'referral-duluth:schema_version')
+
+_version_metadata = MetaData()
+schema_version = Table(
+    'schema_version', _version_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('applied_at', DateTime, nullable=False, default=datetime.utcnow),
+)
+
+
+def _add_column(conn, table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists."""
+    if column in {c['name'] for c in inspect(conn).get_columns(table)}:
+        return False
+    quoted = conn.dialect.identifier_preparer.quote(table)  # "user" is reserved on PostgreSQL
+    conn.execute(text(f'ALTER TABLE {quoted} ADD COLUMN {column} {ddl}'))
+    logger.info(f"[Migrate] added column {table}.{column}")
+    return True
+
+
+def _initial_schema(conn):
+    db.metadata.create_all(conn)
+
+
+def _user_profile_columns(conn):
+    _add_column(conn, 'user', 'name', 'VARCHAR(100)')
+    _add_column(conn, 'user', 'signed_up_by_staff', 'VARCHAR(50)')
+    _add_column(conn, 'user', 'phone', 'VARCHAR(30)')
+    _add_column(conn, 'user', 'password_hash', 'VARCHAR(255)')
+    _add_column(conn, 'user', 'password_set_at', 'TIMESTAMP')
+
+
+def _referral_staff_and_origin(conn):
+    _add_column(conn, 'referral', 'signed_up_by_staff', 'VARCHAR(50)')
+    _add_column(conn, 'referral', 'origin', "VARCHAR(20) DEFAULT 'link'")
+
+
+def _onboarding_token_generated_by(conn):
+    _add_column(conn, 'onboarding_token', 'generated_by_admin_id', 'INTEGER REFERENCES "user"(id)')
+    conn.execute(text('CREATE INDEX IF NOT EXISTS idx_onboarding_token_generated_by_admin_id '
+                      'ON onboarding_token (generated_by_admin_id)'))
+
+
+# (version, name, fn(connection)) in the order they must run
+MIGRATIONS = [
+    (1, 'initial_schema', _initial_schema),
+    (2, 'user_profile_columns', _user_profile_columns),
+    (3, 'referral_staff_and_origin', _referral_staff_and_origin),
+    (4, 'onboarding_token_generated_by_admin_id', _onboarding_token_generated_by),
+]
+
+
+def create_migration_engine(database_url=None):
+    """Unpooled engine for DATABASE_URL with the profile's connect arguments."""
+    profile = resolve_profile(database_url or os.getenv('DATABASE_URL', DEFAULT_DATABASE_URL))
+    connect_args = dict(profile.options.get('connect_args', {}))
+    connect_args.pop('options', None)  # no statement_timeout while waiting for the lock or running DDL
+    return create_engine(profile.url, poolclass=NullPool, connect_args=connect_args)
+
+
+@contextlib.contextmanager
+def _sqlite_lock(engine):
+    path = engine.url.database
+    if path in (None, '', ':memory:'):
+        yield
+        return
+    with open(os.path.abspath(path) + '.migrate-lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _applied_versions(conn):
+    return {row[0] for row in conn.execute(select(schema_version.c.version))}
+
+
+def current_version(engine):
+    """Highest applied version (0 for a database that was never migrated)."""
+    with engine.connect() as conn:
+        if not inspect(conn).has_table('schema_version'):
+            return 0
+        return max(_applied_versions(conn), default=0)
+
+
+def pending_migrations(engine):
+    with engine.connect() as conn:
+        applied = _applied_versions(conn) if inspect(conn).has_table('schema_version') else set()
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def migrate(engine, seed_admins=False):
+    """Apply pending migrations (and optionally seed admins) under the schema lock; returns the versions applied."""
+    lock = _sqlite_lock(engine) if engine.dialect.name == 'sqlite' else contextlib.nullcontext()
+    applied_now = []
+    with lock, engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            # Transaction-scoped: released on commit / rollback, safe through PgBouncer
+            conn.execute(text('SET LOCAL statement_timeout = 0'))
+            conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': ADVISORY_LOCK_KEY})
+        _version_metadata.create_all(conn)
+        applied = _applied_versions(conn)
+        for version, name, fn in MIGRATIONS:
+            if version in applied:
+                continue
+            logger.info(f"[Migrate] applying {version}: {name}")
+            fn(conn)
+            conn.execute(schema_version.insert().values(version=version, name=name))
+            applied_now.append(version)
+        if seed_admins:
+            seed_admin_users(conn)
+    return applied_now
+
+
+def _new_referral_code(conn):
+    users = User.__table__
+    while True:
+        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+        if conn.execute(select(users.c.id).where(users.c.referral_code == code)).first() is None:
+            return code
+
+
+def configured_admin_emails():
+    admins_env = os.getenv('ADMIN_EMAILS')
+    if admins_env:
+        return [e.strip().lower() for e in admins_env.split(',') if e.strip()]
+    admin_email = os.getenv('ADMIN_EMAIL', 'drtshifrin@gmail.com').strip().lower()
+    return [admin_email] if admin_email else []
+
+
+def seed_admin_users(conn):
+    """Ensure every configured admin email has a user row with is_admin set."""
+    users = User.__table__
+    for email in configured_admin_emails():
+        row = conn.execute(select(users.c.id, users.c.is_admin).where(users.c.email == email)).first()
+        if row is None:
+            conn.execute(users.insert().values(email=email, referral_code=_new_referral_code(conn), is_admin=True))
+            logger.info(f"[Migrate] created admin user {email}")
+        elif not row.is_admin:
+            conn.execute(users.update().where(users.c.id == row.id).values(is_admin=True))
+            logger.info(f"[Migrate] promoted {email} to admin")
+
+
+def run(database_url=None):
+    """Migrate and seed DATABASE_URL (the pre-start entry point)."""
+    engine = create_migration_engine(database_url)
+    try:
+        applied = migrate(engine, seed_admins=True)
+        version = current_version(engine)
+    finally:
+        engine.dispose()
+    logger.info(f"[Migrate] schema at version {version}"
+                + (f" (applied {', '.join(map(str, applied))})" if applied else " (up to date)"))
+    return applied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply versioned schema migrations to DATABASE_URL.')
+    parser.add_argument('--status', action='store_true', help='show the current and pending versions and exit')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.status:
+        engine = create_migration_engine()
+        try:
+            print(f"current version: {current_version(engine)}")
+            for version, name, _ in pending_migrations(engine):
+                print(f"pending: {version} {name}")
+        finally:
+            engine.dispose()
+        return 0
+    run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,7 +4,10 @@ import string
 import random
 import uuid
 
-db = SQLAlchemy()
+from read_replica import RoutingSession
+
+# RoutingSession sends reads to the 'replica' bind when a request allows it
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -0,0 +1,33 @@
+"""
+Precompiled origin allow-list used by the CORS and CSRF checks.
+
+Built once at startup: exact origins go into a set, wildcard patterns are
+compiled into a single alternation regex, and recent decisions are kept in a
+bounded LRU so repeat origins (the same few frontends) cost one dict lookup.
+The LRU is bounded, so arbitrary attacker-supplied Origin headers cannot
+grow it without limit.
+"""
+
+from functools import lru_cache
+import re
+
+
+class OriginPolicy:
+    def __init__(self, exact_origins, patterns=(), cache_size=256):
+        self.exact = frozenset(exact_origins)
+        self.patterns = tuple(patterns)
+        self._regex = re.compile('|'.join(f'(?:{p})' for p in self.patterns)) if self.patterns else None
+        self._decide = lru_cache(maxsize=cache_size)(self._match)
+
+    def _match(self, origin):
+        if origin in self.exact:
+            return True
+        return bool(self._regex and self._regex.match(origin))
+
+    def allows(self, origin):
+        if not origin:
+            return False
+        return self._decide(origin)
+
+    def cache_info(self):
+        return self._decide.cache_info()
@@ -0,0 +1,169 @@
+"""
+Pluggable ephemeral storage for OTP codes.
+
+Every backend implements two single-operation calls:
+  issue(email)          -> code     one INSERT / SET
+  consume(email, code)  -> bool     one conditional UPDATE / DELETE (atomic)
+
+plus restore(email, code), which puts back a code whose consume() was not
+followed by a successful commit. For sql the rollback already does that; the
+sqlite and redis stores commit consume() on their own, so the caller must
+restore the code itself if its database work fails afterwards.
+
+Backends (OTP_STORE env):
+  sql     - the existing otp_token table (default). consume() runs inside the
+            caller's db.session transaction; the caller commits.
+  sqlite  - expiring key/value table in a local SQLite file (OTP_STORE_PATH),
+            WAL mode, safe across gunicorn workers on one host.
+  redis   - Redis-compatible server (OTP_STORE_URL / REDIS_URL), SET EX + DEL.
+"""
+
+import logging
+import os
+import random
+import sqlite3
+import string
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from models import db, OTPToken
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OTP_TTL_SECONDS = 30 * 24 * 3600  # matches OTPToken's historical expiry
+
+
+def _generate_code():
+    rng = random.SystemRandom()
+    return ''.join(rng.choice(string.digits) for _ in range(6))
+
+
+class SQLOTPStore:
+    """OTP codes as rows in the main database (otp_token table)."""
+
+    name = 'sql'
+
+    def __init__(self, ttl_seconds=DEFAULT_OTP_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+
+    def issue(self, email):
+        token = OTPToken(email=email)
+        token.expires_at = datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+        db.session.add(token)
+        db.session.commit()
+        return token.token
+
+    def consume(self, email, code):
+        """Mark a live code used in the current transaction. Caller commits."""
+        stmt = (
+            update(OTPToken)
+            .where(
+                OTPToken.email == email,
+                OTPToken.token == code,
+                OTPToken.used.is_(False),
+                OTPToken.expires_at > datetime.utcnow(),
+            )
+            .values(used=True)
+            .execution_options(synchronize_session=False)
+        )
+        return db.session.execute(stmt).rowcount == 1
+
+    def restore(self, email, code):
+        """No-op: the caller's rollback un-marks the code."""
+
+
+class SQLiteKVOTPStore:
+    """Expiring key/value OTP store in a local SQLite file (single host, multi-process)."""
+
+    name = 'sqlite'
+
+    # Purge expired keys on roughly one in PURGE_EVERY issues
+    PURGE_EVERY = 100
+
+    def __init__(self, path, ttl_seconds=DEFAULT_OTP_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS otp_kv (k TEXT PRIMARY KEY, expires_at REAL NOT NULL)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _key(email, code):
+        return f'{email}:{code}'
+
+    def issue(self, email):
+        code = _generate_code()
+        now = time.time()
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO otp_kv (k, expires_at) VALUES (?, ?)',
+                     (self._key(email, code), now + self.ttl_seconds))
+        if random.randrange(self.PURGE_EVERY) == 0:
+            conn.execute('DELETE FROM otp_kv WHERE expires_at <= ?', (now,))
+        return code
+
+    def consume(self, email, code):
+        cur = self._conn().execute('DELETE FROM otp_kv WHERE k = ? AND expires_at > ?',
+                                   (self._key(email, code), time.time()))
+        return cur.rowcount == 1
+
+    def restore(self, email, code):
+        # The original expiry went with the deleted row; give the code a fresh TTL
+        self._conn().execute('INSERT OR IGNORE INTO otp_kv (k, expires_at) VALUES (?, ?)',
+                             (self._key(email, code), time.time() + self.ttl_seconds))
+
+
+class RedisOTPStore:
+    """OTP codes as expiring keys in a Redis-compatible server."""
+
+    name = 'redis'
+
+    def __init__(self, url, ttl_seconds=DEFAULT_OTP_TTL_SECONDS, prefix='otp:'):
+        import redis  # optional dependency
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def issue(self, email):
+        code = _generate_code()
+        self.client.set(f'{self.prefix}{email}:{code}', b'1', ex=self.ttl_seconds)
+        return code
+
+    def consume(self, email, code):
+        return self.client.delete(f'{self.prefix}{email}:{code}') == 1
+
+    def restore(self, email, code):
+        self.client.set(f'{self.prefix}{email}:{code}', b'1', ex=self.ttl_seconds, nx=True)
+
+
+def create_otp_store(app=None):
+    """Build the OTP store selected by OTP_STORE (sql | sqlite | redis)."""
+    kind = os.getenv('OTP_STORE', 'sql').strip().lower()
+    ttl = int(os.getenv('OTP_TTL_SECONDS', str(DEFAULT_OTP_TTL_SECONDS)))
+    try:
+        if kind == 'sqlite':
+            default_dir = app.instance_path if app is not None else '.'
+            path = os.getenv('OTP_STORE_PATH') or os.path.join(default_dir, 'otp_store.sqlite3')
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            store = SQLiteKVOTPStore(path, ttl_seconds=ttl)
+        elif kind == 'redis':
+            store = RedisOTPStore(os.getenv('OTP_STORE_URL') or os.getenv('REDIS_URL', 'redis://localhost:6379/0'), ttl_seconds=ttl)
+        else:
+            store = SQLOTPStore(ttl_seconds=ttl)
+    except Exception as e:
+        logger.warning(f"OTP store '{kind}' unavailable ({e}); falling back to sql")
+        store = SQLOTPStore(ttl_seconds=ttl)
+    logger.info(f"OTP store: {store.name} ttl={ttl}s")
+    return store
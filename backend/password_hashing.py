@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Password hashing with host-wide backpressure.
+
+werkzeug's generate_password_hash / check_password_hash are deliberately
+expensive (PBKDF2/scrypt). This module caps the number of hashes running at
+once across every web worker on the host and raises HashingBusy immediately
+when the cap is reached, so callers can answer 503 instead of letting a login
+rush occupy every worker. The cap is a set of lock files (HASH_SLOT_DIR); a
+slot held by a worker that dies is released by the kernel.
+
+Sync workers handle one request per process, so they hash inline: a process
+pool would only add pickling/IPC while the worker waits anyway. Under
+WORKER_MODE=gevent/eventlet an inline hash would stall every greenlet in the
+worker, so hashes run on a small process pool instead.
+
+  PASSWORD_HASH_METHOD   werkzeug method string (default 'pbkdf2', i.e.
+                         pbkdf2:sha256 with werkzeug's default iterations)
+  HASH_WORKERS           pool processes per web worker (default 2 for
+                         gevent/eventlet, 0 = inline otherwise)
+  HASH_MAX_PENDING       hashes running or queued at once across all workers
+                         on the host. Default for sync workers:
+                         WEB_CONCURRENCY - 1 (at least 1), so a login rush
+                         always leaves a worker for other requests. Default
+                         for gevent/eventlet: twice the pool processes on the
+                         host, i.e. each pool process has one hash queued
+                         behind the running one
+  HASH_SLOT_DIR          directory for the slot lock files (default
+                         /dev/shm/referral-hash-slots)
+  HASH_TIMEOUT           seconds to wait for a pooled result
+
+Run `python password_hashing.py [method ...]` to time the configured method
+(and any alternatives) before changing cost parameters.
+"""
+
+import fcntl
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusy(Exception):
+    """Too many password hashes already queued; retry shortly."""
+
+
+def _generate(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _check(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+def default_slot_dir():
+    base = '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else tempfile.gettempdir()
+    return os.path.join(base, 'referral-hash-slots')
+
+
+class HostSlots:
+    """Counting semaphore shared by every process on the host, one flock()ed file per slot."""
+
+    def __init__(self, directory, size):
+        self.directory = directory
+        self.size = size
+        self._files = {}  # slot -> open file; reopened after fork so locks are not shared with the parent
+        self._pid = None
+        self._held = set()  # flock does not exclude threads sharing one open file
+        self._lock = threading.Lock()
+
+    def _file(self, slot):
+        if self._pid != os.getpid():
+            self._files = {}
+            self._held = set()
+            self._pid = os.getpid()
+        f = self._files.get(slot)
+        if f is None:
+            os.makedirs(self.directory, exist_ok=True)
+            f = self._files[slot] = open(os.path.join(self.directory, f'slot-{slot}'), 'a')
+        return f
+
+    def acquire(self):
+        """Index of a free slot, or None when all are taken."""
+        with self._lock:
+            for slot in range(self.size):
+                if slot in self._held:
+                    continue
+                try:
+                    fcntl.flock(self._file(slot), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                self._held.add(slot)
+                return slot
+        return None
+
+    def release(self, slot):
+        with self._lock:
+            fcntl.flock(self._file(slot), fcntl.LOCK_UN)
+            self._held.discard(slot)
+
+
+class PasswordHasher:
+    def __init__(self, method='pbkdf2', workers=0, max_pending=8, timeout=30.0, slot_dir=None):
+        self.method = method
+        self.workers = max(0, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.timeout = float(timeout)
+        self._slots = HostSlots(slot_dir or default_slot_dir(), self.max_pending)
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def generate(self, password):
+        return self._call(_generate, password, self.method)
+
+    def check(self, pwhash, password):
+        return self._call(_check, pwhash, password)
+
+    def shutdown(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is not None and self._pid == os.getpid():
+            return self._pool
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                # forkserver avoids forking a multi-threaded gunicorn worker
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context(method))
+                self._pid = os.getpid()
+            return self._pool
+
+    def _call(self, fn, *args):
+        slot = self._slots.acquire()
+        if slot is None:
+            raise HashingBusy(f'{self.max_pending} password hashes already running on this host')
+        try:
+            if self.workers == 0:
+                return fn(*args)
+            try:
+                return self._executor().submit(fn, *args).result(timeout=self.timeout)
+            except BrokenProcessPool:
+                logger.warning("[Hashing] process pool broken; recreating and hashing inline once")
+                self.shutdown()
+                return fn(*args)
+        finally:
+            self._slots.release(slot)
+
+
+def _main_is_app_script():
+    # forkserver/spawn children re-run the __main__ script as __mp_main__:
+    # harmless for gunicorn's launcher, but under `python app.py` every pool
+    # process would execute app.py's module level (schedulers included)
+    main_file = getattr(sys.modules.get('__main__'), '__file__', None) or ''
+    return os.path.basename(main_file) == 'app.py'
+
+
+def default_max_pending(cooperative, hash_workers, web_workers):
+    """Host-wide HASH_MAX_PENDING default for the worker setup (see module docstring)."""
+    if cooperative and hash_workers:
+        return 2 * hash_workers * web_workers
+    return max(1, web_workers - 1)
+
+
+def create_hasher():
+    cooperative = os.getenv('WORKER_MODE', 'sync').strip().lower() in ('gevent', 'eventlet')
+    workers = int(os.getenv('HASH_WORKERS') or ('2' if cooperative else '0'))
+    if workers and _main_is_app_script():
+        logger.warning("[Hashing] HASH_WORKERS ignored when running app.py directly; hashing inline")
+        workers = 0
+    # Same defaults as gunicorn.conf.py
+    web_workers = int(os.getenv('WEB_CONCURRENCY') or ('1' if cooperative else '2'))
+    return PasswordHasher(
+        method=os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2'),
+        workers=workers,
+        max_pending=os.getenv('HASH_MAX_PENDING') or default_max_pending(cooperative, workers, web_workers),
+        timeout=os.getenv('HASH_TIMEOUT', '30'),
+        slot_dir=os.getenv('HASH_SLOT_DIR') or None,
+    )
+
+
+def benchmark(method, rounds=5, password='correct horse battery staple'):
+    """Time generate and check for a werkzeug hash method on this machine (ms)."""
+    gen, chk = [], []
+    pwhash = None
+    for _ in range(rounds):
+        t = time.perf_counter()
+        pwhash = generate_password_hash(password, method=method)
+        gen.append((time.perf_counter() - t) * 1000.0)
+        t = time.perf_counter()
+        check_password_hash(pwhash, password)
+        chk.append((time.perf_counter() - t) * 1000.0)
+    return {
+        'method': method,
+        'stored_prefix': pwhash.split('$', 1)[0],
+        'generate_ms': {'min': round(min(gen), 1), 'avg': round(sum(gen) / rounds, 1)},
+        'check_ms': {'min': round(min(chk), 1), 'avg': round(sum(chk) / rounds, 1)},
+    }
+
+
+if __name__ == '__main__':
+    methods = sys.argv[1:] or [os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2')]
+    print(f"⏱️  Password hash benchmark (cpu count: {os.cpu_count()})")
+    for m in methods:
+        r = benchmark(m)
+        print(f"  {r['stored_prefix']:<28} generate avg {r['generate_ms']['avg']:>7} ms   "
+              f"check avg {r['check_ms']['avg']:>7} ms")
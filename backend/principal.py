@@ -0,0 +1,172 @@
+"""
+Authenticated principal: a cheap, DB-free view of the logged-in user.
+
+Two layers keep authorization checks off the database:
+  1. A signed snapshot of immutable-ish user fields (id, email, is_admin,
+     referral_code) stored in the Flask session cookie at login.
+  2. A short-TTL per-process cache keyed by user id, invalidated whenever a
+     User row is updated or deleted in this process.
+
+A snapshot is trusted for PRINCIPAL_CACHE_TTL seconds and only if it is newer
+than the last local invalidation for that user; otherwise the user is reloaded
+once and both layers are refreshed. Handlers that need the ORM object use
+``principal.user`` which loads it lazily (once per request).
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, session
+from sqlalchemy import event
+
+from models import User
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = 'principal'
+PRINCIPAL_CACHE_TTL = float(os.getenv('PRINCIPAL_CACHE_TTL', '60'))
+PRINCIPAL_CACHE_SIZE = int(os.getenv('PRINCIPAL_CACHE_SIZE', '1024'))
+
+
+class Principal:
+    """Immutable identity fields of an authenticated user."""
+
+    __slots__ = ('id', 'email', 'is_admin', 'referral_code', '_user')
+
+    def __init__(self, id, email, is_admin, referral_code, user=None):
+        self.id = id
+        self.email = email
+        self.is_admin = bool(is_admin)
+        self.referral_code = referral_code
+        self._user = user
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.email, user.is_admin, user.referral_code, user=user)
+
+    @classmethod
+    def from_snapshot(cls, snap):
+        return cls(snap['id'], snap['email'], snap.get('is_admin'), snap.get('referral_code'))
+
+    def snapshot(self):
+        return {
+            'id': self.id,
+            'email': self.email,
+            'is_admin': self.is_admin,
+            'referral_code': self.referral_code,
+            'ts': time.time(),
+        }
+
+    @property
+    def user(self):
+        """Full ORM User, loaded on first access."""
+        if self._user is None:
+            self._user = User.query.get(self.id)
+        return self._user
+
+    def __repr__(self):
+        return f"<Principal id={self.id} email={self.email} admin={self.is_admin}>"
+
+
+class PrincipalCache:
+    """Thread-safe TTL/LRU cache of principals keyed by user id."""
+
+    def __init__(self, ttl=PRINCIPAL_CACHE_TTL, maxsize=PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # user_id -> (expires_at, Principal fields)
+        self._invalidated_at = {}      # user_id -> wall-clock time of last local mutation
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if not entry:
+                return None
+            expires_at, fields = entry
+            if expires_at <= now:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        return Principal(*fields)
+
+    def put(self, principal):
+        fields = (principal.id, principal.email, principal.is_admin, principal.referral_code)
+        with self._lock:
+            self._entries[principal.id] = (time.time() + self.ttl, fields)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._invalidated_at[user_id] = time.time()
+            # Invalidation markers only matter for one TTL window
+            if len(self._invalidated_at) > self.maxsize:
+                cutoff = time.time() - self.ttl
+                self._invalidated_at = {k: v for k, v in self._invalidated_at.items() if v > cutoff}
+
+    def snapshot_is_fresh(self, snap):
+        ts = snap.get('ts') or 0
+        if time.time() - ts >= self.ttl:
+            return False
+        with self._lock:
+            return ts > self._invalidated_at.get(snap.get('id'), 0)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._invalidated_at.clear()
+
+
+principal_cache = PrincipalCache()
+
+
+def _on_user_mutation(mapper, connection, target):
+    if target.id is not None:
+        principal_cache.invalidate(target.id)
+
+
+event.listen(User, 'after_update', _on_user_mutation)
+event.listen(User, 'after_delete', _on_user_mutation)
+
+
+def remember_principal(user):
+    """Store the principal snapshot in the session (call whenever session['user_id'] is set)."""
+    principal = Principal.from_user(user)
+    session[SESSION_KEY] = principal.snapshot()
+    principal_cache.put(principal)
+    g._principal = principal
+    return principal
+
+
+def get_current_principal():
+    """Resolve the authenticated principal for this request without touching the DB when possible."""
+    if '_principal' in g:
+        return g._principal
+
+    principal = None
+    user_id = session.get('user_id')
+    if user_id:
+        principal = principal_cache.get(user_id)
+        if principal is None:
+            snap = session.get(SESSION_KEY)
+            if isinstance(snap, dict) and snap.get('id') == user_id and principal_cache.snapshot_is_fresh(snap):
+                principal = Principal.from_snapshot(snap)
+                principal_cache.put(principal)
+        if principal is None:
+            user = User.query.get(user_id)
+            if user is not None:
+                principal = Principal.from_user(user)
+                principal_cache.put(principal)
+                session[SESSION_KEY] = principal.snapshot()
+            else:
+                session.pop(SESSION_KEY, None)
+
+    g._principal = principal
+    return principal
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+QR code rendering with an LRU cache and a small thread pool.
+
+Renders the module matrix from ``qrcode`` directly instead of going through
+qrcode.make() + a full RGB PIL image:
+
+  png  1-bit PNG at QR_PNG_SCALE pixels per module; ~600 bytes for a
+       magic-link URL at level M (qrcode.make()'s RGB PNG is ~900)
+  svg  one <path> of run-length encoded rows; larger (~5 KB) but scales
+       to any display size without resampling
+
+Rendered images are kept in a bounded LRU cache keyed by (format, data), so
+re-sending the same QR (display reconnects, image endpoint hits) costs a dict
+lookup. submit() renders on a thread pool so the caller can commit tokens and
+queue email while the image is being drawn.
+
+  QR_FORMAT            png (default) | svg
+  QR_ERROR_CORRECTION  L | M (default) | Q | H
+  QR_PNG_SCALE         pixels per module for PNG (default 8)
+  QR_BORDER            quiet-zone modules (default 4, the spec minimum)
+  QR_CACHE_SIZE        rendered images kept per worker (default 256)
+  QR_RENDER_WORKERS    render threads (default 2; 0 = render inline)
+
+Run `python qr_render.py [url]` to compare render time and payload size per
+format and error-correction level.
+"""
+
+import base64
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+# qrcode.constants values; qrcode and PIL are imported on first render so
+# worker boot does not pay for them (most workers never draw a QR)
+ERROR_CORRECTION = {'L': 1, 'M': 0, 'Q': 3, 'H': 2}
+CONTENT_TYPES = {'svg': 'image/svg+xml', 'png': 'image/png'}
+
+
+def qr_matrix(data, error_correction='M', border=4):
+    """Boolean module rows for data, including the quiet zone."""
+    import qrcode
+    qr = qrcode.QRCode(error_correction=ERROR_CORRECTION[error_correction.upper()], border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def matrix_to_svg(matrix):
+    """One path of horizontal runs; viewBox in modules so the client picks the size."""
+    size = len(matrix)
+    parts = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            parts.append(f'M{start} {y}h{x - start}v1H{start}z')
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+            f'shape-rendering="crispEdges"><rect width="{size}" height="{size}" fill="#fff"/>'
+            f'<path d="{"".join(parts)}"/></svg>').encode('ascii')
+
+
+def matrix_to_png(matrix, scale=8):
+    """1-bit PNG, scale pixels per module."""
+    from PIL import Image
+    size = len(matrix)
+    img = Image.new('1', (size, size), 1)
+    img.putdata([0 if cell else 1 for row in matrix for cell in row])
+    if scale > 1:
+        img = img.resize((size * scale, size * scale), Image.NEAREST)
+    bio = BytesIO()
+    img.save(bio, format='PNG', optimize=True)
+    return bio.getvalue()
+
+
+class QRRenderer:
+    def __init__(self, fmt='png', error_correction='M', png_scale=8, border=4, cache_size=256, workers=2):
+        if fmt not in CONTENT_TYPES:
+            raise ValueError(f"unsupported QR format: {fmt}")
+        if error_correction.upper() not in ERROR_CORRECTION:
+            raise ValueError(f"unsupported error correction level: {error_correction}")
+        self.fmt = fmt
+        self.error_correction = error_correction.upper()
+        self.png_scale = max(1, int(png_scale))
+        self.border = max(0, int(border))
+        self.cache_size = max(0, int(cache_size))
+        self.workers = max(0, int(workers))
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, data, fmt=None):
+        """(image bytes, content type) for data, from cache when possible."""
+        fmt = fmt or self.fmt
+        key = (fmt, data)
+        with self._lock:
+            body = self._cache.get(key)
+            if body is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return body, CONTENT_TYPES[fmt]
+            self.misses += 1
+        matrix = qr_matrix(data, self.error_correction, self.border)
+        if fmt == 'svg':
+            body = matrix_to_svg(matrix)
+        elif fmt == 'png':
+            body = matrix_to_png(matrix, self.png_scale)
+        else:
+            raise ValueError(f"unsupported QR format: {fmt}")
+        if self.cache_size:
+            with self._lock:
+                self._cache[key] = body
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return body, CONTENT_TYPES[fmt]
+
+    def variant(self, fmt=None):
+        """Short tag for the render settings, e.g. for ETags of rendered images."""
+        fmt = fmt or self.fmt
+        return f"{fmt}-{self.error_correction}-{self.border}" + (f"-{self.png_scale}" if fmt == 'png' else '')
+
+    def data_uri(self, data, fmt=None):
+        body, content_type = self.render(data, fmt)
+        return f'data:{content_type};base64,' + base64.b64encode(body).decode('ascii')
+
+    def submit(self, fn, *args):
+        """Run a render method (render / data_uri) on the pool; returns a Future."""
+        if self.workers == 0:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self._executor().submit(fn, *args)
+
+    def _executor(self):
+        if self._pool is not None and self._pid == os.getpid():
+            return self._pool
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='qr-render')
+                self._pid = os.getpid()
+            return self._pool
+
+    def stats(self):
+        with self._lock:
+            return {
+                'format': self.fmt,
+                'error_correction': self.error_correction,
+                'cached': len(self._cache),
+                'cache_size': self.cache_size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+def create_qr_renderer():
+    return QRRenderer(
+        fmt=os.getenv('QR_FORMAT', 'png').strip().lower(),
+        error_correction=os.getenv('QR_ERROR_CORRECTION', 'M'),
+        png_scale=os.getenv('QR_PNG_SCALE', '8'),
+        border=os.getenv('QR_BORDER', '4'),
+        cache_size=os.getenv('QR_CACHE_SIZE', '256'),
+        workers=os.getenv('QR_RENDER_WORKERS', '2'),
+    )
+
+
+def benchmark(url, rounds=50):
+    """Render time (ms, uncached) and payload size per format / error-correction level."""
+    results = []
+
+    def legacy():
+        # What admin_generate_qr did before: qrcode.make() -> RGB PIL PNG
+        import qrcode
+        bio = BytesIO()
+        qrcode.make(url).save(bio, format='PNG')
+        return bio.getvalue()
+
+    variants = [('png', 'M', legacy, 'qrcode.make')]
+    for level in ('L', 'M', 'Q', 'H'):
+        for fmt in ('svg', 'png'):
+            r = QRRenderer(fmt=fmt, error_correction=level, cache_size=0, workers=0)
+            variants.append((fmt, level, lambda r=r: r.render(url)[0], 'qr_render'))
+    for fmt, level, fn, source in variants:
+        timings = []
+        for _ in range(rounds):
+            t = time.perf_counter()
+            body = fn()
+            timings.append((time.perf_counter() - t) * 1000.0)
+        results.append({
+            'format': fmt,
+            'source': source,
+            'error_correction': level,
+            'render_ms': {'min': round(min(timings), 2), 'avg': round(sum(timings) / rounds, 2)},
+            'bytes': len(body),
+            'data_uri_bytes': len(f'data:{CONTENT_TYPES[fmt]};base64,') + len(base64.b64encode(body)),
+        })
+    return results
+
+
+if __name__ == '__main__':
+    target = sys.argv[1] if len(sys.argv) > 1 else 'https://bestdentistduluth.com/r/welcome?t=' + 'f' * 32
+    print(f"⏱️  QR render benchmark for {target!r}")
+    for r in benchmark(target):
+        print(f"  {r['source']:<11} {r['format']:<4} EC {r['error_correction']}  render avg {r['render_ms']['avg']:>6} ms   "
+              f"{r['bytes']:>6} bytes   data URI {r['data_uri_bytes']:>6} bytes")
@@ -0,0 +1,134 @@
+"""
+Development/test-mode N+1 query detector.
+
+Hooks SQLAlchemy's before_cursor_execute, normalizes each statement to its
+shape (literals and IN-list lengths collapsed), and counts shapes per request.
+When one shape runs more than NPLUSONE_THRESHOLD times in a request the
+detector logs a report with the route, the statement and the application
+call sites that issued it, or raises NPlusOneDetected in "raise" mode so
+tests fail loudly.
+
+  NPLUSONE_MODE       off | warn | raise (default: warn, off when FLASK_ENV=production)
+  NPLUSONE_THRESHOLD  repeats of one statement shape allowed per request (default 5)
+
+Walking the stack for call sites costs a few microseconds per statement,
+which is why this is not enabled in production.
+"""
+
+import logging
+import os
+import re
+import sys
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_THIS_FILE = os.path.abspath(__file__)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAM_LIST_RE = re.compile(r'\(\s*(?:\?|%\([^)]*\)s|%s|:\w+)(?:\s*,\s*(?:\?|%\([^)]*\)s|%s|:\w+))*\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+class NPlusOneDetected(Exception):
+    """Raised in 'raise' mode when a request repeats a statement shape too often."""
+
+
+def normalize_sql(statement):
+    """Reduce a statement to its shape so repeats with different values group together."""
+    shape = _STRING_RE.sub('?', statement)
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = _PARAM_LIST_RE.sub('(?)', shape)
+    return _SPACE_RE.sub(' ', shape).strip()
+
+
+def _call_sites(limit=3):
+    """Innermost application frames (outside site-packages and this module)."""
+    sites = []
+    frame = sys._getframe(2)
+    while frame is not None and len(sites) < limit:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(_APP_DIR) and filename != _THIS_FILE and 'site-packages' not in filename:
+            sites.append(f'{os.path.relpath(filename, _APP_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}')
+        frame = frame.f_back
+    return tuple(sites)
+
+
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    shapes = g.get('_query_shapes')
+    if shapes is None:
+        shapes = g._query_shapes = {}
+    shape = normalize_sql(statement)
+    entry = shapes.get(shape)
+    if entry is None:
+        entry = shapes[shape] = [0, {}]
+    entry[0] += 1
+    sites = _call_sites()
+    entry[1][sites] = entry[1].get(sites, 0) + 1
+
+
+def build_report(threshold):
+    """Statement shapes that exceeded threshold in the current request, worst first."""
+    shapes = g.get('_query_shapes') or {}
+    offenders = [
+        {
+            'statement': shape,
+            'count': count,
+            'call_sites': [{'stack': list(stack), 'count': n}
+                           for stack, n in sorted(sites.items(), key=lambda kv: -kv[1])],
+        }
+        for shape, (count, sites) in shapes.items() if count > threshold
+    ]
+    if not offenders:
+        return None
+    rule = request.url_rule
+    return {
+        'route': rule.rule if rule is not None else request.path,
+        'method': request.method,
+        'total_statements': sum(count for count, _ in shapes.values()),
+        'repeated': sorted(offenders, key=lambda o: -o['count']),
+    }
+
+
+def _format_report(report):
+    lines = [f"[N+1] {report['method']} {report['route']}: {report['total_statements']} statements"]
+    for offender in report['repeated']:
+        lines.append(f"  {offender['count']}x {offender['statement'][:200]}")
+        for site in offender['call_sites'][:3]:
+            lines.append(f"    {site['count']}x from " + ' <- '.join(site['stack'] or ['<unknown>']))
+    return '\n'.join(lines)
+
+
+def init_query_detector(app, mode=None, threshold=None):
+    """Enable the detector unless mode is 'off'. Returns the effective mode."""
+    if mode is None:
+        default = 'off' if os.getenv('FLASK_ENV') == 'production' else 'warn'
+        mode = os.getenv('NPLUSONE_MODE', default).strip().lower()
+    if threshold is None:
+        threshold = int(os.getenv('NPLUSONE_THRESHOLD', '5'))
+    if mode not in ('warn', 'raise'):
+        return 'off'
+
+    if not event.contains(Engine, 'before_cursor_execute', _record_statement):
+        event.listen(Engine, 'before_cursor_execute', _record_statement)
+
+    @app.after_request
+    def _report_repeated_queries(response):
+        report = build_report(threshold)
+        if report is None:
+            return response
+        message = _format_report(report)
+        if mode == 'raise':
+            raise NPlusOneDetected(message)
+        logger.warning(message)
+        return response
+
+    logger.info(f"[N+1] detector enabled mode={mode} threshold={threshold}")
+    return mode
@@ -0,0 +1,168 @@
+"""
+Read-replica routing for read-only admin endpoints.
+
+With DATABASE_REPLICA_URL set, the replica is registered as the 'replica'
+SQLAlchemy bind and db.session becomes a RoutingSession: while a request is
+marked for the replica, ORM reads go there and flushes / INSERT / UPDATE /
+DELETE still go to the primary. Only endpoints registered with
+router.read_only(...) are marked, and only when:
+
+  - the request is a GET/HEAD,
+  - replica lag is at most REPLICA_MAX_LAG_SECONDS (probed at most every
+    REPLICA_LAG_CHECK_SECONDS per worker; a failed probe counts as lagging),
+  - the session did not make an admin mutation in the last
+    REPLICA_STICKY_SECONDS (read-your-writes).
+
+Routed responses carry X-DB-Route: replica | primary. Any SQLite file works
+as a replica for tests (its lag is always 0).
+"""
+
+import logging
+import os
+import time
+
+from flask import g, has_app_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.sql.dml import UpdateBase
+
+from db_engine import resolve_profile
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+STICKY_SESSION_KEY = '_db_primary_until'
+MUTATING_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# Seconds behind the primary; 0 when the replica has replayed everything it received
+_PG_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends reads to the replica bind when the request allows it."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase) \
+                and has_app_context() and g.get('_db_use_replica'):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def configure_replica(app, replica_url, engine_options=None):
+    """Register the replica bind; call before db.init_app."""
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds[REPLICA_BIND] = dict(engine_options or {}, url=replica_url)
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def _probe_lag(connection):
+    if connection.dialect.name == 'postgresql':
+        return float(connection.execute(_PG_LAG_SQL).scalar() or 0.0)
+    return 0.0
+
+
+class ReadReplicaRouter:
+    def __init__(self, max_lag=5.0, check_interval=5.0, sticky_seconds=15.0):
+        self.max_lag = float(max_lag)
+        self.check_interval = float(check_interval)
+        self.sticky_seconds = float(sticky_seconds)
+        self.endpoints = set()
+        self.lag = None  # last probed lag in seconds (None = unknown / probe failed)
+        self.routed = {'replica': 0, 'primary': 0}
+        self.profile = None  # db_engine profile of the replica bind
+        self._checked_at = 0.0
+        self._healthy = False
+        self._db = None
+        self._observers = []  # fn(target)
+
+    def add_observer(self, fn):
+        self._observers.append(fn)
+
+    def read_only(self, *endpoints):
+        """Mark endpoint names whose GETs may be served from the replica."""
+        self.endpoints.update(endpoints)
+
+    def init_app(self, app, db, is_admin):
+        """Register the hooks; is_admin() decides whether a mutation makes the session sticky."""
+        self._db = db
+
+        @app.before_request
+        def _choose_database():
+            if request.endpoint not in self.endpoints or request.method not in ('GET', 'HEAD'):
+                return
+            use_replica = self.replica_available() and session.get(STICKY_SESSION_KEY, 0) <= time.time()
+            g._db_use_replica = use_replica
+            g._db_route = 'replica' if use_replica else 'primary'
+            self.routed[g._db_route] += 1
+            for fn in self._observers:
+                try:
+                    fn(g._db_route)
+                except Exception:
+                    pass
+
+        @app.after_request
+        def _record_route(response):
+            route = g.get('_db_route')
+            if route is not None:
+                response.headers['X-DB-Route'] = route
+            elif request.method in MUTATING_METHODS and response.status_code < 400 and is_admin():
+                # Read-your-writes: this admin's next reads go to the primary
+                session[STICKY_SESSION_KEY] = time.time() + self.sticky_seconds
+            return response
+
+    def replica_available(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            was_healthy = self._healthy
+            try:
+                with self._db.engines[REPLICA_BIND].connect() as connection:
+                    self.lag = _probe_lag(connection)
+                self._healthy = self.lag <= self.max_lag
+            except Exception as e:
+                logger.warning(f"[Replica] lag probe failed: {e}")
+                self.lag = None
+                self._healthy = False
+            if was_healthy != self._healthy:
+                logger.warning(f"[Replica] {'using' if self._healthy else 'bypassing'} replica "
+                               f"(lag={self.lag}s, max={self.max_lag}s)")
+        return self._healthy
+
+    def stats(self):
+        return {
+            'lag_seconds': self.lag,
+            'max_lag_seconds': self.max_lag,
+            'healthy': self._healthy,
+            'routed': dict(self.routed),
+            'endpoints': sorted(self.endpoints),
+        }
+
+
+def create_replica_router(app):
+    """Router for DATABASE_REPLICA_URL (same DB_PROFILE pooling), or None without a replica."""
+    replica_url = os.getenv('DATABASE_REPLICA_URL')
+    if not replica_url:
+        return None
+    profile = resolve_profile(replica_url)
+    configure_replica(app, profile.url.render_as_string(hide_password=False), profile.options)
+    router = ReadReplicaRouter(
+        max_lag=os.getenv('REPLICA_MAX_LAG_SECONDS', '5'),
+        check_interval=os.getenv('REPLICA_LAG_CHECK_SECONDS', '5'),
+        sticky_seconds=os.getenv('REPLICA_STICKY_SECONDS', '15'),
+    )
+    router.profile = profile
+    logger.info(f"[Replica] read-only endpoints may use DATABASE_REPLICA_URL ({profile.describe()})")
+    return router
+
+
+def instrument_replica(registry, router):
+    """Replica lag gauge and routing counts."""
+    registry.gauge('db_replica_lag_seconds', 'Last probed replica lag (absent when the probe failed).',
+                   lambda: [((), router.lag)] if router.lag is not None else [])
+    registry.counter('db_replica_routed_requests_total', 'Read-only requests by database chosen.')
+    router.add_observer(lambda target: registry.inc('db_replica_routed_requests_total', (('target', target),)))
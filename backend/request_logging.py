@@ -0,0 +1,153 @@
+"""
+Asynchronous, sampled request logging.
+
+All log records go through a QueueHandler; a single QueueListener thread per
+process does the formatting and the stdout write, so request threads never
+block on log I/O. A full queue drops records (counted) rather than stalling.
+
+Each request produces one structured JSON record on the "request" logger:
+
+  {"id", "method", "route", "path", "status", "latency_ms", "db_queries",
+   "db_ms", "bytes", "user_id", "mobile"}
+
+Successful requests are sampled; 4xx/5xx and slow requests are always logged.
+
+  LOG_LEVEL          root level (default INFO; DEBUG restores the verbose
+                     per-request auth/CORS diagnostics)
+  LOG_SAMPLE_RATE    fraction of 2xx/3xx request records kept (default 1.0)
+  LOG_SLOW_MS        requests slower than this are always logged (default 1000)
+  LOG_QUEUE_SIZE     max records buffered before dropping (default 10000)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
+
+request_logger = logging.getLogger('request')
+
+_listener = None
+_queue_handler = None
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that counts and drops records when the queue is full."""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _RequestAwareFormatter(logging.Formatter):
+    """Plain text for ordinary records, one JSON line for request summaries."""
+
+    def format(self, record):
+        summary = getattr(record, 'request_summary', None)
+        if summary is not None:
+            return json.dumps({'ts': self.formatTime(record), 'level': record.levelname, **summary},
+                              separators=(',', ':'), default=str)
+        return super().format(record)
+
+
+def configure_logging(level=None, stream=None):
+    """Route all logging through a background listener thread. Idempotent."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _queue_handler
+    level = level or os.getenv('LOG_LEVEL', 'INFO').upper()
+    q = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(_RequestAwareFormatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(q, output, respect_handler_level=False)
+    _queue_handler = _DroppingQueueHandler(q)
+
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+    _listener.start()
+    atexit.register(_listener.stop)  # flush buffered records on shutdown
+    return _queue_handler
+
+
+def dropped_records():
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query_start(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g._db_query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _count_query_end(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g._db_queries = g.get('_db_queries', 0) + 1
+        started = g.pop('_db_query_started', None)
+        if started is not None:
+            g._db_ms = g.get('_db_ms', 0.0) + (time.perf_counter() - started) * 1000.0
+
+
+def request_db_stats():
+    """(query count, total ms) for SQL executed so far in the current request."""
+    return g.get('_db_queries', 0), g.get('_db_ms', 0.0)
+
+
+def init_request_logging(app, sample_rate=None, slow_ms=None):
+    """Emit one sampled JSON record per request. Register early so it runs last."""
+    if sample_rate is None:
+        sample_rate = float(os.getenv('LOG_SAMPLE_RATE', '1.0'))
+    if slow_ms is None:
+        slow_ms = float(os.getenv('LOG_SLOW_MS', '1000'))
+
+    @app.before_request
+    def _start_request_timer():
+        g._request_started = time.perf_counter()
+
+    @app.after_request
+    def _log_request_summary(response):
+        started = g.get('_request_started')
+        latency_ms = (time.perf_counter() - started) * 1000.0 if started else 0.0
+        status = response.status_code
+        if status < 400 and latency_ms < slow_ms and random.random() >= sample_rate:
+            return response
+        rule = request.url_rule
+        db_queries, db_ms = request_db_stats()
+        summary = {
+            'id': getattr(request, 'id', None),
+            'method': request.method,
+            'route': rule.rule if rule is not None else None,
+            'path': request.path,
+            'status': status,
+            'latency_ms': round(latency_ms, 1),
+            'db_queries': db_queries,
+            'db_ms': round(db_ms, 1),
+            'bytes': None if response.is_streamed else response.calculate_content_length(),
+            # Read from the memoized principal: touching session would add Vary: Cookie
+            'user_id': getattr(g.get('_principal'), 'id', None),
+            'mobile': getattr(request, 'is_mobile', None),
+        }
+        level = logging.ERROR if status >= 500 else logging.WARNING if status >= 400 else logging.INFO
+        request_logger.log(level, 'request', extra={'request_summary': summary})
+        return response
@@ -0,0 +1,164 @@
+"""
+Opt-in per-request profiler for diagnosing slow pages in production.
+
+When PROFILE_ENABLED=1, a request is profiled if an admin sends the
+``X-Profile-Request: 1`` header or it falls within PROFILE_SAMPLE_RATE. The
+view runs under cProfile while a sampler thread records the request thread's
+stack every PROFILE_SAMPLE_INTERVAL_MS. After the response has been sent,
+two files are written to PROFILE_DIR:
+
+  <stamp>-<request id>-<route>-<ms>ms.pstats     load with pstats / snakeviz
+  <stamp>-<request id>-<route>-<ms>ms.collapsed  "a;b;c count" for flamegraph.pl / speedscope
+
+Only the newest PROFILE_KEEP profiles are kept. With PROFILE_ENABLED unset no
+hooks are registered at all, so there is no per-request cost.
+"""
+
+import cProfile
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile-Request'
+_SAFE_NAME_RE = re.compile(r'^[\w.-]+\.(?:pstats|collapsed)$')
+
+
+class _StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval into collapsed-stack counts."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(1.0)
+
+
+class RequestProfiler:
+    def __init__(self, directory, sample_rate=0.0, keep=50, sample_interval_ms=5.0):
+        self.directory = directory
+        self.sample_rate = float(sample_rate)
+        self.keep = int(keep)
+        self.sample_interval = max(0.001, float(sample_interval_ms) / 1000.0)
+        os.makedirs(directory, exist_ok=True)
+
+    def init_app(self, app, is_admin):
+        """Register the hooks; is_admin() decides whether the header is honoured."""
+
+        @app.before_request
+        def _maybe_start_profile():
+            wanted = request.headers.get(PROFILE_HEADER) == '1' and is_admin()
+            if not wanted and not (self.sample_rate and random.random() < self.sample_rate):
+                return
+            sampler = _StackSampler(threading.get_ident(), self.sample_interval)
+            sampler.start()
+            profile = cProfile.Profile()
+            g._profile = (profile, sampler, time.perf_counter())
+            profile.enable()
+
+        @app.after_request
+        def _finish_profile(response):
+            state = g.pop('_profile', None)
+            if state is None:
+                return response
+            profile, sampler, started = state
+            profile.disable()
+            sampler.stop()
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            name = self._base_name(elapsed_ms)
+            response.headers['X-Profile-Id'] = name
+            # Write after the response has gone out, not on the request's clock
+            response.call_on_close(lambda: self._write(name, profile, sampler.stacks))
+            return response
+
+    def _base_name(self, elapsed_ms):
+        rule = request.url_rule
+        route = re.sub(r'[^\w]+', '_', (rule.rule if rule is not None else request.path)).strip('_') or 'root'
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+        return f"{stamp}-{getattr(request, 'id', 'req')}-{request.method}-{route[:60]}-{int(elapsed_ms)}ms"
+
+    def _write(self, name, profile, stacks):
+        try:
+            profile.dump_stats(os.path.join(self.directory, name + '.pstats'))
+            with open(os.path.join(self.directory, name + '.collapsed'), 'w') as fh:
+                for stack, count in stacks.most_common():
+                    fh.write(f'{stack} {count}\n')
+            self._rotate()
+            logger.info(f"[Profile] wrote {name}")
+        except Exception as e:
+            logger.warning(f"[Profile] could not write {name}: {e}")
+
+    def _rotate(self):
+        names = sorted(n[:-len('.pstats')] for n in os.listdir(self.directory) if n.endswith('.pstats'))
+        for old in names[:-self.keep] if self.keep > 0 else []:
+            for ext in ('.pstats', '.collapsed'):
+                try:
+                    os.remove(os.path.join(self.directory, old + ext))
+                except FileNotFoundError:
+                    pass
+
+    def list_profiles(self):
+        """Newest first: name, request id, method, route, duration and file sizes."""
+        profiles = []
+        for fname in sorted(os.listdir(self.directory), reverse=True):
+            if not fname.endswith('.pstats'):
+                continue
+            base = fname[:-len('.pstats')]
+            parts = base.split('-', 3)
+            route, _, duration = parts[3].rpartition('-') if len(parts) == 4 else ('', '', '')
+            profiles.append({
+                'name': base,
+                'created_at': parts[0],
+                'request_id': parts[1] if len(parts) > 1 else None,
+                'method': parts[2] if len(parts) > 2 else None,
+                'route': route,
+                'duration_ms': int(duration[:-2]) if duration.endswith('ms') and duration[:-2].isdigit() else None,
+                'files': [f for f in (base + '.pstats', base + '.collapsed')
+                          if os.path.exists(os.path.join(self.directory, f))],
+            })
+        return profiles
+
+    def resolve(self, filename):
+        """Absolute path for a profile file name, or None if invalid/missing."""
+        if not _SAFE_NAME_RE.match(filename or ''):
+            return None
+        path = os.path.join(self.directory, filename)
+        return path if os.path.isfile(path) else None
+
+
+def create_profiler(app):
+    if os.getenv('PROFILE_ENABLED', '0').lower() not in ('1', 'true', 'yes', 'on'):
+        return None
+    directory = os.getenv('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+    return RequestProfiler(
+        directory,
+        sample_rate=os.getenv('PROFILE_SAMPLE_RATE', '0'),
+        keep=os.getenv('PROFILE_KEEP', '50'),
+        sample_interval_ms=os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5'),
+    )
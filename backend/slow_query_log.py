@@ -0,0 +1,155 @@
+"""
+Slow query log.
+
+Times every statement through SQLAlchemy cursor events. Statements slower
+than SLOW_QUERY_MS are logged with their route and request id and kept in a
+bounded per-process ring buffer (GET /admin/slow-queries). The first time a
+statement shape is slow, its plan is captured with EXPLAIN (SQLite:
+EXPLAIN QUERY PLAN) on the same connection; on PostgreSQL this runs inside a
+savepoint so a failed EXPLAIN can never abort the caller's transaction.
+
+  SLOW_QUERY_LOG      1 (default) | 0
+  SLOW_QUERY_MS       threshold in milliseconds (default 200)
+  SLOW_QUERY_EXPLAIN  1 (default) | 0, capture plans for SELECTs
+  SLOW_QUERY_PARAMS   0 (default) | 1, keep bound parameters in records. Off by
+                      default: parameters include OTP codes and reset tokens
+  SLOW_QUERY_BUFFER   records kept in memory (default 200)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from query_detector import normalize_sql
+
+logger = logging.getLogger(__name__)
+
+MAX_PLANS = 500
+
+
+def _first_keyword(statement):
+    words = statement.split(None, 1)
+    return words[0].upper() if words else ''
+
+
+def _truncate(value, limit):
+    text = value if isinstance(value, str) else repr(value)
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms=200.0, explain=True, capture_params=False, size=200):
+        self.threshold = float(threshold_ms) / 1000.0
+        self.explain = explain
+        self.capture_params = capture_params
+        self.records = deque(maxlen=int(size))
+        self.plans = {}  # statement shape -> plan lines (first slow occurrence)
+        self._lock = threading.Lock()
+
+    def install(self):
+        if not event.contains(Engine, 'before_cursor_execute', self._before):
+            event.listen(Engine, 'before_cursor_execute', self._before)
+            event.listen(Engine, 'after_cursor_execute', self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        # Stored on the per-execution context, so failed statements leave nothing behind
+        if context is not None:
+            context._slow_query_started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_slow_query_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        if elapsed < self.threshold:
+            return
+        shape = normalize_sql(statement)
+        plan = self.plans.get(shape)
+        if plan is None and self.explain and not executemany and len(self.plans) < MAX_PLANS \
+                and _first_keyword(statement) in ('SELECT', 'WITH'):
+            plan = self._explain(conn, cursor, statement, parameters)
+            if plan is not None:
+                with self._lock:
+                    self.plans.setdefault(shape, plan)
+        record = {
+            'at': datetime.utcnow().isoformat(),
+            'duration_ms': round(elapsed * 1000.0, 1),
+            'statement': _truncate(statement, 2000),
+            'parameters': _truncate(parameters, 500) if self.capture_params else None,
+            'route': None,
+            'request_id': None,
+            'shape': shape,
+        }
+        if has_request_context():
+            rule = request.url_rule
+            record['route'] = f"{request.method} {rule.rule if rule is not None else request.path}"
+            record['request_id'] = getattr(request, 'id', None)
+        with self._lock:
+            self.records.append(record)
+        logger.warning(f"[SlowQuery] [{record['request_id']}] {record['duration_ms']}ms {record['route']} "
+                       f"{_truncate(' '.join(statement.split()), 300)}")
+
+    def _explain(self, conn, cursor, statement, parameters):
+        """Plan for statement via a raw DBAPI cursor (does not re-enter these events)."""
+        dialect = conn.dialect.name
+        prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+        raw = cursor.connection.cursor()
+        savepoint = dialect == 'postgresql'
+        try:
+            if savepoint:
+                raw.execute('SAVEPOINT slow_query_explain')
+            try:
+                raw.execute(prefix + statement, parameters)
+                rows = raw.fetchall()
+            except Exception as e:
+                if savepoint:
+                    raw.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                logger.debug(f"[SlowQuery] EXPLAIN failed: {e}")
+                return None
+            if savepoint:
+                raw.execute('RELEASE SAVEPOINT slow_query_explain')
+            # SQLite rows are (id, parent, notused, detail); PostgreSQL rows are (line,)
+            return [str(row[-1]) for row in rows]
+        except Exception as e:
+            logger.debug(f"[SlowQuery] EXPLAIN unavailable: {e}")
+            return None
+        finally:
+            raw.close()
+
+    def snapshot(self, limit=None):
+        """Newest records first, each with the captured plan for its shape (if any)."""
+        with self._lock:
+            records = list(self.records)
+            plans = dict(self.plans)
+        records.reverse()
+        if limit:
+            records = records[:limit]
+        return {
+            'threshold_ms': round(self.threshold * 1000.0, 1),
+            'count': len(records),
+            'records': [dict(r, plan=plans.get(r['shape'])) for r in records],
+        }
+
+
+def _flag(name, default):
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes', 'on')
+
+
+def create_slow_query_log():
+    if not _flag('SLOW_QUERY_LOG', '1'):
+        return None
+    log = SlowQueryLog(
+        threshold_ms=os.getenv('SLOW_QUERY_MS', '200'),
+        explain=_flag('SLOW_QUERY_EXPLAIN', '1'),
+        capture_params=_flag('SLOW_QUERY_PARAMS', '0'),
+        size=os.getenv('SLOW_QUERY_BUFFER', '200'),
+    )
+    log.install()
+    return log
@@ -0,0 +1,333 @@
+"""
+Cross-worker fan-out for Server-Sent Events.
+
+/qr/stream subscribers are plain Queues held by the worker that accepted the
+connection, but /qr/login and /qr/review may be served by any worker. Every
+publish therefore goes through a bus that reaches all workers, and each
+worker's listener thread delivers to its own subscribers.
+
+Backends (SSE_PUBSUB env):
+  postgres - LISTEN/NOTIFY on SSE_PUBSUB_CHANNEL (default when DATABASE_URL
+             is PostgreSQL; works across hosts). LISTEN needs a session
+             that PgBouncer's transaction pooling does not provide, so with
+             DB_PROFILE=pgbouncer it connects to SSE_PUBSUB_DSN (a direct
+             PostgreSQL URL) and falls back to unix when that is unset
+  unix     - one UNIX datagram socket per listening worker in SSE_PUBSUB_DIR;
+             publishers send to every socket there (single host, default
+             otherwise)
+  local    - in-process only (single worker / tests)
+
+Messages carry their publish time, so delivery latency (publish -> handed to
+the subscriber queues) is measured per worker. Subscriber queues are bounded
+(SSE_QUEUE_SIZE) and drop their oldest message when a client stalls.
+
+The bus also remembers the newest event id it has delivered, so long-poll
+requests can wait for the next event (wait_for_event) and answer "nothing
+new" without touching the database.
+"""
+
+import json
+import logging
+import os
+import select
+import socket
+import tempfile
+import threading
+import time
+from queue import Empty, Full, Queue
+
+logger = logging.getLogger(__name__)
+
+
+class DropOldestQueue(Queue):
+    """Bounded queue whose put_nowait evicts the oldest item instead of raising Full."""
+
+    def __init__(self, maxsize):
+        super().__init__(maxsize=maxsize)
+        self.dropped = 0
+
+    def put_nowait(self, item):
+        while True:
+            try:
+                return super().put_nowait(item)
+            except Full:
+                try:
+                    self.get_nowait()
+                    self.dropped += 1
+                except Empty:
+                    pass
+
+
+class SSEBus:
+    """Local subscriber registry plus delivery bookkeeping; subclasses add transport."""
+
+    name = 'local'
+
+    def __init__(self, queue_size=100):
+        self.queue_size = max(1, int(queue_size))
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._observers = []  # fn(latency_seconds), e.g. metrics
+        self._pid = None
+        self.published = 0
+        self.delivered = 0
+        self.latency_ms_max = 0.0
+        self.latency_ms_total = 0.0
+        self.dropped = 0  # messages evicted from queues of subscribers that have left
+        self.latest_event_id = None
+        self._event_cond = threading.Condition()
+
+    # ---------- subscribers ----------
+    def subscribe(self):
+        self._ensure_listening()
+        q = DropOldestQueue(self.queue_size)
+        with self._lock:
+            self._subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            try:
+                self._subscribers.remove(q)
+                self.dropped += q.dropped
+            except ValueError:
+                pass
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def add_observer(self, fn):
+        self._observers.append(fn)
+
+    # ---------- newest event id (long-poll) ----------
+    def current_event_id(self):
+        """Newest event id delivered to this worker (None until known)."""
+        self._ensure_listening()
+        return self.latest_event_id
+
+    def note_event_id(self, event_id):
+        with self._event_cond:
+            if self.latest_event_id is None or event_id > self.latest_event_id:
+                self.latest_event_id = event_id
+                self._event_cond.notify_all()
+
+    def wait_for_event(self, after_id, timeout):
+        """Block until an event newer than after_id arrives (or timeout); returns the newest id."""
+        self._ensure_listening()
+        with self._event_cond:
+            self._event_cond.wait_for(lambda: (self.latest_event_id or 0) > after_id, timeout)
+            return self.latest_event_id
+
+    # ---------- publish / deliver ----------
+    def publish(self, message):
+        self.published += 1
+        self._send(json.dumps({'t': time.time(), 'm': message}, separators=(',', ':')))
+
+    def _send(self, payload):
+        self._deliver(payload)
+
+    def _deliver(self, payload):
+        try:
+            envelope = json.loads(payload)
+            message = envelope['m']
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"[SSE] dropping malformed bus message: {payload[:200]!r}")
+            return
+        if isinstance(message, dict) and isinstance(message.get('id'), int):
+            self.note_event_id(message['id'])
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except Exception:
+                pass
+        latency = max(0.0, time.time() - float(envelope.get('t', time.time())))
+        self.delivered += 1
+        self.latency_ms_total += latency * 1000.0
+        self.latency_ms_max = max(self.latency_ms_max, latency * 1000.0)
+        for fn in self._observers:
+            try:
+                fn(latency)
+            except Exception:
+                pass
+
+    def stats(self):
+        return {
+            'backend': self.name,
+            'pid': os.getpid(),
+            'subscribers': self.subscriber_count(),
+            'dropped': self.dropped + sum(q.dropped for q in list(self._subscribers)),
+            'published': self.published,
+            'delivered': self.delivered,
+            'avg_delivery_ms': round(self.latency_ms_total / self.delivered, 2) if self.delivered else 0.0,
+            'max_delivery_ms': round(self.latency_ms_max, 2),
+        }
+
+    # ---------- listener lifecycle ----------
+    def _ensure_listening(self):
+        # Threads and sockets do not survive fork; start lazily in each worker
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._start_listener()
+
+    def _start_listener(self):
+        pass
+
+
+class UnixSocketBus(SSEBus):
+    """Single-host fan-out over UNIX datagram sockets, one per listening worker."""
+
+    name = 'unix'
+
+    def __init__(self, directory, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._sock = None
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f'sse-{pid}.sock')
+
+    def _start_listener(self):
+        path = self._path(os.getpid())
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(path)
+        self._sock = sock
+        threading.Thread(target=self._listen, args=(sock,), name='sse-bus', daemon=True).start()
+        logger.info(f"[SSE] unix bus listening at {path}")
+
+    def _listen(self, sock):
+        while True:
+            try:
+                data = sock.recv(65536)
+            except OSError as e:
+                logger.warning(f"[SSE] unix bus listener stopped: {e}")
+                return
+            self._deliver(data.decode('utf-8', 'replace'))
+
+    def _send(self, payload):
+        data = payload.encode('utf-8')
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sender.setblocking(False)  # a stalled worker must not block the publishing request
+        try:
+            for name in os.listdir(self.directory):
+                if not (name.startswith('sse-') and name.endswith('.sock')):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    sender.sendto(data, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Worker exited without cleaning up its socket
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                except OSError as e:
+                    logger.warning(f"[SSE] unix bus send to {name} failed: {e}")
+        finally:
+            sender.close()
+
+
+class PostgresBus(SSEBus):
+    """Fan-out through PostgreSQL LISTEN/NOTIFY (works across hosts)."""
+
+    name = 'postgres'
+
+    def __init__(self, dsn, channel='qr_events', **kwargs):
+        super().__init__(**kwargs)
+        import psycopg2  # already required for the PostgreSQL engine
+        self._psycopg2 = psycopg2
+        self.dsn = dsn
+        self.channel = channel
+        self._pub_conn = None
+        self._pub_pid = None
+        self._pub_lock = threading.Lock()
+
+    def _connect(self):
+        conn = self._psycopg2.connect(self.dsn)
+        conn.set_session(autocommit=True)
+        return conn
+
+    def _send(self, payload):
+        with self._pub_lock:
+            for attempt in (1, 2):
+                try:
+                    if self._pub_conn is None or self._pub_conn.closed or self._pub_pid != os.getpid():
+                        self._pub_conn = self._connect()
+                        self._pub_pid = os.getpid()
+                    with self._pub_conn.cursor() as cur:
+                        cur.execute('SELECT pg_notify(%s, %s)', (self.channel, payload))
+                    return
+                except self._psycopg2.Error as e:
+                    self._pub_conn = None
+                    if attempt == 2:
+                        logger.warning(f"[SSE] NOTIFY failed, delivering locally only: {e}")
+                        self._deliver(payload)
+
+    def _start_listener(self):
+        threading.Thread(target=self._listen, name='sse-bus', daemon=True).start()
+
+    def _listen(self):
+        backoff = 1.0
+        while True:
+            try:
+                conn = self._connect()
+                with conn.cursor() as cur:
+                    cur.execute(f'LISTEN "{self.channel}"')
+                logger.info(f"[SSE] postgres bus listening on {self.channel}")
+                backoff = 1.0
+                while True:
+                    if select.select([conn], [], [], 30.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._deliver(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning(f"[SSE] postgres listener error, reconnecting in {backoff:.0f}s: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+
+def _default_socket_dir():
+    base = '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else tempfile.gettempdir()
+    return os.path.join(base, 'referral-sse')
+
+
+def create_sse_bus(database_url='', db_profile=None):
+    """Build the bus selected by SSE_PUBSUB (auto | postgres | unix | local).
+
+    db_profile is the db_engine profile name of database_url."""
+    kind = os.getenv('SSE_PUBSUB', 'auto').strip().lower()
+    listen_url = os.getenv('SSE_PUBSUB_DSN') or database_url or ''
+    is_postgres = listen_url.startswith(('postgres://', 'postgresql'))
+    if kind == 'auto':
+        kind = 'postgres' if is_postgres else 'unix'
+    if kind == 'postgres' and db_profile == 'pgbouncer' and not os.getenv('SSE_PUBSUB_DSN'):
+        logger.warning("[SSE] LISTEN/NOTIFY does not work through PgBouncer transaction pooling; "
+                       "set SSE_PUBSUB_DSN to a direct PostgreSQL URL. Using the unix bus (single host)")
+        kind = 'unix'
+    queue_size = int(os.getenv('SSE_QUEUE_SIZE', '100'))
+    try:
+        if kind == 'postgres':
+            from sqlalchemy.engine import make_url
+            dsn = make_url(listen_url.replace('postgres://', 'postgresql://', 1)).set(drivername='postgresql')
+            bus = PostgresBus(dsn.render_as_string(hide_password=False),
+                              channel=os.getenv('SSE_PUBSUB_CHANNEL', 'qr_events'), queue_size=queue_size)
+        elif kind == 'unix':
+            bus = UnixSocketBus(os.getenv('SSE_PUBSUB_DIR') or _default_socket_dir(), queue_size=queue_size)
+        else:
+            bus = SSEBus(queue_size=queue_size)
+    except Exception as e:
+        logger.warning(f"[SSE] bus '{kind}' unavailable ({e}); delivering within this worker only")
+        bus = SSEBus(queue_size=queue_size)
+    logger.info(f"[SSE] pub/sub backend: {bus.name}")
+    return bus
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Worker cold-start profile.
+
+Every gunicorn worker imports app.py after it forks, and max_requests
+recycles sync workers every ~1000 requests, so import time is paid over and
+over. Each sample runs in a fresh interpreter with ``python -X importtime``
+and records:
+
+  import_ms         wall time of ``import app`` (dependencies + app.py itself)
+  app_module_ms     time spent executing app.py itself: creating the Flask app,
+                    initialising extensions and registering routes
+  first_request_ms  GET /health right after import (lazy setup on first use)
+  top imports       modules imported directly by app, by cumulative time
+
+DEFERRED_MODULES are only needed by rarely used endpoints and must not be
+loaded by importing the app; test_cold_start.py checks that, and the import
+time against STARTUP_BUDGET_MS.
+
+Run `python startup_profile.py [--runs N] [--top N]`.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Imported on first use (QR rendering, /debug/network-test)
+DEFERRED_MODULES = ('qrcode', 'PIL', 'smtplib')
+
+# Median `import app` wall time a cold worker may take
+STARTUP_BUDGET_MS = float(os.getenv('STARTUP_BUDGET_MS', '1500'))
+
+_CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.app.test_client().get('/health')
+done = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000.0, 'first_request_ms': (done - imported) * 1000.0,
+                  'modules': sorted(sys.modules)}))
+'''
+
+
+def _child_env():
+    env = dict(os.environ)
+    # Keep the sample self-contained: no background scheduler, no shared limiter file
+    env.setdefault('MAINTENANCE_INTERVAL', '0')
+    env.setdefault('RATELIMIT_STORAGE_URI', 'memory://')
+    env.setdefault('LOG_LEVEL', 'WARNING')
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    return env
+
+
+def parse_importtime(stderr, module='app'):
+    """(self_us, cumulative_us) of module and [(cumulative_us, name)] of its direct imports."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    # importtime prints children before their parent
+    for index, (depth, name, self_us, cumulative_us) in enumerate(rows):
+        if name == module and depth == 0:
+            children = []
+            for child_depth, child, _, child_cumulative in reversed(rows[:index]):
+                if child_depth == 0:
+                    break
+                if child_depth == 1:
+                    children.append((child_cumulative, child))
+            return self_us, cumulative_us, sorted(children, reverse=True)
+    raise ValueError(f"{module} not found in -X importtime output")
+
+
+def sample():
+    """One cold start in a fresh interpreter."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', _CHILD], cwd=BACKEND_DIR,
+                          env=_child_env(), capture_output=True, text=True, timeout=120)
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing app failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    app_self_us, _, imports = parse_importtime(proc.stderr)
+    result['app_module_ms'] = app_self_us / 1000.0
+    result['imports'] = [(cumulative_us / 1000.0, name) for cumulative_us, name in imports]
+    return result
+
+
+def profile(runs=5):
+    """Median timings over runs cold starts, plus the slowest run's direct imports."""
+    samples = [sample() for _ in range(runs)]
+    slowest = max(samples, key=lambda s: s['import_ms'])
+    return {
+        'runs': runs,
+        'import_ms': round(statistics.median(s['import_ms'] for s in samples), 1),
+        'app_module_ms': round(statistics.median(s['app_module_ms'] for s in samples), 1),
+        'first_request_ms': round(statistics.median(s['first_request_ms'] for s in samples), 1),
+        'imports': slowest['imports'],
+        'loaded_deferred': sorted(m for m in DEFERRED_MODULES if m in slowest['modules']),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Profile worker cold start (import app + first request).')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+    result = profile(args.runs)
+    print(f"⏱️  Cold start over {result['runs']} runs (median)")
+    print(f"  import app        {result['import_ms']:>8} ms   (budget {STARTUP_BUDGET_MS:.0f} ms)")
+    print(f"  app.py itself     {result['app_module_ms']:>8} ms")
+    print(f"  first request     {result['first_request_ms']:>8} ms")
+    print("  Slowest direct imports:")
+    for ms, name in result['imports'][:args.top]:
+        print(f"    {ms:>8.1f} ms  {name}")
+    if result['loaded_deferred']:
+        print(f"  ⚠️  loaded at import: {', '.join(result['loaded_deferred'])}")
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Guard worker cold start:
+  - importing the app does not load the deferred heavy modules (qrcode, PIL, smtplib)
+  - the median `import app` time stays under STARTUP_BUDGET_MS (default 1500)
+  - QR rendering still works once its imports are deferred
+
+Each sample is a fresh interpreter: python test_cold_start.py
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from qr_render import QRRenderer
+from startup_profile import STARTUP_BUDGET_MS, profile
+
+RUNS = int(os.getenv('STARTUP_RUNS', '3'))
+
+_result = None
+
+
+def _profile():
+    global _result
+    if _result is None:
+        _result = profile(RUNS)
+    return _result
+
+
+def test_deferred_modules_not_imported():
+    loaded = _profile()['loaded_deferred']
+    assert not loaded, f"importing app loaded {loaded}; import them where they are used"
+
+
+def test_import_within_budget():
+    result = _profile()
+    slowest = ', '.join(f"{name} {ms:.0f} ms" for ms, name in result['imports'][:5])
+    assert result['import_ms'] <= STARTUP_BUDGET_MS, \
+        f"import app took {result['import_ms']} ms (budget {STARTUP_BUDGET_MS:.0f} ms); slowest: {slowest}"
+
+
+def test_qr_render_after_deferred_import():
+    body, content_type = QRRenderer(fmt='png', cache_size=0, workers=0).render('https://example.com/r/test')
+    assert content_type == 'image/png' and body.startswith(b'\x89PNG'), content_type
+
+
+if __name__ == "__main__":
+    for test in (test_deferred_modules_not_imported, test_import_within_budget,
+                 test_qr_render_after_deferred_import):
+        test()
+        print(f"✅ {test.__name__}")
+    print(f"   import app {_result['import_ms']} ms (median of {RUNS}), "
+          f"app.py itself {_result['app_module_ms']} ms, first request {_result['first_request_ms']} ms")
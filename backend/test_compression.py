@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Verify the response compression / Cache-Control middleware:
+  - large JSON is gzipped when the client accepts it, with Vary and a weak ETag
+  - small bodies, clients without gzip and non-text types are left alone
+  - event streams and excluded endpoints are never touched
+  - registered Cache-Control policies are applied unless the view set its own
+
+Runs on a throwaway Flask app: python test_compression.py
+"""
+import gzip
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, Response, jsonify
+
+import compression
+from compression import exclude_endpoint, init_response_middleware, register_cache_policy
+
+ROWS = [{'id': i, 'email': f'patient{i}@example.com', 'status': 'signed_up'} for i in range(200)]
+
+
+def _app():
+    app = Flask(__name__)
+    init_response_middleware(app, min_size=1024, level=6)
+
+    @app.route('/big')
+    def big():
+        response = jsonify(ROWS)
+        response.set_etag('rows-1')
+        return response
+
+    @app.route('/small')
+    def small():
+        return jsonify({'ok': True})
+
+    @app.route('/png')
+    def png():
+        return Response(b'\x89PNG' + b'\0' * 4096, mimetype='image/png')
+
+    @app.route('/stream')
+    def stream():
+        return Response(iter(['data: x\n\n'] * 200), mimetype='text/event-stream')
+
+    @app.route('/raw')
+    def raw():
+        return jsonify(ROWS)
+
+    @app.route('/own-cache')
+    def own_cache():
+        response = jsonify({'ok': True})
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    return app
+
+
+def test_compresses_large_json():
+    resp = _app().test_client().get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip', resp.headers
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    assert resp.headers['ETag'] == 'W/"rows-1"'
+    assert json.loads(gzip.decompress(resp.get_data())) == ROWS
+
+
+def test_leaves_other_responses_alone():
+    client = _app().test_client()
+    gzip_ok = {'Accept-Encoding': 'gzip'}
+    for path, headers in (('/small', gzip_ok), ('/big', {}), ('/png', gzip_ok), ('/stream', gzip_ok)):
+        resp = client.get(path, headers=headers)
+        assert 'Content-Encoding' not in resp.headers, (path, resp.headers)
+    assert 'Accept-Encoding' in client.get('/big').headers['Vary']
+
+
+def test_excluded_endpoint_and_cache_policies():
+    app = _app()
+    exclude_endpoint('raw')
+    register_cache_policy('big', 'private, max-age=30')
+    register_cache_policy('own_cache', 'private, max-age=30')
+    try:
+        client = app.test_client()
+        assert 'Content-Encoding' not in client.get('/raw', headers={'Accept-Encoding': 'gzip'}).headers
+        assert client.get('/big').headers['Cache-Control'] == 'private, max-age=30'
+        assert client.get('/own-cache').headers['Cache-Control'] == 'no-store'
+    finally:
+        compression.EXCLUDED_ENDPOINTS.discard('raw')
+        compression.CACHE_POLICIES.pop('big', None)
+        compression.CACHE_POLICIES.pop('own_cache', None)
+
+
+if __name__ == "__main__":
+    for test in (test_compresses_large_json, test_leaves_other_responses_alone,
+                 test_excluded_endpoint_and_cache_policies):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Verify the sqlite:// rate-limit storage:
+  - incr / get / get_expiry count hits in a fixed window and start a new
+    window once it expires (elastic expiry pushes the window out)
+  - storages opened by different workers on one file share their counters,
+    including concurrent increments from several processes
+  - Flask-Limiter on two apps (two "workers") enforces one combined limit
+
+Runs against throwaway SQLite files: python test_limiter_storage.py
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+
+from limiter_storage import SQLiteStorage
+
+_tmpdir = tempfile.mkdtemp(prefix='limiter-storage-')
+
+
+def _uri(name):
+    return 'sqlite:///' + os.path.join(_tmpdir, name)
+
+
+def test_counts_within_window_and_expires():
+    storage = SQLiteStorage(_uri('window.sqlite3'))
+    assert storage.get('k') == 0
+    before = time.time()
+    assert [storage.incr('k', 1) for _ in range(3)] == [1, 2, 3]
+    assert storage.incr('k', 1, amount=2) == 5 and storage.get('k') == 5
+    assert before + 1 <= storage.get_expiry('k') <= time.time() + 1
+    time.sleep(1.1)
+    assert storage.get('k') == 0
+    assert storage.incr('k', 1) == 1  # a fresh window
+    storage.clear('k')
+    assert storage.get('k') == 0
+
+
+def test_elastic_expiry_extends_window():
+    storage = SQLiteStorage(_uri('elastic.sqlite3'))
+    storage.incr('k', 1)
+    first = storage.get_expiry('k')
+    time.sleep(0.2)
+    storage.incr('k', 1, elastic_expiry=True)
+    assert storage.get_expiry('k') > first and storage.get('k') == 2
+
+
+def _hammer(uri, key, hits):
+    storage = SQLiteStorage(uri)
+    for _ in range(hits):
+        storage.incr(key, 60)
+
+
+def test_instances_share_one_file():
+    uri = _uri('shared.sqlite3')
+    first, second = SQLiteStorage(uri), SQLiteStorage(uri)
+    first.incr('k', 60)
+    second.incr('k', 60)
+    assert first.get('k') == second.get('k') == 2
+    assert first.get_expiry('k') == second.get_expiry('k')
+    ctx = multiprocessing.get_context('spawn')
+    workers = [ctx.Process(target=_hammer, args=(uri, 'k', 50)) for _ in range(4)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join(60)
+    assert first.get('k') == 202, first.get('k')
+    second.reset()
+    assert first.get('k') == 0
+
+
+def _limited_app(uri):
+    app = Flask(__name__)
+    limiter = Limiter(get_remote_address, app=app, storage_uri=uri, default_limits=None)
+
+    @app.route('/otp')
+    @limiter.limit('5 per minute')
+    def otp():
+        return 'ok'
+
+    return app
+
+
+def test_limit_is_shared_across_workers():
+    uri = _uri('limiter.sqlite3')
+    clients = [_limited_app(uri).test_client(), _limited_app(uri).test_client()]
+    statuses = [clients[i % 2].get('/otp').status_code for i in range(7)]
+    assert statuses == [200] * 5 + [429] * 2, statuses
+
+
+if __name__ == "__main__":
+    for test in (test_counts_within_window_and_expires, test_elastic_expiry_extends_window,
+                 test_instances_share_one_file, test_limit_is_shared_across_workers):
+        test()
+        print(f"✅ {test.__name__}")
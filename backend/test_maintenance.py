@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Verify scheduled token pruning:
+  - expired or used OTP tokens and long-expired unopened onboarding tokens are
+    deleted; live codes, opened onboarding tokens and recently expired ones stay
+  - deletes run in batches of MAINTENANCE_BATCH_SIZE, and stop at max_batches
+  - the scheduler records each run, stays off with MAINTENANCE_INTERVAL=0 and
+    its thread stops when asked
+
+Runs on a throwaway SQLite database: python test_maintenance.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from sqlalchemy import event
+
+from maintenance import MaintenanceScheduler, prune_tokens
+from models import db, OTPToken, OnboardingToken, User
+
+_tmpdir = tempfile.mkdtemp(prefix='maintenance-')
+
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(_tmpdir, 'test.db')
+db.init_app(app)
+
+
+def setup_module(module=None):
+    with app.app_context():
+        db.create_all(bind_key=None)
+
+
+def _seed():
+    """Replace all tokens with a known mix; returns the ids/jtis that must survive."""
+    now = datetime.utcnow()
+    with app.app_context():
+        OTPToken.query.delete()
+        OnboardingToken.query.delete()
+        user = User.query.first()
+        if user is None:
+            user = User(email='patient@example.com')
+            db.session.add(user)
+            db.session.flush()
+        otps = []
+        for expires_at, used in [(now - timedelta(minutes=1), False)] * 7 + [(now + timedelta(days=1), True)] * 3 \
+                + [(now + timedelta(days=1), False)] * 4:
+            token = OTPToken('patient@example.com')
+            token.expires_at, token.used = expires_at, used
+            otps.append(token)
+        onboarding = []
+        for age_days, opened in [(40, False)] * 5 + [(40, True)] * 2 + [(1, False)] * 2 + [(-1, False)]:
+            token = OnboardingToken(user.id)
+            token.expires_at = now - timedelta(days=age_days)
+            token.used_at = now - timedelta(days=age_days + 1) if opened else None
+            onboarding.append(token)
+        db.session.add_all(otps + onboarding)
+        db.session.commit()
+        return ({t.id for t in otps if not t.used and t.expires_at > now},
+                {t.jti for t in onboarding if t.used_at or t.expires_at > now - timedelta(days=30)})
+
+
+def _prune(**kwargs):
+    deletes = []
+    listener = lambda conn, cursor, statement, *args: deletes.append(1) if statement.startswith('DELETE') else None
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            result = prune_tokens(onboarding_retention_days=30, **kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        remaining = ({t.id for t in OTPToken.query.all()}, {t.jti for t in OnboardingToken.query.all()})
+    return result, len(deletes), remaining
+
+
+def test_prunes_only_stale_tokens_in_batches():
+    keep = _seed()
+    result, deletes, remaining = _prune(batch_size=3, max_batches=20)
+    assert (result['otp_tokens'], result['onboarding_tokens']) == (10, 5), result
+    assert remaining == keep, (remaining, keep)
+    # OTP: 3 + 3 + 3 + 1; onboarding: 3 + 2
+    assert deletes == 6, deletes
+
+
+def test_max_batches_bounds_one_run():
+    keep = _seed()
+    result, deletes, remaining = _prune(batch_size=2, max_batches=2)
+    assert (result['otp_tokens'], result['onboarding_tokens']) == (4, 4) and deletes == 4, (result, deletes)
+    # The next run picks up the rest
+    result, _, remaining = _prune(batch_size=2, max_batches=20)
+    assert (result['otp_tokens'], result['onboarding_tokens']) == (6, 1), result
+    assert remaining == keep
+
+
+def test_scheduler_runs_and_stops():
+    _seed()
+    scheduler = MaintenanceScheduler(app, interval=0, batch_size=100)
+    scheduler.start()
+    assert scheduler._thread is None  # MAINTENANCE_INTERVAL=0 disables it
+    result = scheduler.run_once()
+    assert result['otp_tokens'] == 10 and list(scheduler.runs) == [result], result
+    scheduler = MaintenanceScheduler(app, interval=900)
+    scheduler.start()
+    assert scheduler._thread.is_alive()
+    scheduler.stop()
+    scheduler._thread.join(5)
+    assert not scheduler._thread.is_alive()
+
+
+if __name__ == "__main__":
+    setup_module()
+    for test in (test_prunes_only_stale_tokens_in_batches, test_max_batches_bounds_one_run,
+                 test_scheduler_runs_and_stops):
+        test()
+        print(f"✅ {test.__name__}")
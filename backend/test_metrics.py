@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Verify the cross-worker metrics registry and /metrics access rules:
+  - counters and histograms from several processes are summed
+  - a worker that exits is folded into the "retired" bucket, so totals stay monotonic
+  - gauges only count live workers
+  - output is valid Prometheus text (HELP/TYPE, escaped labels, ordered buckets)
+  - loopback is trusted outside production only; the token is accepted everywhere
+  - otherwise /metrics needs an admin session that has set its password
+
+Runs against a throwaway metrics file: python test_metrics.py
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+
+import metrics
+from metrics import MetricsRegistry, metrics_access_allowed
+
+_tmpdir = tempfile.mkdtemp(prefix='metrics-')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(_tmpdir, 'app.db'))
+os.environ.setdefault('RATELIMIT_STORAGE_URI', 'memory://')
+os.environ.setdefault('MAINTENANCE_INTERVAL', '0')
+
+
+def _registry(name):
+    r = MetricsRegistry(os.path.join(_tmpdir, name), flush_interval=60)
+    r.counter('jobs_total', 'Jobs by outcome.')
+    r.histogram('job_seconds', 'Job latency.')
+    r.gauge('queue_depth', 'Queued jobs.', lambda: [((), 3)])
+    return r
+
+
+def _worker(path, jobs):
+    r = MetricsRegistry(path, flush_interval=60)
+    for _ in range(jobs):
+        r.inc('jobs_total', (('outcome', 'ok'),))
+    r.observe('job_seconds', 0.2, buckets=(0.1, 1.0))
+    r.gauge('queue_depth', 'Queued jobs.', lambda: [((), 3)])
+    r.flush()
+
+
+def _samples(text):
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if line and not line.startswith('#'))
+
+
+def test_aggregates_across_workers_and_retires_dead_ones():
+    r = _registry('aggregate.sqlite3')
+    r.inc('jobs_total', (('outcome', 'ok'),), 2)
+    r.observe('job_seconds', 0.05, buckets=(0.1, 1.0))
+    ctx = multiprocessing.get_context('spawn')
+    worker = ctx.Process(target=_worker, args=(r.path, 5))
+    worker.start()
+    worker.join()
+    samples = _samples(r.collect())
+    # The exited worker's counters survive in the retired bucket
+    assert samples['jobs_total{outcome="ok"}'] == '7', samples
+    assert samples['job_seconds_count'] == '2', samples
+    assert samples['job_seconds_bucket{le="0.1"}'] == '1', samples
+    assert samples['job_seconds_bucket{le="1"}'] == '2', samples
+    assert samples['job_seconds_bucket{le="+Inf"}'] == '2', samples
+    # ...but its gauge does not
+    assert samples['queue_depth'] == '3', samples
+    # Collecting again does not double-count the retired worker
+    assert _samples(r.collect())['jobs_total{outcome="ok"}'] == '7'
+
+
+def test_renders_prometheus_text():
+    r = _registry('render.sqlite3')
+    r.inc('jobs_total', (('outcome', 'say "hi"\n'),))
+    for value in (0.2, 3.0):
+        r.observe('job_seconds', value, (('route', '/x'),), buckets=(0.5, 2.5))
+    text = r.collect()
+    lines = text.splitlines()
+    assert '# TYPE jobs_total counter' in lines and '# HELP jobs_total Jobs by outcome.' in lines
+    assert '# TYPE job_seconds histogram' in lines and '# TYPE queue_depth gauge' in lines
+    assert 'jobs_total{outcome="say \\"hi\\"\\n"} 1' in lines, text
+    buckets = [l for l in lines if l.startswith('job_seconds_bucket')]
+    assert buckets == ['job_seconds_bucket{route="/x",le="0.5"} 1',
+                       'job_seconds_bucket{route="/x",le="2.5"} 1',
+                       'job_seconds_bucket{route="/x",le="+Inf"} 2'], buckets
+    assert 'job_seconds_sum{route="/x"} 3.2' in lines, text
+    assert text.endswith('\n')
+
+
+def _allowed(remote_addr, headers=None):
+    app = Flask(__name__)
+    with app.test_request_context('/metrics', headers=headers or {}, environ_base={'REMOTE_ADDR': remote_addr}):
+        return metrics_access_allowed()
+
+
+def _with_env(**env):
+    saved = {k: os.environ.get(k) for k in env}
+    os.environ.update({k: v for k, v in env.items() if v is not None})
+    for k, v in env.items():
+        if v is None:
+            os.environ.pop(k, None)
+    metrics._networks = None
+    return saved
+
+
+def test_access_rules():
+    saved = _with_env(FLASK_ENV='development', METRICS_ALLOWED_NETWORKS=None, METRICS_TOKEN='s3cret')
+    try:
+        assert _allowed('127.0.0.1')
+        assert not _allowed('203.0.113.7')
+        _with_env(FLASK_ENV='production')
+        # Behind a same-host proxy every client is 127.0.0.1: not trusted by default
+        assert not _allowed('127.0.0.1')
+        assert _allowed('127.0.0.1', {'Authorization': 'Bearer s3cret'})
+        assert not _allowed('127.0.0.1', {'Authorization': 'Bearer wrong'})
+        _with_env(METRICS_ALLOWED_NETWORKS='10.0.0.0/8')
+        assert _allowed('10.1.2.3') and not _allowed('127.0.0.1')
+    finally:
+        _with_env(**saved)
+
+
+def test_endpoint_admin_must_have_set_password():
+    from app import app  # only this test needs the full app
+    saved = _with_env(METRICS_ALLOWED_NETWORKS='', METRICS_TOKEN=None)
+    try:
+        client = app.test_client()
+        remote = {'REMOTE_ADDR': '203.0.113.7'}
+        assert client.get('/metrics', environ_base=remote).status_code == 403
+        with client.session_transaction() as s:
+            s['user_id'] = 4242
+            s['principal'] = {'id': 4242, 'email': 'new-admin@example.com', 'is_admin': True,
+                              'referral_code': 'ADMIN042', 'ts': time.time()}
+            s['must_set_password'] = True
+        resp = client.get('/metrics', environ_base=remote)
+        assert resp.status_code == 403 and resp.get_json()['must_set_password'], resp.get_json()
+        with client.session_transaction() as s:
+            s['must_set_password'] = False
+        resp = client.get('/metrics', environ_base=remote)
+        assert resp.status_code == 200 and resp.mimetype == 'text/plain', resp.status_code
+    finally:
+        _with_env(**saved)
+
+
+if __name__ == "__main__":
+    for test in (test_aggregates_across_workers_and_retires_dead_ones, test_renders_prometheus_text,
+                 test_access_rules, test_endpoint_admin_must_have_set_password):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Verify OTP store semantics for the sql and sqlite backends:
+  - a code can be consumed once; wrong, expired and reused codes are rejected
+  - concurrent consumes of the same code have exactly one winner
+  - sql: a rolled-back consume leaves the code usable
+  - sqlite: restore() puts a consumed code back, and /auth/password-reset/confirm
+    restores it when the password change fails after the consume
+
+The redis backend needs a server and is not covered here.
+
+Runs against throwaway SQLite databases: python test_otp_store.py
+"""
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+_tmpdir = tempfile.mkdtemp(prefix='otp-store-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmpdir, 'test.db')
+os.environ.setdefault('RATELIMIT_STORAGE_URI', 'memory://')
+os.environ['MAINTENANCE_INTERVAL'] = '0'
+
+import app as app_module
+from app import app
+from migrate import create_migration_engine, migrate
+from models import db, User
+from otp_store import SQLiteKVOTPStore, SQLOTPStore
+from password_hashing import HashingBusy
+
+HEADERS = {'Origin': 'http://localhost:3000'}
+
+
+def setup_module(module=None):
+    # The URL the app was configured with (another test module may have imported it first)
+    migrate(create_migration_engine(app.config['SQLALCHEMY_DATABASE_URI']))
+
+
+def _kv_store(name, ttl_seconds=600):
+    return SQLiteKVOTPStore(os.path.join(_tmpdir, name), ttl_seconds=ttl_seconds)
+
+
+def _race(consume, workers=8):
+    barrier = threading.Barrier(workers)
+    results = []
+
+    def run():
+        barrier.wait()
+        results.append(consume())
+
+    threads = [threading.Thread(target=run) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_sqlite_consume_is_single_use():
+    store = _kv_store('single-use.sqlite3')
+    code = store.issue('a@example.com')
+    assert not store.consume('b@example.com', code)
+    assert store.consume('a@example.com', code)
+    assert not store.consume('a@example.com', code)
+    expired = _kv_store('expired.sqlite3', ttl_seconds=0)
+    assert not expired.consume('a@example.com', expired.issue('a@example.com'))
+
+
+def test_sqlite_concurrent_consume_single_winner():
+    store = _kv_store('race.sqlite3')
+    code = store.issue('race@example.com')
+    # A store per thread, as each gunicorn worker would have
+    results = _race(lambda: _kv_store('race.sqlite3').consume('race@example.com', code))
+    assert results.count(True) == 1, results
+
+
+def test_sqlite_restore():
+    store = _kv_store('restore.sqlite3')
+    code = store.issue('a@example.com')
+    assert store.consume('a@example.com', code)
+    store.restore('a@example.com', code)
+    assert store.consume('a@example.com', code)
+    assert not store.consume('a@example.com', code)
+
+
+def test_sql_consume_is_single_use():
+    store = SQLOTPStore(ttl_seconds=600)
+    with app.app_context():
+        code = store.issue('sql@example.com')
+        assert not store.consume('other@example.com', code)
+        assert store.consume('sql@example.com', code)
+        db.session.rollback()
+        # The rollback un-marked it
+        assert store.consume('sql@example.com', code)
+        db.session.commit()
+        assert not store.consume('sql@example.com', code)
+        db.session.rollback()
+        expired = SQLOTPStore(ttl_seconds=0)
+        assert not expired.consume('sql@example.com', expired.issue('sql@example.com'))
+
+
+def test_sql_concurrent_consume_single_winner():
+    store = SQLOTPStore(ttl_seconds=600)
+    with app.app_context():
+        code = store.issue('sql-race@example.com')
+
+    def consume():
+        with app.app_context():
+            try:
+                won = store.consume('sql-race@example.com', code)
+                db.session.commit()
+                return won
+            except Exception:
+                db.session.rollback()
+                return False
+
+    results = _race(consume, workers=4)
+    assert results.count(True) == 1, results
+
+
+def test_password_reset_restores_code_on_failure():
+    email = 'reset@example.com'
+    with app.app_context():
+        if not User.query.filter_by(email=email).first():
+            user = User(email=email)
+            db.session.add(user)
+            db.session.commit()
+    store = _kv_store('reset.sqlite3')
+    code = store.issue(email)
+    body = {'email': email, 'token': code, 'password': 'new-password-1', 'confirm': 'new-password-1'}
+    original_store = app_module.otp_store
+
+    def busy(password):
+        raise HashingBusy('no free hashing slot')
+
+    app_module.otp_store = store
+    try:
+        app_module.password_hasher.generate = busy
+        resp = app.test_client().post('/auth/password-reset/confirm', json=body, headers=HEADERS)
+        assert resp.status_code == 503, resp.get_json()
+        del app_module.password_hasher.generate
+        resp = app.test_client().post('/auth/password-reset/confirm', json=body, headers=HEADERS)
+        assert resp.status_code == 200, resp.get_json()
+        resp = app.test_client().post('/auth/password-reset/confirm', json=body, headers=HEADERS)
+        assert resp.status_code == 400, resp.get_json()
+    finally:
+        app_module.otp_store = original_store
+        vars(app_module.password_hasher).pop('generate', None)
+
+
+if __name__ == "__main__":
+    setup_module()
+    for test in (test_sqlite_consume_is_single_use, test_sqlite_concurrent_consume_single_winner,
+                 test_sqlite_restore, test_sql_consume_is_single_use, test_sql_concurrent_consume_single_winner,
+                 test_password_reset_restores_code_on_failure):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Verify password hashing backpressure:
+  - the default HASH_MAX_PENDING follows the worker setup, so with the stock
+    two sync workers a second concurrent hash is refused
+  - once every host slot is held (by another worker process), hashing raises
+    HashingBusy instead of queueing, and works again when a slot frees up
+  - /auth/login answers 503 with Retry-After while the hashing slots are full
+
+Runs against a throwaway SQLite database: python test_password_hashing.py
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+_tmpdir = tempfile.mkdtemp(prefix='password-hashing-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmpdir, 'test.db')
+os.environ.setdefault('RATELIMIT_STORAGE_URI', 'memory://')
+os.environ['MAINTENANCE_INTERVAL'] = '0'
+
+from werkzeug.security import generate_password_hash
+
+import app as app_module
+from app import app
+from migrate import create_migration_engine, migrate
+from models import db, User
+from password_hashing import HashingBusy, HostSlots, PasswordHasher, create_hasher
+
+HEADERS = {'Origin': 'http://localhost:3000'}
+
+
+def setup_module(module=None):
+    # The URL the app was configured with (another test module may have imported it first)
+    migrate(create_migration_engine(app.config['SQLALCHEMY_DATABASE_URI']))
+
+
+def _create_hasher(**env):
+    keys = ('WORKER_MODE', 'WEB_CONCURRENCY', 'HASH_WORKERS', 'HASH_MAX_PENDING')
+    saved = {k: os.environ.pop(k, None) for k in keys}
+    os.environ.update(env)
+    try:
+        return create_hasher()
+    finally:
+        for k in keys:
+            os.environ.pop(k, None)
+            if saved[k] is not None:
+                os.environ[k] = saved[k]
+
+
+def test_default_cap_follows_workers():
+    assert _create_hasher().max_pending == 1  # two sync workers: one stays free
+    assert _create_hasher(WEB_CONCURRENCY='4').max_pending == 3
+    assert _create_hasher(WORKER_MODE='gevent').max_pending == 4  # 2 pool processes, one queued each
+    assert _create_hasher(HASH_MAX_PENDING='7').max_pending == 7
+
+
+def _hold_slots(directory, size, held, release):
+    slots = HostSlots(directory, size)
+    taken = [slots.acquire() for _ in range(size)]
+    held.set()
+    release.wait(30)
+    for slot in taken:
+        slots.release(slot)
+
+
+def test_busy_when_other_worker_holds_every_slot():
+    directory = os.path.join(_tmpdir, 'slots')
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', max_pending=2, slot_dir=directory)
+    ctx = multiprocessing.get_context('spawn')
+    held, release = ctx.Event(), ctx.Event()
+    worker = ctx.Process(target=_hold_slots, args=(directory, 2, held, release))
+    worker.start()
+    try:
+        assert held.wait(30), 'slot holder did not start'
+        try:
+            hasher.generate('secret-password')
+        except HashingBusy:
+            pass
+        else:
+            raise AssertionError('expected HashingBusy while every slot is held')
+    finally:
+        release.set()
+        worker.join(10)
+    assert hasher.check(hasher.generate('secret-password'), 'secret-password')
+
+
+def test_login_returns_503_when_hashing_is_saturated():
+    email = 'busy-login@example.com'
+    with app.app_context():
+        if not User.query.filter_by(email=email).first():
+            user = User(email=email)
+            user.password_hash = generate_password_hash('secret-password', method='pbkdf2:sha256:1000')
+            db.session.add(user)
+            db.session.commit()
+    hasher = app_module.password_hasher
+    # A separate HostSlots opens its own lock files, like another worker would
+    blocker = HostSlots(hasher._slots.directory, hasher.max_pending)
+    taken = [blocker.acquire() for _ in range(hasher.max_pending)]
+    body = {'email': email, 'password': 'secret-password'}
+    try:
+        assert None not in taken, 'slots already held by something else on this host'
+        resp = app.test_client().post('/auth/login', json=body, headers=HEADERS)
+        assert resp.status_code == 503 and resp.headers['Retry-After'] == '1', resp.get_json()
+    finally:
+        for slot in taken:
+            if slot is not None:
+                blocker.release(slot)
+    resp = app.test_client().post('/auth/login', json=body, headers=HEADERS)
+    assert resp.status_code == 200, resp.get_json()
+
+
+if __name__ == "__main__":
+    setup_module()
+    for test in (test_default_cap_follows_workers, test_busy_when_other_worker_holds_every_slot,
+                 test_login_returns_503_when_hashing_is_saturated):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Verify principal caching and invalidation:
+  - cached principals expire after the TTL and are evicted least recently used first
+  - a session snapshot is trusted only within the TTL and only if it is newer
+    than the last local change to that user
+  - updating or deleting a User invalidates its principal, so the next request
+    sees the change instead of a stale is_admin
+  - a cached principal resolves without a query
+
+Runs on a throwaway SQLite database: python test_principal.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, g, session
+from sqlalchemy import event
+
+from models import db, User
+from principal import Principal, PrincipalCache, get_current_principal, principal_cache, remember_principal
+
+_tmpdir = tempfile.mkdtemp(prefix='principal-')
+
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(_tmpdir, 'test.db')
+app.config['SECRET_KEY'] = 'test'
+db.init_app(app)
+
+
+def setup_module(module=None):
+    with app.app_context():
+        db.create_all(bind_key=None)
+
+
+def _principal(pid, email='p@example.com'):
+    return Principal(pid, email, False, 'CODE0001')
+
+
+def test_cache_ttl_and_lru():
+    cache = PrincipalCache(ttl=60, maxsize=2)
+    for pid in (1, 2):
+        cache.put(_principal(pid))
+    assert cache.get(1).id == 1  # 1 is now the most recently used
+    cache.put(_principal(3))
+    assert cache.get(2) is None and cache.get(1) is not None and cache.get(3) is not None
+    expired = PrincipalCache(ttl=0)
+    expired.put(_principal(1))
+    assert expired.get(1) is None
+
+
+def test_snapshot_freshness():
+    cache = PrincipalCache(ttl=60)
+    snap = _principal(5).snapshot()
+    assert cache.snapshot_is_fresh(snap)
+    assert not cache.snapshot_is_fresh(dict(snap, ts=time.time() - 61))
+    time.sleep(0.01)
+    cache.invalidate(5)
+    assert not cache.snapshot_is_fresh(snap)
+    time.sleep(0.01)
+    assert cache.snapshot_is_fresh(_principal(5).snapshot())
+
+
+def _resolve(user_id, snapshot=None):
+    """(principal, SQL statements run) for one request with user_id in the session."""
+    statements = []
+    listener = lambda *args: statements.append(1)
+    with app.test_request_context('/'):
+        session['user_id'] = user_id
+        if snapshot is not None:
+            session['principal'] = snapshot
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            principal = get_current_principal()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+    return principal, len(statements)
+
+
+def test_user_changes_invalidate_principal():
+    principal_cache.clear()
+    with app.app_context():
+        user = User(email='staff@example.com')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        with app.test_request_context('/'):
+            snapshot = remember_principal(user).snapshot()
+            g.pop('_principal')
+
+    principal, statements = _resolve(user_id, snapshot)
+    assert principal.email == 'staff@example.com' and not principal.is_admin and statements == 0
+
+    with app.app_context():
+        db.session.get(User, user_id).is_admin = True
+        db.session.commit()
+    # The cookie snapshot predates the change: reload once, then served from cache
+    principal, statements = _resolve(user_id, snapshot)
+    assert principal.is_admin and statements == 1, (principal, statements)
+    principal, statements = _resolve(user_id, snapshot)
+    assert principal.is_admin and statements == 0, (principal, statements)
+
+    with app.app_context():
+        db.session.delete(db.session.get(User, user_id))
+        db.session.commit()
+    assert _resolve(user_id, snapshot)[0] is None
+
+
+if __name__ == "__main__":
+    setup_module()
+    for test in (test_cache_ttl_and_lru, test_snapshot_freshness, test_user_changes_invalidate_principal):
+        test()
+        print(f"✅ {test.__name__}")
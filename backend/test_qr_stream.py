@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Verify the QR display endpoints:
+  - /qr/stream: a reconnect with Last-Event-ID replays the newer QREvents,
+    drops live copies of them, and still delivers a live event whose id is
+    lower than the last replayed one (committed late by another worker)
+  - /qr/events: since_id returns only newer events; an up-to-date since_id or
+    If-None-Match is answered from memory (304 for the ETag) without a query
+  - /qr/events?wait= returns as soon as a new event is published, and reports
+    the wait it was allowed (0 under sync workers)
+
+Runs against a throwaway SQLite database: python test_qr_stream.py
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+_tmpdir = tempfile.mkdtemp(prefix='qr-stream-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmpdir, 'test.db')
+os.environ.setdefault('RATELIMIT_STORAGE_URI', 'memory://')
+os.environ['MAINTENANCE_INTERVAL'] = '0'
+
+from sqlalchemy import event
+
+import app as app_module
+from app import app
+from migrate import create_migration_engine, migrate
+from models import db, QREvent
+
+
+def setup_module(module=None):
+    # The URL the app was configured with (another test module may have imported it first)
+    migrate(create_migration_engine(app.config['SQLALCHEMY_DATABASE_URI']))
+
+
+def _add_events(*ids):
+    with app.app_context():
+        for event_id in ids:
+            if db.session.get(QREvent, event_id) is None:
+                db.session.add(QREvent(id=event_id, kind='login'))
+        db.session.commit()
+        return [db.session.get(QREvent, event_id).to_dict() for event_id in ids]
+
+
+def _next_event_ids(chunks, count, timeout=5.0):
+    ids = []
+    deadline = time.monotonic() + timeout
+    while len(ids) < count and time.monotonic() < deadline:
+        chunk = next(chunks)
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if chunk.startswith('id: '):
+            ids.append(json.loads(chunk.split('data: ', 1)[1])['id'])
+    return ids
+
+
+def test_replay_dedupes_by_replayed_ids():
+    late, first, second, newest = _add_events(103, 105, 106, 107)
+    resp = app.test_client().get('/qr/stream', headers={'Last-Event-ID': '104'}, buffered=False)
+    chunks = iter(resp.response)
+    try:
+        assert next(chunks).startswith(b'retry:')  # subscribed from here on
+        assert _next_event_ids(chunks, 2) == [105, 106]
+        # 106 is a live copy of a replayed event; 103 committed after 106 on another worker
+        for message in (second, late, newest):
+            app_module.sse_broadcast(message)
+        assert sorted(_next_event_ids(chunks, 2)) == [103, 107]
+    finally:
+        resp.close()
+
+
+def _queries(fn):
+    """(fn(), number of SQL statements it ran)."""
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda *args: statements.append(1)
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        return fn(), len(statements)
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+
+
+def test_events_since_id_and_etag():
+    _add_events(201, 202)
+    client = app.test_client()
+    data = client.get('/qr/events?since_id=201').get_json()
+    assert [e['id'] for e in data['events']] == [202] and data['latest_id'] == 202, data
+    resp, statements = _queries(lambda: client.get('/qr/events?since_id=202'))
+    assert resp.get_json()['events'] == [] and statements == 0, (resp.get_json(), statements)
+    assert resp.headers['ETag'] == 'W/"qr-202"'
+    resp, statements = _queries(lambda: client.get('/qr/events', headers={'If-None-Match': 'W/"qr-202"'}))
+    assert resp.status_code == 304 and statements == 0, (resp.status_code, statements)
+    # A stale ETag gets the full response
+    assert client.get('/qr/events', headers={'If-None-Match': 'W/"qr-201"'}).status_code == 200
+
+
+def test_events_wait_capped_by_worker_mode():
+    expected = 0.0 if app_module.SOCKETIO_ASYNC_MODE == 'threading' else min(5.0, app_module.QR_EVENTS_MAX_WAIT)
+    data = app.test_client().get('/qr/events?since_id=0&wait=5').get_json()
+    assert data['wait'] == expected and data['max_wait'] == app_module.QR_EVENTS_MAX_WAIT, data
+
+
+def test_events_long_poll_wakes_on_publish():
+    latest = _add_events(301)[0]['id']
+    original = app_module.QR_EVENTS_MAX_WAIT
+    app_module.QR_EVENTS_MAX_WAIT = 10.0
+    try:
+        threading.Timer(0.2, lambda: app_module.sse_broadcast(_add_events(302)[0])).start()
+        started = time.monotonic()
+        data = app.test_client().get(f'/qr/events?since_id={latest}&wait=10').get_json()
+        elapsed = time.monotonic() - started
+    finally:
+        app_module.QR_EVENTS_MAX_WAIT = original
+    assert [e['id'] for e in data['events']] == [302] and data['wait'] == 10.0, data
+    assert elapsed < 5.0, elapsed
+
+
+if __name__ == "__main__":
+    setup_module()
+    for test in (test_replay_dedupes_by_replayed_ids, test_events_since_id_and_etag,
+                 test_events_wait_capped_by_worker_mode, test_events_long_poll_wakes_on_publish):
+        test()
+        print(f"✅ {test.__name__}")
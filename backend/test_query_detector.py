@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Verify the N+1 query detector:
+  - statements differing only in literals normalize to one shape
+  - a request repeating one shape past the threshold logs a report in warn
+    mode and raises NPlusOneDetected in raise mode
+  - a request at or under the threshold is left alone
+
+Runs against an in-memory SQLite engine: python test_query_detector.py
+"""
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+from query_detector import NPlusOneDetected, init_query_detector, normalize_sql
+
+THRESHOLD = 3
+
+engine = create_engine('sqlite://')
+with engine.begin() as conn:
+    conn.execute(text('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)'))
+    conn.execute(text("INSERT INTO items (name) VALUES ('a'), ('b'), ('c'), ('d'), ('e')"))
+
+
+def _app(mode):
+    app = Flask(__name__)
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+    assert init_query_detector(app, mode=mode, threshold=THRESHOLD) == mode
+
+    @app.route('/items/<int:n>')
+    def items(n):
+        with engine.connect() as conn:
+            # One lookup per id: the N+1 pattern
+            names = [conn.execute(text(f'SELECT name FROM items WHERE id = {i}')).scalar() for i in range(1, n + 1)]
+        return {'names': names}
+
+    return app
+
+
+class _Capture(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def _get(app, path):
+    handler = _Capture()
+    detector_log = logging.getLogger('query_detector')
+    detector_log.addHandler(handler)
+    try:
+        resp = app.test_client().get(path)
+    finally:
+        detector_log.removeHandler(handler)
+    return resp, handler.messages
+
+
+def test_normalize_groups_literals():
+    assert normalize_sql("SELECT * FROM t WHERE id = 7 AND name = 'x'") == \
+        normalize_sql("SELECT  *  FROM t WHERE id = 12 AND name = 'it''s'")
+    assert normalize_sql('SELECT * FROM t WHERE id IN (?, ?, ?)') == normalize_sql('SELECT * FROM t WHERE id IN (?)')
+
+
+def test_warn_mode_logs_repeated_shape():
+    resp, messages = _get(_app('warn'), f'/items/{THRESHOLD + 1}')
+    assert resp.status_code == 200, resp.status_code
+    assert len(messages) == 1, messages
+    report = messages[0]
+    assert report.startswith('[N+1] GET /items/<int:n>'), report
+    assert f'{THRESHOLD + 1}x SELECT name FROM items WHERE id = ?' in report, report
+    assert 'test_query_detector.py' in report, report  # call site of the loop
+
+
+def test_raise_mode_raises():
+    try:
+        _get(_app('raise'), f'/items/{THRESHOLD + 1}')
+    except NPlusOneDetected as exc:
+        assert 'SELECT name FROM items WHERE id = ?' in str(exc), exc
+    else:
+        raise AssertionError('expected NPlusOneDetected')
+
+
+def test_under_threshold_left_alone():
+    for mode in ('warn', 'raise'):
+        resp, messages = _get(_app(mode), f'/items/{THRESHOLD}')
+        assert resp.status_code == 200 and resp.get_json()['names'] == ['a', 'b', 'c'], resp.get_json()
+        assert messages == [], messages
+
+
+if __name__ == "__main__":
+    for test in (test_normalize_groups_literals, test_warn_mode_logs_repeated_shape, test_raise_mode_raises,
+                 test_under_threshold_left_alone):
+        test()
+        print(f"✅ {test.__name__}")
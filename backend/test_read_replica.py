@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Verify read-replica routing with two SQLite files (primary + "replica"):
+  - read-only admin GETs are served from the replica
+  - writes made while a request is routed to the replica go to the primary
+  - an admin mutation makes that session read from the primary (stickiness)
+  - replica lag above REPLICA_MAX_LAG_SECONDS falls back to the primary
+
+The replica bind is configured when app.py is imported, so every check runs
+in a fresh interpreter with DATABASE_REPLICA_URL set (under pytest too), not
+in whatever process happened to import the app first.
+
+Runs against throwaway SQLite databases: python test_read_replica.py [check ...]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BACKEND_DIR)
+
+HEADERS = {'Origin': 'http://localhost:3000', 'X-Requested-With': 'XMLHttpRequest'}
+
+app = db = replica_router = None
+
+
+def _in_subprocess(check):
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), check], cwd=BACKEND_DIR,
+                          env=dict(os.environ, LOG_LEVEL='WARNING'), capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, f"{check} failed:\n{proc.stdout[-2000:]}\n{proc.stderr[-4000:]}"
+
+
+def test_reads_use_replica():
+    _in_subprocess('reads_use_replica')
+
+
+def test_writes_stay_on_primary():
+    _in_subprocess('writes_stay_on_primary')
+
+
+def test_mutation_makes_session_sticky():
+    _in_subprocess('mutation_makes_session_sticky')
+
+
+def test_lag_falls_back_to_primary():
+    _in_subprocess('lag_falls_back_to_primary')
+
+
+# ---------- checks (run in the child interpreter) ----------
+
+def _setup():
+    global app, db, replica_router
+    from sqlalchemy import insert
+
+    from app import app, db, replica_router
+    from migrate import create_migration_engine, migrate
+    from models import User
+
+    assert replica_router is not None, 'DATABASE_REPLICA_URL was not set when the app was imported'
+    migrate(create_migration_engine(app.config['SQLALCHEMY_DATABASE_URI']))
+    with app.app_context():
+        replica = db.engines['replica']
+        db.metadata.create_all(replica)
+        for engine, patient in ((db.engine, 'only-on-primary@example.com'),
+                                (replica, 'only-on-replica@example.com')):
+            with engine.begin() as conn:
+                conn.execute(insert(User.__table__), [
+                    {'id': 1, 'email': 'admin@example.com', 'referral_code': 'ADMIN001', 'is_admin': True},
+                    {'id': 2, 'email': patient, 'referral_code': 'PATIENT1', 'is_admin': False},
+                ])
+
+
+def _admin_client():
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['user_id'] = 1
+    return client
+
+
+def _listed_emails(client):
+    resp = client.get('/admin/users', headers=HEADERS)
+    assert resp.status_code == 200, resp.get_json()
+    return resp.headers.get('X-DB-Route'), {u['email'] for u in resp.get_json()['users']}
+
+
+def check_reads_use_replica():
+    route, emails = _listed_emails(_admin_client())
+    assert route == 'replica', route
+    assert 'only-on-replica@example.com' in emails, emails
+
+
+def check_writes_stay_on_primary():
+    from flask import g
+    from sqlalchemy import insert
+
+    from models import User
+
+    with app.test_request_context('/admin/users'):
+        g._db_use_replica = True
+        assert db.session.get_bind(mapper=User) is db.engines['replica']
+        assert db.session.get_bind(clause=insert(User.__table__)) is db.engine
+
+
+def check_mutation_makes_session_sticky():
+    client = _admin_client()
+    resp = client.post('/admin/clear_qr', headers=HEADERS)
+    assert resp.status_code == 200, resp.get_json()
+    route, emails = _listed_emails(client)
+    assert route == 'primary', route
+    assert 'only-on-primary@example.com' in emails, emails
+
+
+def check_lag_falls_back_to_primary():
+    import read_replica
+
+    original = read_replica._probe_lag
+    read_replica._probe_lag = lambda connection: replica_router.max_lag + 1
+    try:
+        route, emails = _listed_emails(_admin_client())
+    finally:
+        read_replica._probe_lag = original
+    assert route == 'primary', route
+    assert 'only-on-primary@example.com' in emails, emails
+    assert _listed_emails(_admin_client())[0] == 'replica'
+
+
+CHECKS = ('reads_use_replica', 'writes_stay_on_primary', 'mutation_makes_session_sticky',
+          'lag_falls_back_to_primary')
+
+
+if __name__ == "__main__":
+    _tmpdir = tempfile.mkdtemp(prefix='read-replica-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmpdir, 'primary.db')
+    os.environ['DATABASE_REPLICA_URL'] = 'sqlite:///' + os.path.join(_tmpdir, 'replica.db')
+    os.environ['REPLICA_LAG_CHECK_SECONDS'] = '0'
+    os.environ.setdefault('RATELIMIT_STORAGE_URI', 'memory://')
+    os.environ['MAINTENANCE_INTERVAL'] = '0'
+    _setup()
+    for name in sys.argv[1:] or CHECKS:
+        globals()[f'check_{name}']()
+        print(f"✅ {name}")
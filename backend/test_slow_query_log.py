@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Verify the slow query log:
+  - slow SELECT and WITH (CTE) statements get an EXPLAIN plan; writes do not
+  - bound parameters (OTP codes, tokens) are left out of records unless
+    capture_params / SLOW_QUERY_PARAMS=1 opts in
+
+Runs against an in-memory SQLite engine: python test_slow_query_log.py
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, event, text
+
+from slow_query_log import SlowQueryLog
+
+
+def _run(log, *statements):
+    """Execute statements on a fresh engine observed only by log; returns its records."""
+    engine = create_engine('sqlite://')
+    # Listen on this engine only (install() would watch every engine in the process)
+    event.listen(engine, 'before_cursor_execute', log._before)
+    event.listen(engine, 'after_cursor_execute', log._after)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE otp (email TEXT, token TEXT)'))
+        for statement, params in statements:
+            conn.execute(text(statement), params)
+    return log.snapshot()['records'][::-1]
+
+
+def test_explains_select_and_cte_only():
+    log = SlowQueryLog(threshold_ms=0)
+    records = _run(
+        log,
+        ("INSERT INTO otp VALUES ('a@example.com', '123456')", {}),
+        ('SELECT token FROM otp WHERE email = :email', {'email': 'a@example.com'}),
+        ('WITH recent AS (SELECT * FROM otp) SELECT count(*) FROM recent', {}),
+        ('  with x AS (SELECT 1) SELECT * FROM x', {}),
+    )
+    plans = {r['statement'].split(None, 1)[0].upper(): r['plan'] for r in records}
+    assert plans['INSERT'] is None and plans['CREATE'] is None, plans
+    assert plans['SELECT'] and plans['WITH'], plans
+    assert records[-1]['plan'], records[-1]
+
+
+def test_parameters_need_opt_in():
+    select = ('SELECT * FROM otp WHERE email = :email AND token = :token', {'email': 'a@example.com', 'token': '654321'})
+    record = _run(SlowQueryLog(threshold_ms=0), select)[-1]
+    assert record['parameters'] is None and '654321' not in repr(record), record
+    record = _run(SlowQueryLog(threshold_ms=0, capture_params=True), select)[-1]
+    assert '654321' in record['parameters'], record
+
+
+if __name__ == "__main__":
+    for test in (test_explains_select_and_cte_only, test_parameters_need_opt_in):
+        test()
+        print(f"✅ {test.__name__}")
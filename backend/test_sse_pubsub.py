@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Verify the SSE pub/sub backends:
+  - local: publish reaches every subscriber, records the newest event id and
+    wakes wait_for_event; unsubscribed queues get nothing
+  - unix: a publish in one process reaches a subscriber in another; sockets
+    left behind by dead workers are removed
+  - subscriber queues drop their oldest message when full
+  - create_sse_bus picks unix for SQLite, and for PgBouncer without SSE_PUBSUB_DSN
+
+The postgres backend needs a server and is not covered here.
+
+Runs without a database: python test_sse_pubsub.py
+"""
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import threading
+from queue import Empty
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sse_pubsub import DropOldestQueue, SSEBus, UnixSocketBus, create_sse_bus
+
+_tmpdir = tempfile.mkdtemp(prefix='sse-pubsub-')
+
+
+def test_local_round_trip():
+    bus = SSEBus()
+    first, second, gone = bus.subscribe(), bus.subscribe(), bus.subscribe()
+    bus.unsubscribe(gone)
+    bus.publish({'id': 7, 'kind': 'login'})
+    assert first.get_nowait() == {'id': 7, 'kind': 'login'}
+    assert second.get_nowait() == {'id': 7, 'kind': 'login'}
+    assert gone.empty()
+    assert bus.current_event_id() == 7
+    assert bus.published == 1 and bus.delivered == 1
+
+
+def test_wait_for_event_wakes_on_publish():
+    bus = SSEBus()
+    assert bus.wait_for_event(0, timeout=0.01) is None
+    threading.Timer(0.05, bus.publish, args=({'id': 3, 'kind': 'review'},)).start()
+    assert bus.wait_for_event(0, timeout=5.0) == 3
+    # Nothing newer than 3: returns after the timeout with the same id
+    assert bus.wait_for_event(3, timeout=0.01) == 3
+
+
+def test_full_queue_drops_oldest():
+    q = DropOldestQueue(2)
+    for i in range(4):
+        q.put_nowait(i)
+    assert [q.get_nowait(), q.get_nowait()] == [2, 3]
+    assert q.dropped == 2
+
+
+def _subscriber(directory, ready, received):
+    bus = UnixSocketBus(directory)
+    q = bus.subscribe()
+    ready.set()
+    try:
+        received.put(q.get(timeout=10))
+    except Empty:
+        received.put(None)
+
+
+def test_unix_round_trip_across_processes():
+    directory = os.path.join(_tmpdir, 'cross-process')
+    ctx = multiprocessing.get_context('spawn')
+    ready, received = ctx.Event(), ctx.Queue()
+    child = ctx.Process(target=_subscriber, args=(directory, ready, received))
+    child.start()
+    try:
+        assert ready.wait(30), 'subscriber did not start'
+        publisher = UnixSocketBus(directory)
+        local = publisher.subscribe()
+        publisher.publish({'id': 11, 'kind': 'login'})
+        assert received.get(timeout=10) == {'id': 11, 'kind': 'login'}
+        # The publishing worker's own subscribers get it through its socket too
+        assert local.get(timeout=5) == {'id': 11, 'kind': 'login'}
+    finally:
+        child.join(10)
+
+
+def test_unix_removes_dead_sockets():
+    directory = os.path.join(_tmpdir, 'stale')
+    bus = UnixSocketBus(directory)
+    stale = os.path.join(directory, 'sse-999999.sock')
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(stale)
+    sock.close()  # the file stays behind, as after a killed worker
+    bus.publish({'id': 1, 'kind': 'login'})
+    assert not os.path.exists(stale)
+
+
+def test_create_sse_bus_selection():
+    saved = {k: os.environ.pop(k, None) for k in ('SSE_PUBSUB', 'SSE_PUBSUB_DSN', 'SSE_PUBSUB_DIR')}
+    os.environ['SSE_PUBSUB_DIR'] = os.path.join(_tmpdir, 'selection')
+    try:
+        assert create_sse_bus('sqlite:///x.db', db_profile='sqlite').name == 'unix'
+        # LISTEN needs a session PgBouncer's transaction pooling does not keep
+        assert create_sse_bus('postgresql://u@pgbouncer/db', db_profile='pgbouncer').name == 'unix'
+        os.environ['SSE_PUBSUB'] = 'local'
+        assert create_sse_bus('postgresql://u@db/db', db_profile='postgres').name == 'local'
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+if __name__ == "__main__":
+    for test in (test_local_round_trip, test_wait_for_event_wakes_on_publish, test_full_queue_drops_oldest,
+                 test_unix_round_trip_across_processes, test_unix_removes_dead_sockets,
+                 test_create_sse_bus_selection):
+        test()
+        print(f"✅ {test.__name__}")
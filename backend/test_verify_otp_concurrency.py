@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Verify /auth/verify-otp runs as one unit of work:
+  - a successful login issues exactly one COMMIT
+  - two simultaneous verifications of the same code cannot both succeed
+
+Runs against a throwaway SQLite database: python test_verify_otp_concurrency.py
+"""
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+_tmpdir = tempfile.mkdtemp(prefix='verify-otp-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmpdir, 'test.db')
+os.environ.setdefault('RATELIMIT_STORAGE_URI', 'memory://')
+os.environ['MAINTENANCE_INTERVAL'] = '0'
+os.environ['OTP_STORE'] = 'sql'
+
+from sqlalchemy import event
+
+from app import app, db, otp_store
+from migrate import create_migration_engine, migrate
+
+HEADERS = {'Origin': 'http://localhost:3000'}
+
+
+def setup_module(module=None):
+    # The URL the app was configured with (another test module may have changed the env since)
+    migrate(create_migration_engine(app.config['SQLALCHEMY_DATABASE_URI']))
+
+
+def _issue(email):
+    with app.app_context():
+        return otp_store.issue(email)
+
+
+def test_single_commit_per_login():
+    email = 'single-commit@example.com'
+    code = _issue(email)
+    commits = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn: commits.append(1)
+    event.listen(engine, 'commit', listener)
+    try:
+        resp = app.test_client().post('/auth/verify-otp', json={'email': email, 'token': code}, headers=HEADERS)
+    finally:
+        event.remove(engine, 'commit', listener)
+    assert resp.status_code == 200, resp.get_json()
+    assert len(commits) == 1, f"expected 1 commit, got {len(commits)}"
+
+
+def test_concurrent_verification_single_winner():
+    email = 'race@example.com'
+    code = _issue(email)
+    barrier = threading.Barrier(2)
+    statuses = []
+
+    def attempt():
+        client = app.test_client()
+        barrier.wait()
+        resp = client.post('/auth/verify-otp', json={'email': email, 'token': code}, headers=HEADERS)
+        statuses.append(resp.status_code)
+
+    threads = [threading.Thread(target=attempt) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+
+    assert statuses.count(200) == 1, f"expected exactly one success, got {statuses}"
+
+
+if __name__ == "__main__":
+    setup_module()
+    for test in (test_single_commit_per_login, test_concurrent_verification_single_winner):
+        test()
+        print(f"✅ {test.__name__}")
@@ -356,24 +356,36 @@ const DemoPage = () => {
     setUnlocked(true);
   };
 
-  // SSE / polling for events (unchanged)
+  // SSE for events; the browser reconnects on its own and the server replays
+  // anything after Last-Event-ID. Poll only if the stream gives up.
   useEffect(() => {
     if (!unlocked) return;
     let es;
     let fallbackTimer = null;
 
     const startPolling = () => {
-      let since = new Date().toISOString();
+      // Long-poll when the server allows it (max_wait > 0, async workers): it
+      // holds the request until an event newer than lastId arrives. Otherwise
+      // poll every 1.5s; an idle since_id poll is answered without a query.
+      let lastId = null;
+      let maxWait = 0;
       const poll = async () => {
+        let delay = 1500;
         try {
-          const res = await fetch(`${API_URL}/qr/events?since=${encodeURIComponent(since)}`);
+          const qs = lastId === null || !maxWait ? `since_id=${lastId ?? 0}` : `since_id=${lastId}&wait=${maxWait}`;
+          const res = await fetch(`${API_URL}/qr/events?${qs}`, { cache: 'no-store' });
           const data = await res.json();
-          if (data && Array.isArray(data.events) && data.events.length > 0) {
+          if (!res.ok) throw new Error(data && data.error);
+          if (lastId !== null && Array.isArray(data.events) && data.events.length > 0) {
             await ding();
           }
-          if (data && data.now) since = data.now;
-        } catch {}
-        fallbackTimer = setTimeout(poll, 1500);
+          if (typeof data.latest_id === 'number') lastId = data.latest_id;
+          if (typeof data.max_wait === 'number') maxWait = data.max_wait;
+          if (maxWait > 0) delay = 0;
+        } catch {
+          delay = 1500;
+        }
+        fallbackTimer = setTimeout(poll, delay);
       };
       poll();
     };
@@ -385,8 +397,7 @@ const DemoPage = () => {
         await ding();
       };
       es.onerror = () => {
-        try { es.close(); } catch {}
-        if (!fallbackTimer) startPolling();
+        if (es.readyState === EventSource.CLOSED && !fallbackTimer) startPolling();
       };
     } catch (e) {
       startPolling();
@@ -109,7 +109,8 @@ export default function ReferralProgram() {
       if (qr_url) {
         setIsFading(true);
         setTimeout(() => {
-          setQrUrl(qr_url);
+          // Server sends a path to the image endpoint (older servers sent a data URI)
+          setQrUrl(qr_url.startsWith('/') ? `${API_URL}${qr_url}` : qr_url);
           setExpiresAt(expires_at || null);
           if (typeof first_name === 'string' && first_name.trim()) {
             const m = first_name.trim().match(/[A-Za-z][A-Za-z\-']*/);